@@ -0,0 +1,109 @@
+"""导入耗时基准：在全新解释器中分别导入核心模块，检查耗时预算与重型依赖是否被提前导入。
+
+    python benchmarks/import_time.py            # 超出预算或提前导入重型依赖时退出码为 1
+    python benchmarks/import_time.py --runs 9 --scale 2.0
+"""
+
+import argparse
+
+import json
+
+import os
+
+import statistics
+
+import subprocess
+
+import sys
+
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+HEAVY_MODULES = ["streamlit", "pandas", "numpy", "plotly", "openpyxl", "pyarrow", "requests", "urllib3"]
+
+# 模块 -> (耗时预算毫秒, 导入后不允许出现在 sys.modules 中的模块)
+
+TARGETS = {
+
+    "lld.core": (40.0, HEAVY_MODULES),
+
+    "lld.sse": (40.0, HEAVY_MODULES),
+
+    "lld.pipeline": (100.0, HEAVY_MODULES),
+
+    "lld.cli": (150.0, HEAVY_MODULES),
+
+}
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+print(json.dumps({{"ms": elapsed * 1000, "loaded": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+def measure(module: str, runs: int):
+
+    """在 runs 个全新解释器中导入 module，返回 (耗时中位数毫秒, 被导入的重型模块)"""
+
+    samples, loaded = [], set()
+
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [str(ROOT), os.getenv("PYTHONPATH")])))
+
+    for _ in range(runs):
+
+        output = subprocess.run(
+
+            [sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY_MODULES)],
+
+            cwd=ROOT, env=env, capture_output=True, text=True, check=True
+
+        ).stdout
+
+        result = json.loads(output.strip().splitlines()[-1])
+
+        samples.append(result["ms"])
+
+        loaded.update(result["loaded"])
+
+    return statistics.median(samples), sorted(loaded)
+
+def main(argv=None) -> int:
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+
+    parser.add_argument("--runs", type=int, default=5, help="每个模块测量的次数（取中位数）")
+
+    parser.add_argument("--scale", type=float, default=1.0, help="预算倍数，较慢的 CI 机器可调大")
+
+    parser.add_argument("modules", nargs="*", help="只测量指定模块")
+
+    args = parser.parse_args(argv)
+
+    failures = 0
+
+    for module, (budget_ms, forbidden) in TARGETS.items():
+
+        if args.modules and module not in args.modules:
+
+            continue
+
+        median_ms, loaded = measure(module, args.runs)
+
+        budget = budget_ms * args.scale
+
+        unexpected = [m for m in loaded if m in forbidden]
+
+        ok = median_ms <= budget and not unexpected
+
+        failures += not ok
+
+        print(f"{'ok  ' if ok else 'FAIL'} {module:<14} {median_ms:7.1f} ms（预算 {budget:.0f} ms）" + (f" 提前导入: {', '.join(unexpected)}" if unexpected else ""))
+
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+
+    sys.exit(main())
@@ -0,0 +1,468 @@
+"""本地模拟 LLM 服务器：OpenAI 兼容（/v1/chat/completions）与 DashScope（/api/v1/services/aigc/...）两种 SSE 流式接口，
+按提示词中的词语生成格式正确的判定（单词 / 合并判定、完整 / 精简模式），不消耗任何 API 配额。
+
+    python benchmarks/mock_llm.py --port 8765 --latency 0.5 --tokens-per-second 80
+    python benchmarks/mock_llm.py --port 8765 --error-rate 0.02 --rate-limit-rate 0.05 --truncate-rate 0.01
+
+启动后按提示设置 LLD_BASE_URL_<PROVIDER>，页面与 python -m lld 即改为请求本服务器；GET /stats 返回请求统计。
+首字节延迟、输出速度（1 token 按 2 个字符计）、5xx / 429 注入与截断流（不发送结束分片即断开连接）均可配置。
+"""
+
+import argparse
+
+import json
+
+import math
+
+import random
+
+import re
+
+import sys
+
+import threading
+
+import time
+
+from collections import Counter
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from lld.core import MODEL_CONFIGS, get_rule_set, rule_code
+
+CHARS_PER_TOKEN = 2
+
+WORD_PATTERN = re.compile(r"「(.+?)」")
+
+# ===============================
+# 模拟判定输出
+# ===============================
+
+def mock_verdict(word: str, codes: bool) -> dict:
+
+    """按词语确定性地生成一份判定（同一词语每次相同）；codes 为 True 时以规则编号为键"""
+
+    rng = random.Random(word)
+
+    rule_set = get_rule_set()
+
+    scores = {pos: {} for pos in rule_set.pos_names}
+
+    for (pos, rule), name in zip(rule_set.rules, rule_set.names):
+
+        scores[pos][rule_code(name) if codes else name] = rng.random() < 0.5
+
+    return {"predicted_pos": rng.choice(rule_set.pos_names), "scores": scores}
+
+def mock_response_text(messages) -> tuple:
+
+    """按提示词判断请求类型并生成输出文本，返回 (文本, 词语数)"""
+
+    user = messages[-1]["content"] if messages else ""
+
+    words = WORD_PATTERN.findall(user)
+
+    lean = "只输出 JSON" in user
+
+    if "个词语：" in user:
+
+        items = [dict({"word": word}, **mock_verdict(word, codes=True)) for word in words]
+
+        if lean:
+
+            return json.dumps({"results": items}, ensure_ascii=False), len(words)
+
+        for item in items:
+
+            item["explanation"] = f"「{item['word']}」主要依据可受数量词修饰与做主宾语的表现判定为{item['predicted_pos']}。"
+
+        return json.dumps(items, ensure_ascii=False), len(words)
+
+    word = words[0] if words else ""
+
+    verdict = mock_verdict(word, codes=lean)
+
+    if lean:
+
+        return json.dumps(verdict, ensure_ascii=False), 1
+
+    # 完整模式：先输出逐条规则的推理，再给出 JSON，长度与真实响应相当
+
+    reasoning = "".join(
+
+        f"「{pos}-{name}：{'符合' if value else '不符合'}。理由：……。例句：……。」\n"
+
+        for pos, rules in verdict["scores"].items() for name, value in rules.items()
+
+    )
+
+    return reasoning + json.dumps(dict({"explanation": reasoning}, **verdict), ensure_ascii=False, indent=2), 1
+
+# ===============================
+# HTTP 服务器
+# ===============================
+
+class MockLLMServer(ThreadingHTTPServer):
+
+    """模拟服务器：故障注入概率与速度参数可在运行中修改，统计信息见 stats_snapshot()"""
+
+    daemon_threads = True
+
+    def __init__(self, address=("127.0.0.1", 0), latency: float = 0.2, jitter: float = 0.5, tokens_per_second: float = 200.0, tokens_per_chunk: int = 2,
+
+                 error_rate: float = 0.0, rate_limit_rate: float = 0.0, truncate_rate: float = 0.0, retry_after: float = 1.0, seed: int = None):
+
+        super().__init__(address, MockLLMHandler)
+
+        self.latency = latency
+
+        self.jitter = jitter
+
+        self.tokens_per_second = tokens_per_second
+
+        self.tokens_per_chunk = tokens_per_chunk
+
+        self.error_rate = error_rate
+
+        self.rate_limit_rate = rate_limit_rate
+
+        self.truncate_rate = truncate_rate
+
+        self.retry_after = retry_after
+
+        self.rng = random.Random(seed)
+
+        self.stats = Counter()
+
+        self.stats_lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+
+        host, port = self.server_address[:2]
+
+        return f"http://{host}:{port}"
+
+    def base_urls(self) -> dict:
+
+        """各提供商指向本服务器的 base_url（DashScope 原生接口与 OpenAI 兼容接口路径不同）"""
+
+        return {
+
+            provider: f"{self.url}/api/v1" if cfg.get("stream_format") == "dashscope" else f"{self.url}/v1"
+
+            for provider, cfg in MODEL_CONFIGS.items()
+
+        }
+
+    def provider_env(self) -> dict:
+
+        """让 lld 请求本服务器的环境变量（LLD_BASE_URL_<PROVIDER>）"""
+
+        return {f"LLD_BASE_URL_{provider.upper()}": url for provider, url in self.base_urls().items()}
+
+    def handle_error(self, request, client_address):
+
+        # 客户端进程退出时断开空闲的长连接属于正常情况，不打印堆栈
+
+        if isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+
+            return
+
+        super().handle_error(request, client_address)
+
+    def count(self, **amounts):
+
+        with self.stats_lock:
+
+            self.stats.update(amounts)
+
+    def stats_snapshot(self) -> dict:
+
+        with self.stats_lock:
+
+            return dict(self.stats)
+
+    def draw(self):
+
+        """本次请求的故障类型（None / "error" / "rate_limited" / "truncated"）与首字节延迟"""
+
+        with self.stats_lock:
+
+            roll = self.rng.random()
+
+            delay = max(0.0, self.latency * (1 + self.jitter * (2 * self.rng.random() - 1)))
+
+        for fault, rate in (("error", self.error_rate), ("rate_limited", self.rate_limit_rate), ("truncated", self.truncate_rate)):
+
+            if roll < rate:
+
+                return fault, delay
+
+            roll -= rate
+
+        return None, delay
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"  # 长连接，流式响应使用分块传输编码
+
+    def log_message(self, format, *args):
+
+        pass
+
+    def do_HEAD(self):
+
+        # 连接预热
+
+        self.send_response(200)
+
+        self.send_header("Content-Length", "0")
+
+        self.end_headers()
+
+    def do_GET(self):
+
+        if self.path.split("?")[0] != "/stats":
+
+            self.send_error(404)
+
+            return
+
+        self._send_json(200, self.server.stats_snapshot())
+
+    def do_POST(self):
+
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+
+        dashscope = "/services/aigc/" in self.path
+
+        messages = (body.get("input") or {}).get("messages", []) if dashscope else body.get("messages", [])
+
+        server = self.server
+
+        fault, delay = server.draw()
+
+        server.count(requests=1)
+
+        time.sleep(delay)
+
+        if fault == "error":
+
+            server.count(errors=1)
+
+            self._send_json(500, {"error": {"message": "mock server error", "type": "server_error"}})
+
+            return
+
+        if fault == "rate_limited":
+
+            server.count(rate_limited=1)
+
+            self._send_json(429, {"error": {"message": "mock rate limit", "type": "rate_limit_exceeded"}}, {"Retry-After": f"{server.retry_after:g}"})
+
+            return
+
+        text, words = mock_response_text(messages)
+
+        prompt_tokens = math.ceil(sum(len(m.get("content", "")) for m in messages) / CHARS_PER_TOKEN)
+
+        include_usage = (body.get("stream_options") or {}).get("include_usage", False)  # DashScope 每个分片都带累计用量
+
+        self.send_response(200)
+
+        self.send_header("Content-Type", "text/event-stream")
+
+        self.send_header("Transfer-Encoding", "chunked")
+
+        self.end_headers()
+
+        step = CHARS_PER_TOKEN * server.tokens_per_chunk
+
+        pieces = [text[i:i + step] for i in range(0, len(text), step)]
+
+        if fault == "truncated":
+
+            pieces = pieces[:len(pieces) // 2]
+
+        started = time.monotonic()
+
+        sent_tokens = 0
+
+        try:
+
+            for index, piece in enumerate(pieces):
+
+                sent_tokens += math.ceil(len(piece) / CHARS_PER_TOKEN)
+
+                if dashscope:
+
+                    finish = "stop" if index == len(pieces) - 1 and fault is None else "null"
+
+                    chunk = {"output": {"choices": [{"message": {"role": "assistant", "content": piece}, "finish_reason": finish}]}, "usage": {"input_tokens": prompt_tokens, "output_tokens": sent_tokens}}
+
+                else:
+
+                    chunk = {"id": "chatcmpl-mock", "object": "chat.completion.chunk", "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+
+                self._write_chunk(b"data: " + json.dumps(chunk, ensure_ascii=False).encode("utf-8") + b"\n\n")
+
+                # 按输出速度排期，只在超前时休眠（避免逐分片休眠的计时误差累积）
+
+                if server.tokens_per_second > 0:
+
+                    ahead = started + sent_tokens / server.tokens_per_second - time.monotonic()
+
+                    if ahead > 0.002:
+
+                        time.sleep(ahead)
+
+            if fault == "truncated":
+
+                # 不发送结束分片直接断开：客户端读到不完整的分块传输
+
+                server.count(truncated=1)
+
+                self.close_connection = True
+
+                return
+
+            if not dashscope:
+
+                if include_usage:
+
+                    usage = {"prompt_tokens": prompt_tokens, "completion_tokens": sent_tokens, "total_tokens": prompt_tokens + sent_tokens}
+
+                    self._write_chunk(b"data: " + json.dumps({"id": "chatcmpl-mock", "choices": [], "usage": usage}).encode("utf-8") + b"\n\n")
+
+                self._write_chunk(b"data: [DONE]\n\n")
+
+            self._write_chunk(b"")
+
+            server.count(completed=1, words=words, completion_tokens=sent_tokens)
+
+        except (BrokenPipeError, ConnectionResetError):
+
+            # 客户端在判定完整后提前关闭连接
+
+            server.count(client_closed=1, words=words, completion_tokens=sent_tokens)
+
+            self.close_connection = True
+
+    def _write_chunk(self, data: bytes):
+
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+
+        self.wfile.flush()
+
+    def _send_json(self, status: int, payload: dict, headers: dict = None):
+
+        data = json.dumps(payload).encode("utf-8")
+
+        self.send_response(status)
+
+        self.send_header("Content-Type", "application/json")
+
+        self.send_header("Content-Length", str(len(data)))
+
+        for name, value in (headers or {}).items():
+
+            self.send_header(name, value)
+
+        self.end_headers()
+
+        self.wfile.write(data)
+
+def start_mock_server(host: str = "127.0.0.1", port: int = 0, **options) -> MockLLMServer:
+
+    """在后台线程中启动模拟服务器（port 为 0 时随机分配），options 见 MockLLMServer"""
+
+    server = MockLLMServer((host, port), **options)
+
+    threading.Thread(target=server.serve_forever, name="mock-llm", daemon=True).start()
+
+    return server
+
+def add_server_arguments(parser: argparse.ArgumentParser):
+
+    """模拟服务器的命令行参数（本脚本与 throughput.py 共用）"""
+
+    parser.add_argument("--latency", type=float, default=0.2, help="首字节延迟（秒），默认 0.2")
+
+    parser.add_argument("--jitter", type=float, default=0.5, help="首字节延迟的相对抖动（0.5 即 ±50%%）")
+
+    parser.add_argument("--tokens-per-second", type=float, default=200.0, help="每个流的输出速度，0 表示不限速")
+
+    parser.add_argument("--tokens-per-chunk", type=int, default=2, help="每个 SSE 分片的 token 数")
+
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 500 的请求比例")
+
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="返回 429（带 Retry-After）的请求比例")
+
+    parser.add_argument("--truncate-rate", type=float, default=0.0, help="输出一半后断开连接的请求比例")
+
+    parser.add_argument("--retry-after", type=float, default=1.0, help="429 响应的 Retry-After 秒数")
+
+    parser.add_argument("--seed", type=int, help="故障注入与延迟抖动的随机种子")
+
+def server_options(args) -> dict:
+
+    return {
+
+        "latency": args.latency,
+
+        "jitter": args.jitter,
+
+        "tokens_per_second": args.tokens_per_second,
+
+        "tokens_per_chunk": args.tokens_per_chunk,
+
+        "error_rate": args.error_rate,
+
+        "rate_limit_rate": args.rate_limit_rate,
+
+        "truncate_rate": args.truncate_rate,
+
+        "retry_after": args.retry_after,
+
+        "seed": args.seed,
+
+    }
+
+def main(argv=None) -> int:
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+
+    parser.add_argument("--host", default="127.0.0.1")
+
+    parser.add_argument("--port", type=int, default=8765)
+
+    add_server_arguments(parser)
+
+    args = parser.parse_args(argv)
+
+    server = MockLLMServer((args.host, args.port), **server_options(args))
+
+    print(f"模拟 LLM 服务器已启动: {server.url}（Ctrl+C 退出，GET /stats 查看统计）")
+
+    for name, value in server.provider_env().items():
+
+        print(f"export {name}={value}")
+
+    try:
+
+        server.serve_forever()
+
+    except KeyboardInterrupt:
+
+        print(json.dumps(server.stats_snapshot(), ensure_ascii=False))
+
+    return 0
+
+if __name__ == "__main__":
+
+    sys.exit(main())
@@ -0,0 +1,91 @@
+"""重新计分基准：生成一份合成历史记录，测量 rescore 在两种存储后端上的耗时。
+
+    python benchmarks/rescore.py                  # 默认 100000 条记录
+    python benchmarks/rescore.py --rows 500000 --backend csv
+
+第一次 rescore 从原始响应中补齐规则判定（旧历史文件的一次性迁移），第二次只读取规则判定列，即调整分值后的常规耗时。
+"""
+
+import argparse
+
+import csv
+
+import json
+
+import os
+
+import random
+
+import sys
+
+import tempfile
+
+import time
+
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from lld import pipeline
+
+from lld.core import RULE_SETS
+
+LEGACY_COLUMNS = pipeline.HISTORY_COLUMNS[:-1]
+
+def write_legacy_history(path: Path, rows: int):
+
+    """旧格式（没有规则判定列）的历史 CSV，原始响应为完整模式的判定 JSON"""
+
+    rng = random.Random(0)
+
+    with open(path, "w", encoding="utf-8-sig", newline="") as f:
+
+        writer = csv.writer(f, lineterminator="\n")
+
+        writer.writerow(LEGACY_COLUMNS)
+
+        for i in range(rows):
+
+            scores = {pos: {rule["name"]: rng.random() < 0.5 for rule in rules} for pos, rules in RULE_SETS.items()}
+
+            raw = json.dumps({"predicted_pos": "名词", "scores": scores}, ensure_ascii=False)
+
+            writer.writerow([i + 1, f"词{i}", 0.0, 0.0, 0.0, 0.0, "名词", raw, "2025-01-01 00:00:00"])
+
+def main(argv=None) -> int:
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+
+    parser.add_argument("--rows", type=int, default=100000, help="记录数")
+
+    parser.add_argument("--backend", choices=["csv", "sqlite", "all"], default="all")
+
+    args = parser.parse_args(argv)
+
+    backends = ["csv", "sqlite"] if args.backend == "all" else [args.backend]
+
+    with tempfile.TemporaryDirectory() as tmp:
+
+        for backend in backends:
+
+            path = Path(tmp) / f"history_{backend}.csv"
+
+            write_legacy_history(path, args.rows)
+
+            store = pipeline.HistoryStore(path) if backend == "csv" else pipeline.SqliteHistoryStore(path)
+
+            print(f"{backend}: {args.rows} 条记录（{os.path.getsize(path) / 1e6:.0f} MB CSV）")
+
+            for label in ("首次（从原始响应补齐判定）", "再次（只读规则判定列）"):
+
+                started = time.perf_counter()
+
+                stats = store.rescore()
+
+                print(f"  {label:<18} {time.perf_counter() - started:6.2f} 秒  {stats}")
+
+    return 0
+
+if __name__ == "__main__":
+
+    sys.exit(main())
@@ -0,0 +1,121 @@
+"""计分微基准：比较逐键正则匹配 + 字典求和（改造前）与编译后的 RuleSet（逐词纯 Python / 整批矩阵运算）。
+
+    python benchmarks/scoring.py              # 默认 10000 个词语
+    python benchmarks/scoring.py --words 100000
+
+各方式算出的隶属度必须一致。
+"""
+
+import argparse
+
+import random
+
+import re
+
+import sys
+
+import time
+
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from lld.core import RULE_SETS, calculate_membership, get_rule_set, map_to_allowed_score
+
+def legacy_normalize_key(k, pos_rules):
+
+    """改造前的规则名匹配：对每条规则重新执行正则"""
+
+    k_norm = re.sub(r'[\s_]+', '', k).upper()
+
+    for r in pos_rules:
+
+        if re.sub(r'[\s_]+', '', r["name"]).upper() == k_norm:
+
+            return r["name"]
+
+    return None
+
+def legacy_membership(raw_scores):
+
+    """改造前的计分：逐键匹配规则名、线性查找规则定义、字典求和"""
+
+    scores_out = {pos: {} for pos in RULE_SETS}
+
+    for pos, rules in RULE_SETS.items():
+
+        for k, v in raw_scores.get(pos, {}).items():
+
+            name = legacy_normalize_key(k, rules)
+
+            if name:
+
+                rule_def = next(r for r in rules if r["name"] == name)
+
+                scores_out[pos][name] = map_to_allowed_score(rule_def, v)
+
+        for rule in rules:
+
+            scores_out[pos].setdefault(rule["name"], 0)
+
+    return calculate_membership(scores_out)
+
+def sample_verdicts(count: int):
+
+    rng = random.Random(0)
+
+    return [{pos: {rule["name"]: rng.random() < 0.5 for rule in rules} for pos, rules in RULE_SETS.items()} for _ in range(count)]
+
+def timed(func):
+
+    started = time.perf_counter()
+
+    result = func()
+
+    return result, time.perf_counter() - started
+
+def main(argv=None) -> int:
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+
+    parser.add_argument("--words", type=int, default=10000, help="词语数")
+
+    args = parser.parse_args(argv)
+
+    rule_set = get_rule_set()
+
+    verdicts = sample_verdicts(args.words)
+
+    rule_set.weight_matrix()  # numpy 导入与权重构建不计入
+
+    legacy, legacy_s = timed(lambda: [legacy_membership(v) for v in verdicts])
+
+    vectors, parse_s = timed(lambda: [rule_set.verdict_vector(v) for v in verdicts])
+
+    per_word, per_word_s = timed(lambda: [rule_set.membership(v) for v in vectors])
+
+    matrix, matrix_s = timed(lambda: rule_set.membership_matrix(vectors))
+
+    for old, python_row, matrix_row in zip(legacy, per_word, matrix):
+
+        if old != python_row or any(abs(old[pos] - value) > 1e-9 for pos, value in zip(rule_set.pos_names, matrix_row)):
+
+            print("FAIL 隶属度不一致")
+
+            return 1
+
+    print(f"{args.words} 个词语 × {len(rule_set)} 条规则")
+
+    print(f"改造前（正则匹配 + 字典求和）   {legacy_s * 1000:8.1f} ms")
+
+    print(f"RuleSet 解析判定向量           {parse_s * 1000:8.1f} ms")
+
+    print(f"  + 逐词计分（纯 Python）      {per_word_s * 1000:8.1f} ms")
+
+    print(f"  + 整批矩阵计分（numpy）      {matrix_s * 1000:8.1f} ms")
+
+    return 0
+
+if __name__ == "__main__":
+
+    sys.exit(main())
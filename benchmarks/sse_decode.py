@@ -0,0 +1,219 @@
+"""SSE 解码微基准：比较旧的逐行解析与 lld.sse 增量解码器（标准库 json / orjson）在同一批流上的吞吐。
+
+    python benchmarks/sse_decode.py                  # 使用内置生成的 OpenAI 与 DashScope 流
+    python benchmarks/sse_decode.py stream1.sse ...  # 使用录制的原始响应字节（curl -N ... > stream1.sse）
+
+每条流按随机大小切成网络分片（会截断多字节汉字），各解码方式取回的文本必须一致。
+"""
+
+import argparse
+
+import json
+
+import random
+
+import sys
+
+import time
+
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from lld import sse
+
+from lld.core import RULE_SETS
+
+def verdict_text(seed: int) -> str:
+
+    """一份完整模式的判定输出（说明 + 27 条规则判定），与真实响应长度相当"""
+
+    rng = random.Random(seed)
+
+    scores = {pos: {rule["name"]: rng.random() < 0.5 for rule in rules} for pos, rules in RULE_SETS.items()}
+
+    explanation = "".join(f"{rule['name']}：{rule['desc']}，该词{'符合' if rng.random() < 0.5 else '不符合'}此规则。\n" for rules in RULE_SETS.values() for rule in rules)
+
+    return json.dumps({"explanation": explanation, "predicted_pos": "名词", "scores": scores}, ensure_ascii=False, indent=2)
+
+def record_stream(text: str, layout: str, seed: int) -> bytes:
+
+    """把输出文本按 1~4 字的增量编码为 SSE 流（带心跳注释、末尾用量分片与 [DONE]）"""
+
+    rng = random.Random(seed)
+
+    events, position = [b": keep-alive\n\n"], 0
+
+    while position < len(text):
+
+        step = rng.randint(1, 4)
+
+        piece, position = text[position:position + step], position + step
+
+        if layout == "dashscope":
+
+            chunk = {"output": {"choices": [{"message": {"role": "assistant", "content": piece}, "finish_reason": "null"}]}, "usage": {"input_tokens": 1800, "output_tokens": position // 2}}
+
+        else:
+
+            chunk = {"id": "chatcmpl-1", "object": "chat.completion.chunk", "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+
+        events.append(b"data: " + json.dumps(chunk, ensure_ascii=False).encode("utf-8") + b"\n\n")
+
+    if layout == "openai":
+
+        events.append(b'data: {"choices": [], "usage": {"prompt_tokens": 1800, "completion_tokens": 900}}\n\n')
+
+        events.append(b"data: [DONE]\n\n")
+
+    return b"".join(events)
+
+def split_network(data: bytes, seed: int):
+
+    """按 64~2048 字节的随机大小切分，模拟网络读取"""
+
+    rng = random.Random(seed)
+
+    chunks, position = [], 0
+
+    while position < len(data):
+
+        size = rng.randint(64, 2048)
+
+        chunks.append(data[position:position + size])
+
+        position += size
+
+    return chunks
+
+def legacy_decode(chunks, adapter):
+
+    """改造前的做法：按行切分后逐行解码 UTF-8、手工剥离 data: 前缀并用标准库 json 解析（多行 data 事件会被丢弃）"""
+
+    parts, pending = [], b""
+
+    for chunk in chunks:
+
+        lines = (pending + chunk).split(b"\n")
+
+        pending = lines.pop()
+
+        for line in lines:
+
+            if not line:
+
+                continue
+
+            line_text = line.decode("utf-8").strip()
+
+            json_str = line_text[5:].strip() if line_text.startswith("data:") else line_text
+
+            if json_str == "[DONE]":
+
+                continue
+
+            try:
+
+                text, _ = adapter(json.loads(json_str))
+
+            except json.JSONDecodeError:
+
+                continue
+
+            parts.append(text)
+
+    return "".join(parts)
+
+def incremental_decode(chunks, adapter):
+
+    return "".join(text for text, _ in sse.iter_stream_deltas(chunks, adapter))
+
+def run(decode, streams, repeat):
+
+    """返回 (每秒处理的 MB, 每条流平均毫秒)"""
+
+    total_bytes = sum(len(c) for chunks, _ in streams for c in chunks)
+
+    best = float("inf")
+
+    for _ in range(repeat):
+
+        started = time.perf_counter()
+
+        for chunks, adapter in streams:
+
+            decode(chunks, adapter)
+
+        best = min(best, time.perf_counter() - started)
+
+    return total_bytes / best / 1e6, best / len(streams) * 1000
+
+def main(argv=None) -> int:
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+
+    parser.add_argument("streams", nargs="*", help="录制的原始 SSE 响应文件；DashScope 流的文件名需包含 dashscope")
+
+    parser.add_argument("--count", type=int, default=20, help="内置流的数量（每种格式）")
+
+    parser.add_argument("--repeat", type=int, default=5, help="重复次数（取最快一次）")
+
+    args = parser.parse_args(argv)
+
+    if args.streams:
+
+        recorded = [(Path(p).read_bytes(), "dashscope" if "dashscope" in Path(p).name else "openai") for p in args.streams]
+
+    else:
+
+        recorded = [(record_stream(verdict_text(i), layout, i), layout) for i in range(args.count) for layout in ("openai", "dashscope")]
+
+    streams = [(split_network(data, i), sse.get_stream_adapter(layout)) for i, (data, layout) in enumerate(recorded)]
+
+    decoders = {"逐行解析 + json（改造前）": legacy_decode}
+
+    default_loads = sse.json_loads
+
+    def with_json(chunks, adapter):
+
+        sse.json_loads = sse.stdlib_json_loads
+
+        try:
+
+            return incremental_decode(chunks, adapter)
+
+        finally:
+
+            sse.json_loads = default_loads
+
+    decoders["增量解码 + json"] = with_json
+
+    if sse.JSON_DECODER == "orjson":
+
+        decoders["增量解码 + orjson"] = incremental_decode
+
+    # 先校验各解码方式取回的文本一致，再计时
+
+    for chunks, adapter in streams:
+
+        outputs = {decode(chunks, adapter) for decode in decoders.values()}
+
+        if len(outputs) != 1:
+
+            print("FAIL 解码结果不一致")
+
+            return 1
+
+    print(f"{len(streams)} 条流，{sum(len(c) for chunks, _ in streams for c in chunks) / 1e6:.2f} MB")
+
+    for name, decode in decoders.items():
+
+        throughput, per_stream = run(decode, streams, args.repeat)
+
+        print(f"{name:<24} {throughput:7.1f} MB/s  {per_stream:6.2f} ms/流")
+
+    return 0
+
+if __name__ == "__main__":
+
+    sys.exit(main())
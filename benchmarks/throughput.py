@@ -0,0 +1,342 @@
+"""端到端吞吐基准：在本地模拟服务器（benchmarks/mock_llm.py）上驱动真实的批量路径（run_batch_ordered + 历史写入）
+与命令行路径（python -m lld classify），按并发级别报告每分钟词数、请求 p95 延迟与峰值内存；不需要网络与 API Key。
+
+    python benchmarks/throughput.py                                    # 200 个词语，并发 4/8/16，两条路径
+    python benchmarks/throughput.py --words 1000 --concurrency 8,32 --path batch --lean
+    python benchmarks/throughput.py --model qwen-max                   # DashScope 原生流式接口
+    python benchmarks/throughput.py --error-rate 0.02 --rate-limit-rate 0.05 --truncate-rate 0.01
+    python benchmarks/throughput.py --json result.json                 # 保存结果，供下次比较
+    python benchmarks/throughput.py --baseline result.json             # 每分钟词数或 p95 比基线差 20% 以上时退出码为 1
+
+每个组合在全新子进程中运行（峰值内存取子进程的 ru_maxrss），响应缓存、进度、历史记录与追踪均写入临时目录；
+配额（RPM/TPM）放开，并发固定为给定值。p95 延迟取自阶段追踪中的 llm_call 阶段，
+即一组词语从发出请求到取得判定的耗时（含重试与退避）。
+"""
+
+import argparse
+
+import json
+
+import os
+
+import subprocess
+
+import sys
+
+import tempfile
+
+import time
+
+import unicodedata
+
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+sys.path.insert(0, str(ROOT))
+
+from mock_llm import add_server_arguments, server_options, start_mock_server
+
+from lld import tracing
+
+PATHS = ("batch", "cli")
+
+FAULT_KEYS = ("rate_limited", "errors", "truncated")
+
+# 结果表的列：(表头, 字段, 宽度, 格式)
+
+COLUMNS = [
+
+    ("路径", "path", 6, ""),
+
+    ("并发", "concurrency", 6, ""),
+
+    ("词数", "words", 7, ""),
+
+    ("失败", "failed", 6, ""),
+
+    ("耗时(秒)", "seconds", 10, ".1f"),
+
+    ("词/分钟", "words_per_minute", 10, ".0f"),
+
+    ("p95(毫秒)", "p95_ms", 11, ".0f"),
+
+    ("请求", "requests", 6, ""),
+
+    ("内存(MB)", "peak_rss_mb", 10, ".1f"),
+
+]
+
+def pad(text: str, width: int) -> str:
+
+    """按显示宽度右对齐（汉字占两列）"""
+
+    return " " * max(0, width - sum(2 if unicodedata.east_asian_width(ch) in "WF" else 1 for ch in text)) + text
+
+# ===============================
+# 子进程：运行一个组合
+# ===============================
+
+def run_worker(args) -> int:
+
+    """在子进程中运行一条路径，向 stdout 输出一行 JSON（耗时与失败数）"""
+
+    from lld import pipeline
+
+    from lld.cli import main as cli_main, resolve_model
+
+    workdir = Path(args.dir)
+
+    pipeline.CACHE_FILE = workdir / "cache.sqlite3"
+
+    pipeline.PROGRESS_DIR = workdir / "progress"
+
+    trace_path = workdir / "trace.jsonl"
+
+    history_path = workdir / "history.csv"
+
+    info = resolve_model(args.model)
+
+    words = (workdir / "words.txt").read_text(encoding="utf-8").split()
+
+    started = time.perf_counter()
+
+    if args.worker == "cli":
+
+        argv = ["--trace-file", str(trace_path), "--trace-sample", "1", "classify", str(workdir / "words.txt"), "--model", args.model, "--api-key", "mock",
+
+                "--out", str(workdir / "out.csv"), "--history", str(history_path), "--concurrency", str(args.concurrency), "-q"]
+
+        if args.batch_size:
+
+            argv += ["--batch-size", str(args.batch_size)]
+
+        if args.lean:
+
+            argv.append("--lean")
+
+        cli_main(argv)
+
+    else:
+
+        tracing.configure(str(trace_path), 1.0)
+
+        store = pipeline.get_history_store(history_path)
+
+        for index, word, result in pipeline.run_batch_ordered(enumerate(words), info["provider"], info["model"], "mock", batch_size=args.batch_size, lean=args.lean):
+
+            if result[0]:
+
+                store.append(pipeline.build_history_row(index, word, result), **pipeline.result_source(result, info["provider"], info["model"]))
+
+        tracing.TRACER.flush()
+
+    elapsed = time.perf_counter() - started
+
+    succeeded = pipeline.get_history_store(history_path).count()
+
+    print(json.dumps({"seconds": elapsed, "failed": len(words) - succeeded}))
+
+    return 0
+
+# ===============================
+# 主进程：模拟服务器与各组合
+# ===============================
+
+def run_case(path: str, concurrency: int, args, server) -> dict:
+
+    """在临时目录中为一个 (路径, 并发) 组合启动子进程，返回结果行"""
+
+    from lld.cli import resolve_model
+
+    provider = resolve_model(args.model)["provider"]
+
+    with tempfile.TemporaryDirectory(prefix="lld-throughput-") as tmp:
+
+        (Path(tmp) / "words.txt").write_text("\n".join(f"词{i}" for i in range(args.words)) + "\n", encoding="utf-8")
+
+        env = dict(os.environ, **server.provider_env())
+
+        env.update({
+
+            f"LLD_CONCURRENCY_{provider.upper()}": str(concurrency),
+
+            f"LLD_MAX_CONCURRENCY_{provider.upper()}": str(concurrency),
+
+            f"LLD_RPM_{provider.upper()}": "100000000",
+
+            f"LLD_TPM_{provider.upper()}": "100000000000",
+
+        })
+
+        command = [sys.executable, __file__, "--worker", path, "--dir", tmp, "--model", args.model, "--concurrency", str(concurrency)]
+
+        if args.batch_size:
+
+            command += ["--batch-size", str(args.batch_size)]
+
+        if args.lean:
+
+            command.append("--lean")
+
+        faults_before = server.stats_snapshot()
+
+        process = subprocess.Popen(command, env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL if not args.verbose else None, text=True)
+
+        output = process.stdout.read()
+
+        # wait4 取得该子进程自己的资源用量（峰值常驻内存）
+
+        _, status, usage = os.wait4(process.pid, 0)
+
+        process.returncode = os.waitstatus_to_exitcode(status)
+
+        faults_after = server.stats_snapshot()
+
+        if process.returncode != 0 or not output.strip():
+
+            raise RuntimeError(f"{path} 并发 {concurrency} 运行失败（退出码 {process.returncode}）")
+
+        result = json.loads(output.strip().splitlines()[-1])
+
+        stages = {row["阶段"]: row for row in tracing.summarize_events(tracing.read_events(Path(tmp) / "trace.jsonl"))}
+
+    peak_mb = usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+    return {
+
+        "path": path,
+
+        "concurrency": concurrency,
+
+        "words": args.words,
+
+        "failed": result["failed"],
+
+        "seconds": result["seconds"],
+
+        "words_per_minute": (args.words - result["failed"]) / result["seconds"] * 60,
+
+        "p95_ms": stages.get("llm_call", {}).get("p95", 0.0),
+
+        "requests": stages.get("http_request", {}).get("次数", 0),
+
+        "peak_rss_mb": peak_mb,
+
+        **{key: faults_after.get(key, 0) - faults_before.get(key, 0) for key in FAULT_KEYS},
+
+    }
+
+def compare_with_baseline(results, baseline_path, tolerance: float) -> list:
+
+    """与基线结果比较：每分钟词数下降或 p95 上升超过 tolerance 的组合视为退化"""
+
+    baseline = {(row["path"], row["concurrency"]): row for row in json.loads(Path(baseline_path).read_text(encoding="utf-8"))}
+
+    regressions = []
+
+    for row in results:
+
+        base = baseline.get((row["path"], row["concurrency"]))
+
+        if base is None:
+
+            continue
+
+        if row["words_per_minute"] < base["words_per_minute"] * (1 - tolerance):
+
+            regressions.append(f"{row['path']} 并发 {row['concurrency']}: 每分钟词数 {row['words_per_minute']:.0f}，基线 {base['words_per_minute']:.0f}")
+
+        if base["p95_ms"] and row["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+
+            regressions.append(f"{row['path']} 并发 {row['concurrency']}: p95 {row['p95_ms']:.0f} 毫秒，基线 {base['p95_ms']:.0f} 毫秒")
+
+    return regressions
+
+def main(argv=None) -> int:
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+
+    parser.add_argument("--words", type=int, default=200, help="每个组合判定的词语数")
+
+    parser.add_argument("--concurrency", default="4,8,16", help="并发级别，逗号分隔")
+
+    parser.add_argument("--path", choices=[*PATHS, "all"], default="all", help="batch：run_batch_ordered + 历史写入；cli：python -m lld classify")
+
+    parser.add_argument("--model", default="deepseek-chat", help="模型名（写法同 python -m lld classify --model），决定请求与流式格式")
+
+    parser.add_argument("--batch-size", type=int, help="每次请求合并判定的词语数，默认取模型配置")
+
+    parser.add_argument("--lean", action="store_true", help="精简模式")
+
+    parser.add_argument("--json", help="把结果写入该 JSON 文件")
+
+    parser.add_argument("--baseline", help="与之前 --json 保存的结果比较，退化时退出码为 1")
+
+    parser.add_argument("--tolerance", type=float, default=0.2, help="与基线比较的容差（默认 0.2 即 20%%）")
+
+    parser.add_argument("-v", "--verbose", action="store_true", help="显示子进程的日志输出")
+
+    add_server_arguments(parser)
+
+    parser.set_defaults(tokens_per_second=1000.0)
+
+    parser.add_argument("--worker", choices=PATHS, help=argparse.SUPPRESS)
+
+    parser.add_argument("--dir", help=argparse.SUPPRESS)
+
+    args = parser.parse_args(argv)
+
+    if args.worker:
+
+        args.concurrency = int(args.concurrency)
+
+        return run_worker(args)
+
+    server = start_mock_server(**server_options(args))
+
+    paths = PATHS if args.path == "all" else (args.path,)
+
+    levels = [int(level) for level in args.concurrency.split(",") if level.strip()]
+
+    print(f"模拟服务器 {server.url}：首字节 {args.latency:g} 秒（±{args.jitter:.0%}），{args.tokens_per_second:g} token/秒；"
+
+          f"注入 500 {args.error_rate:.0%} / 429 {args.rate_limit_rate:.0%} / 截断 {args.truncate_rate:.0%}")
+
+    print("".join(pad(title, width) for title, _, width, _ in COLUMNS) + "  注入 429/500/截断")
+
+    results = []
+
+    for path in paths:
+
+        for concurrency in levels:
+
+            row = run_case(path, concurrency, args, server)
+
+            results.append(row)
+
+            cells = "".join(pad(format(row[key], spec), width) for _, key, width, spec in COLUMNS)
+
+            print(f"{cells}  {row['rate_limited']}/{row['errors']}/{row['truncated']}", flush=True)
+
+    server.shutdown()
+
+    if args.json:
+
+        Path(args.json).write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    if args.baseline:
+
+        regressions = compare_with_baseline(results, args.baseline, args.tolerance)
+
+        for message in regressions:
+
+            print(f"退化 {message}")
+
+        return 1 if regressions else 0
+
+    return 0
+
+if __name__ == "__main__":
+
+    sys.exit(main())
@@ -0,0 +1 @@
+"""基于大语言模型的汉语词类隶属度检测划类：判定流水线与命令行批处理（python -m lld）。"""
@@ -0,0 +1,3 @@
+from lld.cli import exit_process, main
+
+exit_process(main())
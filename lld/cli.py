@@ -0,0 +1,957 @@
+"""命令行批处理：不导入 Streamlit，可在 cron 或服务器上直接运行。
+
+    python -m lld classify words.xlsx --model deepseek-chat --concurrency 16 --out results.parquet
+    python -m lld classify words.xlsx --model deepseek-chat --ensemble gpt-4o-mini --ensemble qwen-max --out results.csv
+    python -m lld rescore                     # 调整 RULE_SETS 分值后，按已保存的规则判定重新计算全部隶属度
+    python -m lld --trace-file trace.jsonl classify words.csv --model deepseek-chat --out results.csv
+    python -m lld trace trace.jsonl --chrome trace.json   # 各阶段耗时汇总，另存为 Chrome trace
+
+与页面共用同一套规则集、模型配置、并发执行器、历史存储与断点续传日志；进度输出到 stderr，退出码见 EXIT_* 常量。
+"""
+
+import argparse
+
+import csv
+
+import json
+
+import logging
+
+import os
+
+import signal
+
+import sys
+
+import time
+
+from pathlib import Path
+
+from typing import Dict, Any, Optional
+
+from lld import tracing
+
+from lld.core import (
+    MODEL_CONFIGS,
+    MODEL_OPTIONS,
+    get_provider_concurrency,
+)
+
+from lld.metrics import start_metrics_file_writer, start_metrics_server, write_metrics_file
+
+from lld.pipeline import (
+    BACKUP_FILE,
+    EXPORT_NUMERIC_COLUMNS,
+    HISTORY_COLUMNS,
+    WORD_FILE_TYPES,
+    ExcelResultWriter,
+    ProgressJournal,
+    WordFileReader,
+    build_history_row,
+    cancel_open_requests,
+    detect_target_column,
+    ensemble_model_id,
+    file_digest,
+    get_history_store,
+    get_provider_health,
+    iter_pending_words,
+    make_job_id,
+    result_source,
+    run_batch_ordered,
+)
+
+logger = logging.getLogger(__name__)
+
+EXIT_OK = 0  # 全部词语判定成功
+
+EXIT_ERROR = 1  # 配置、输入或输出错误，或处理意外中断
+
+EXIT_USAGE = 2  # 命令行参数错误（argparse 的默认退出码）
+
+EXIT_PARTIAL = 3  # 处理完成但有词语判定失败；进度保留，重新运行同一命令只重试失败的行
+
+EXIT_INTERRUPTED = 130  # 被 Ctrl-C 或 SIGTERM 中断；进度保留，重新运行同一命令即可续传
+
+OUTPUT_TYPES = ["xlsx", "csv", "jsonl", "parquet"]
+
+PARQUET_CHUNK_ROWS = 1000  # parquet 每个行组的行数
+
+# ===============================
+# 结果文件写出（按扩展名选择格式，逐行写入）
+# ===============================
+
+def row_index(seq) -> Optional[int]:
+
+    """输出行「序数」列对应的行号（序数 - 1）；无法解析时返回 None"""
+
+    try:
+
+        return int(seq) - 1
+
+    except (TypeError, ValueError):
+
+        return None
+
+def prune_output_rows(path: Path, completed: set):
+
+    """续传前改写已有的 csv/jsonl 输出，只保留已记入进度的行：失败的行不记入进度，续传时会重新判定并再次写出，
+    保留旧行会使其重复；写了一半的行同样丢弃。写入同目录的临时文件后原子替换"""
+
+    tmp_path = path.with_name(f".{path.name}.tmp")
+
+    try:
+
+        if path.suffix.lower() == ".csv":
+
+            with open(path, encoding="utf-8-sig", newline="") as src, open(tmp_path, "w", encoding="utf-8-sig", newline="") as dst:
+
+                reader = csv.reader(src)
+
+                header = next(reader, None) or HISTORY_COLUMNS
+
+                seq_col = header.index("序数") if "序数" in header else 0
+
+                writer = csv.writer(dst, lineterminator="\n")
+
+                writer.writerow(header)
+
+                writer.writerows(fields for fields in reader if len(fields) == len(header) and row_index(fields[seq_col]) in completed)
+
+        else:
+
+            with open(path, encoding="utf-8") as src, open(tmp_path, "w", encoding="utf-8") as dst:
+
+                for line in src:
+
+                    try:
+
+                        seq = json.loads(line).get("序数")
+
+                    except (ValueError, AttributeError):
+
+                        continue
+
+                    if row_index(seq) in completed:
+
+                        dst.write(line)
+
+        os.replace(tmp_path, path)
+
+    finally:
+
+        if tmp_path.exists():
+
+            tmp_path.unlink()
+
+class CsvRowWriter:
+
+    """按历史记录列写出 CSV（UTF-8 BOM，与历史文件格式一致）；续传时保留已完成的行并追加到已有文件"""
+
+    def __init__(self, path, completed: set = None):
+
+        has_rows = completed is not None and Path(path).exists() and Path(path).stat().st_size > 0
+
+        if has_rows:
+
+            prune_output_rows(Path(path), completed)
+
+        self.file = open(path, "a" if has_rows else "w", encoding="utf-8" if has_rows else "utf-8-sig", newline="")
+
+        self.writer = csv.writer(self.file, lineterminator="\n")
+
+        if not has_rows:
+
+            self.writer.writerow(HISTORY_COLUMNS)
+
+        self.rows = 0
+
+    def append(self, row: Dict[str, Any]):
+
+        self.writer.writerow([row.get(col, "") for col in HISTORY_COLUMNS])
+
+        self.file.flush()
+
+        self.rows += 1
+
+    def close(self):
+
+        self.file.close()
+
+class JsonlRowWriter:
+
+    """每行一个 JSON 对象；续传时保留已完成的行并追加到已有文件"""
+
+    def __init__(self, path, completed: set = None):
+
+        has_rows = completed is not None and Path(path).exists()
+
+        if has_rows:
+
+            prune_output_rows(Path(path), completed)
+
+        self.file = open(path, "a" if has_rows else "w", encoding="utf-8")
+
+        self.rows = 0
+
+    def append(self, row: Dict[str, Any]):
+
+        self.file.write(json.dumps({col: row.get(col, "") for col in HISTORY_COLUMNS}, ensure_ascii=False) + "\n")
+
+        self.file.flush()
+
+        self.rows += 1
+
+    def close(self):
+
+        self.file.close()
+
+class ParquetRowWriter:
+
+    """按行组分块写出 parquet（需要 pyarrow），内存中最多持有一个行组；中断时已写出的行组仍可读取"""
+
+    def __init__(self, path, chunk_rows: int = PARQUET_CHUNK_ROWS):
+
+        import pyarrow as pa
+
+        import pyarrow.parquet as pq
+
+        self._pa = pa
+
+        self.schema = pa.schema([
+
+            (col, pa.int64() if col == "序数" else pa.float64() if col in EXPORT_NUMERIC_COLUMNS else pa.string())
+
+            for col in HISTORY_COLUMNS
+
+        ])
+
+        self.writer = pq.ParquetWriter(str(path), self.schema)
+
+        self.chunk_rows = chunk_rows
+
+        self.buffer = []
+
+        self.rows = 0
+
+    def append(self, row: Dict[str, Any]):
+
+        self.buffer.append({col: row.get(col) for col in HISTORY_COLUMNS})
+
+        self.rows += 1
+
+        if len(self.buffer) >= self.chunk_rows:
+
+            self._flush()
+
+    def _flush(self):
+
+        if self.buffer:
+
+            self.writer.write_table(self._pa.Table.from_pylist(self.buffer, schema=self.schema))
+
+            self.buffer = []
+
+    def close(self):
+
+        self._flush()
+
+        self.writer.close()
+
+def open_result_writer(path: Path, completed: set = None):
+
+    """按输出文件扩展名创建写出器；续传时 completed 为已记入进度的行号。
+    xlsx 与 parquet 不支持追加，续传时只包含本次运行处理的行"""
+
+    kind = path.suffix.lower().lstrip(".")
+
+    if kind == "xlsx":
+
+        return ExcelResultWriter(path)
+
+    if kind == "csv":
+
+        return CsvRowWriter(path, completed=completed)
+
+    if kind == "jsonl":
+
+        return JsonlRowWriter(path, completed=completed)
+
+    if kind == "parquet":
+
+        try:
+
+            return ParquetRowWriter(path)
+
+        except ImportError:
+
+            raise ValueError("写出 parquet 需要安装 pyarrow（pip install pyarrow）")
+
+    raise ValueError(f"不支持的输出格式 .{kind}，可选：{', '.join(OUTPUT_TYPES)}")
+
+# ===============================
+# 进度输出（stderr）
+# ===============================
+
+class ProgressReporter:
+
+    """终端中原地刷新一行进度；输出被重定向（cron、日志文件）时每隔数秒输出一行"""
+
+    def __init__(self, total: int, stream=None, enabled: bool = True):
+
+        self.total = total
+
+        self.stream = stream or sys.stderr
+
+        self.enabled = enabled
+
+        self.tty = self.stream.isatty()
+
+        self.interval = 0.2 if self.tty else 5.0
+
+        self.started = time.monotonic()
+
+        self._last = 0.0
+
+    def update(self, position: int, done: int, failed: int, skipped: int, word: str = "", force: bool = False):
+
+        now = time.monotonic()
+
+        if not self.enabled or (not force and now - self._last < self.interval):
+
+            return
+
+        self._last = now
+
+        elapsed = now - self.started
+
+        rate = done / elapsed * 60 if elapsed > 0 else 0.0
+
+        line = f"[{position}/{self.total}] 成功 {done - failed} · 失败 {failed} · 跳过 {skipped} · {rate:.1f} 词/分钟"
+
+        if word:
+
+            line += f" · 最近: {word}"
+
+        self.stream.write(f"\r\033[K{line}" if self.tty else f"{line}\n")
+
+        self.stream.flush()
+
+    def finish(self):
+
+        if self.enabled and self.tty:
+
+            self.stream.write("\n")
+
+            self.stream.flush()
+
+def echo(message: str):
+
+    """提示信息统一输出到 stderr，stdout 保持干净"""
+
+    print(message, file=sys.stderr, flush=True)
+
+# ===============================
+# 子命令
+# ===============================
+
+def resolve_model(name: str) -> Optional[Dict[str, Any]]:
+
+    """按显示名称、模型名（可省略 models/ 前缀）或「提供商:模型」查找模型配置"""
+
+    for display_name, info in MODEL_OPTIONS.items():
+
+        if name in (display_name, info["model"], info["model"].split("/")[-1], f"{info['provider']}:{info['model']}"):
+
+            return dict(info, name=display_name)
+
+    provider, sep, model = name.partition(":")
+
+    if sep and provider in MODEL_CONFIGS and model:
+
+        env_var = f"{provider.upper()}_API_KEY"
+
+        return {"provider": provider, "model": model, "api_key": os.getenv(env_var), "env_var": env_var, "name": name}
+
+    return None
+
+def _raise_interrupt(signum, frame):
+
+    raise KeyboardInterrupt
+
+def cmd_models(args) -> int:
+
+    """列出可用模型及其 API Key 环境变量"""
+
+    for display_name, info in MODEL_OPTIONS.items():
+
+        status = "已配置" if info["api_key"] else f"未设置 {info['env_var']}"
+
+        print(f"{info['provider']}:{info['model']}\t{display_name}\t{status}")
+
+    return EXIT_OK
+
+def cmd_rescore(args) -> int:
+
+    """按当前规则集的分值重新计算历史记录中的隶属度，不调用模型"""
+
+    history_path = Path(args.history) if args.history else BACKUP_FILE
+
+    history_store = get_history_store(history_path)
+
+    if not history_store.exists():
+
+        echo(f"历史记录不存在: {history_path}")
+
+        return EXIT_ERROR
+
+    started = time.monotonic()
+
+    try:
+
+        stats = history_store.rescore(dry_run=args.dry_run)
+
+    except (OSError, ValueError) as e:
+
+        echo(f"重新计分失败: {e}")
+
+        return EXIT_ERROR
+
+    echo(
+
+        f"{'试运行：' if args.dry_run else ''}共 {stats.get('rows', 0)} 条记录，隶属度变化 {stats.get('changed', 0)} 条"
+
+        f"（按规则判定计分 {stats.get('from_verdicts', 0)} 条，从原始响应补齐判定 {stats.get('backfilled', 0)} 条，"
+
+        f"无法计分 {stats.get('skipped', 0)} 条），用时 {time.monotonic() - started:.1f} 秒"
+
+    )
+
+    return EXIT_OK
+
+def cmd_trace(args) -> int:
+
+    """汇总追踪文件中各阶段的耗时（毫秒），可另存为 Chrome trace"""
+
+    try:
+
+        events = tracing.read_events(args.file)
+
+    except OSError as e:
+
+        echo(f"读取追踪文件失败: {e}")
+
+        return EXIT_ERROR
+
+    if args.word:
+
+        roots = {
+
+            event["args"]["trace_id"] for event in events
+
+            if event.get("ph") == "X" and "parent_id" not in event["args"]
+
+            and args.word in (event["args"].get("word"), *event["args"].get("words", ()))
+
+        }
+
+        events = [event for event in events if event.get("ph") != "X" or event["args"].get("trace_id") in roots]
+
+    rows = tracing.summarize_events(events)
+
+    if not rows:
+
+        echo("追踪文件中没有匹配的阶段记录")
+
+        return EXIT_ERROR
+
+    traces = len({event["args"]["trace_id"] for event in events if event.get("ph") == "X"})
+
+    print(f"{'阶段':<16}{'次数':>6}{'总耗时':>9}{'p50':>10}{'p95':>10}{'p99':>10}")
+
+    for row in rows:
+
+        print(f"{row['阶段']:<18}{row['次数']:>8}{row['总耗时(毫秒)']:>12.1f}{row['p50']:>10.1f}{row['p95']:>10.1f}{row['p99']:>10.1f}")
+
+    echo(f"共 {traces} 条追踪，耗时单位为毫秒；嵌套阶段的耗时包含其子阶段")
+
+    if args.chrome:
+
+        tracing.write_chrome_trace(events, args.chrome)
+
+        echo(f"已写出 Chrome trace: {args.chrome}（在 chrome://tracing 或 https://ui.perfetto.dev 中打开）")
+
+    return EXIT_OK
+
+def cmd_classify(args) -> int:
+
+    """批量判定词表文件中的词语，结果写入 --out，并（默认）追加到历史记录"""
+
+    model_info = resolve_model(args.model)
+
+    if model_info is None:
+
+        echo(f"未知模型: {args.model}（运行 python -m lld models 查看可用模型，或使用「提供商:模型」形式）")
+
+        return EXIT_ERROR
+
+    provider, model = model_info["provider"], model_info["model"]
+
+    api_key = args.api_key or model_info["api_key"]
+
+    if not api_key:
+
+        echo(f"未提供 API Key：请设置环境变量 {model_info['env_var']} 或使用 --api-key")
+
+        return EXIT_ERROR
+
+    # 集成判定：--model 与各 --ensemble 模型同时判定每组词语，逐条规则投票
+
+    ensemble = None
+
+    job_provider, job_model = provider, model
+
+    if args.ensemble:
+
+        ensemble = [dict(model_info, api_key=api_key)]
+
+        for name in args.ensemble:
+
+            member = resolve_model(name)
+
+            if member is None:
+
+                echo(f"未知集成模型: {name}")
+
+                return EXIT_ERROR
+
+            if not member["api_key"]:
+
+                echo(f"集成模型 {name} 未配置 API Key：请设置环境变量 {member['env_var']}")
+
+                return EXIT_ERROR
+
+            ensemble.append(member)
+
+        if args.weights:
+
+            if len(args.weights) != len(ensemble):
+
+                echo(f"--weights 需要 {len(ensemble)} 个权重（依次对应 --model 与各 --ensemble）")
+
+                return EXIT_ERROR
+
+            for member, weight in zip(ensemble, args.weights):
+
+                member["weight"] = weight
+
+        # 任务标识与历史记录中的模型名按全部成员区分，不与单模型的结果混用
+
+        job_provider, job_model = "ensemble", ensemble_model_id(ensemble)
+
+    elif args.weights:
+
+        echo("--weights 只能与 --ensemble 一起使用")
+
+        return EXIT_ERROR
+
+    secondary = None
+
+    if args.secondary:
+
+        secondary = resolve_model(args.secondary)
+
+        if secondary is None:
+
+            echo(f"未知备用模型: {args.secondary}")
+
+            return EXIT_ERROR
+
+        if not secondary["api_key"]:
+
+            echo(f"备用模型未配置 API Key：请设置环境变量 {secondary['env_var']}")
+
+            return EXIT_ERROR
+
+    if args.concurrency:
+
+        # 通过提供商配置的环境变量覆盖生效，须在首次创建线程池与限流器之前设置
+
+        for member_provider in {m["provider"] for m in ensemble or [model_info]}:
+
+            os.environ[f"LLD_CONCURRENCY_{member_provider.upper()}"] = str(args.concurrency)
+
+            os.environ[f"LLD_MAX_CONCURRENCY_{member_provider.upper()}"] = str(args.concurrency)
+
+    input_path = Path(args.input)
+
+    if input_path.suffix.lower().lstrip(".") not in WORD_FILE_TYPES:
+
+        echo(f"不支持的词表格式: {input_path.name}（可选：{', '.join(WORD_FILE_TYPES)}）")
+
+        return EXIT_ERROR
+
+    try:
+
+        source = open(input_path, "rb")
+
+    except OSError as e:
+
+        echo(f"无法打开词表文件: {e}")
+
+        return EXIT_ERROR
+
+    with source:
+
+        try:
+
+            reader = WordFileReader(source, input_path.name)
+
+            columns = reader.columns()
+
+            column = args.column or detect_target_column(columns)
+
+            if column not in columns:
+
+                echo(f"未找到目标列 {column or '（包含「词」或 word 的列）'}，表头为: {columns}")
+
+                return EXIT_ERROR
+
+            total_rows = reader.count_rows()
+
+            digest = file_digest(source)
+
+        except Exception as e:
+
+            echo(f"读取词表文件失败: {e}")
+
+            return EXIT_ERROR
+
+        # 任务标识与页面一致：同一文件、同一列与模型在页面和命令行之间可以互相续传
+
+        journal = ProgressJournal(make_job_id(digest, column, job_provider, job_model))
+
+        if args.fresh:
+
+            journal.discard()
+
+        resume_row = journal.first_pending()
+
+        resuming = bool(journal.completed)
+
+        out_path = Path(args.out)
+
+        try:
+
+            writer = open_result_writer(out_path, completed=journal.completed if resuming else None)
+
+        except (ValueError, OSError) as e:
+
+            echo(f"无法创建输出文件: {e}")
+
+            return EXIT_ERROR
+
+        history_store = None if args.no_history else get_history_store(Path(args.history) if args.history else BACKUP_FILE)
+
+        # 与写入时的唯一键一致：只跳过本次提供商与模型已判定过的词语
+
+        is_processed = (lambda word: history_store.contains(word, provider=job_provider, model=job_model)) if history_store is not None and args.skip_existing else None
+
+        skipped = {}
+
+        if resuming:
+
+            echo(f"检测到未完成的任务：已完成 {len(journal.completed)} 行，从第 {resume_row + 1} 行继续")
+
+            if out_path.suffix.lower() in (".xlsx", ".parquet"):
+
+                echo(f"注意：{out_path.suffix} 不支持追加，{out_path.name} 只包含本次运行处理的行")
+
+        journal.start(file_name=input_path.name, column=str(column), provider=job_provider, model=job_model, total_rows=total_rows)
+
+        model_label = f"集成 {job_model}（{'加权投票' if args.weights else '多数投票'}）" if ensemble else f"{provider}:{model}"
+
+        echo(f"开始处理 {input_path.name}：{total_rows} 行 · 列「{column}」· 模型 {model_label} · 并发上限 {get_provider_concurrency(provider)}" + (f" · 备用模型 {secondary['provider']}:{secondary['model']}" if secondary else ""))
+
+        jobs = iter_pending_words(
+
+            ((index, value) for index, value in reader.iter_words(column, start=resume_row) if index not in journal.completed),
+
+            is_processed,
+
+            skipped,
+
+            on_skip=journal.mark
+
+        )
+
+        progress = ProgressReporter(total_rows, enabled=not args.quiet)
+
+        started = time.monotonic()
+
+        done, failed = 0, 0
+
+        signal.signal(signal.SIGTERM, _raise_interrupt)
+
+        try:
+
+            for index, word, result in run_batch_ordered(jobs, provider=provider, model=model, api_key=api_key, batch_size=args.batch_size, lean=args.lean, secondary=secondary, ensemble=ensemble):
+
+                row = build_history_row(index, word, result)
+
+                with tracing.span("write_output", word=word):
+
+                    writer.append(row)
+
+                done += 1
+
+                # 失败的行不写入历史、不记入进度，重新运行同一命令时只重试这些行
+
+                if not result[0]:
+
+                    failed += 1
+
+                elif history_store is not None and not history_store.append(row, **result_source(result, job_provider, job_model)):
+
+                    failed += 1
+
+                    logger.error(f"写入历史记录失败 - 行号:{index + 1}, 词语:{word}")
+
+                else:
+
+                    journal.mark(index)
+
+                progress.update(index + 1, done, failed, sum(skipped.values()), word)
+
+        except KeyboardInterrupt:
+
+            # 中断进行中的请求、撤销排队的任务，不等待工作线程把当前请求做完
+
+            cancel_open_requests()
+
+            progress.finish()
+
+            journal.close()
+
+            writer.close()
+
+            echo(f"已中断：本次完成 {done} 行，进度已保存，重新运行同一命令即可续传")
+
+            return EXIT_INTERRUPTED
+
+        except Exception as e:
+
+            progress.finish()
+
+            journal.close()
+
+            writer.close()
+
+            logger.exception("批量处理意外中断")
+
+            echo(f"批量处理意外中断: {e}（进度已保存，重新运行同一命令即可续传）")
+
+            return EXIT_ERROR
+
+        progress.update(total_rows, done, failed, sum(skipped.values()), force=True)
+
+        progress.finish()
+
+        try:
+
+            writer.close()
+
+        except Exception as e:
+
+            journal.close()
+
+            echo(f"写出结果文件失败: {e}")
+
+            return EXIT_ERROR
+
+    echo(
+
+        f"完成：成功 {done - failed} 条，失败 {failed} 条，跳过 {sum(skipped.values())} 条"
+
+        f"（空值 {skipped.get('empty', 0)} / 已处理 {skipped.get('existing', 0)}），"
+
+        f"用时 {time.monotonic() - started:.1f} 秒；结果已写入 {out_path}"
+
+    )
+
+    if secondary:
+
+        health = get_provider_health(provider).snapshot()
+
+        echo(f"对冲请求 {health['hedged']} 次（备用模型先返回 {health['hedge_wins']} 次），故障转移 {health['failovers']} 次")
+
+    if failed:
+
+        journal.close()
+
+        return EXIT_PARTIAL
+
+    journal.discard()
+
+    return EXIT_OK
+
+# ===============================
+# 入口
+# ===============================
+
+def positive_int(value: str) -> int:
+
+    number = int(value)
+
+    if number < 1:
+
+        raise argparse.ArgumentTypeError("必须为正整数")
+
+    return number
+
+def weight_list(value: str) -> list:
+
+    try:
+
+        weights = [float(part) for part in value.split(",")]
+
+    except ValueError:
+
+        raise argparse.ArgumentTypeError("权重须为逗号分隔的数字")
+
+    if any(weight <= 0 for weight in weights):
+
+        raise argparse.ArgumentTypeError("权重必须为正数")
+
+    return weights
+
+def build_parser() -> argparse.ArgumentParser:
+
+    parser = argparse.ArgumentParser(prog="python -m lld", description="汉语词类隶属度检测：命令行批处理（不依赖 Streamlit）")
+
+    parser.add_argument("-v", "--verbose", action="store_true", help="输出 INFO 级别日志")
+
+    parser.add_argument("--metrics-file", default=os.getenv("LLD_METRICS_FILE"), help="每 15 秒把运行指标写为 Prometheus 文本文件，退出前再写一次（默认读取 LLD_METRICS_FILE）")
+
+    parser.add_argument("--metrics-port", type=int, default=os.getenv("LLD_METRICS_PORT"), help="在该端口提供 HTTP /metrics（默认读取 LLD_METRICS_PORT）")
+
+    parser.add_argument("--trace-file", default=os.getenv("LLD_TRACE_FILE"), help="把各阶段耗时追踪追加写入该 JSONL 文件（默认读取 LLD_TRACE_FILE）")
+
+    parser.add_argument("--trace-sample", type=float, default=float(os.getenv("LLD_TRACE_SAMPLE", tracing.DEFAULT_SAMPLE_RATE)), help="追踪抽样比例，按每组合并请求的词语抽样（默认读取 LLD_TRACE_SAMPLE，否则 0.1）")
+
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    classify = subparsers.add_parser("classify", help="批量判定词表文件中的词语")
+
+    classify.add_argument("input", help=f"词表文件（{' / '.join(WORD_FILE_TYPES)}）")
+
+    classify.add_argument("--model", required=True, help="模型名（如 deepseek-chat）、页面中的显示名称或「提供商:模型」")
+
+    classify.add_argument("--out", required=True, help=f"结果文件，格式由扩展名决定（{' / '.join(OUTPUT_TYPES)}）")
+
+    classify.add_argument("--column", help="目标列名，默认取第一个包含「词」或 word 的列")
+
+    classify.add_argument("--concurrency", type=positive_int, help="并发请求上限，默认取提供商配置")
+
+    classify.add_argument("--batch-size", type=positive_int, help="每次请求合并判定的词语数，默认取模型配置；1 表示逐词请求")
+
+    classify.add_argument("--lean", action="store_true", help="精简模式：只返回判定、不含逐条说明（输出 token 更少）")
+
+    classify.add_argument("--ensemble", action="append", metavar="MODEL", help="集成判定：与 --model 同时询问该模型（可重复指定），逐条规则投票后再计分")
+
+    classify.add_argument("--weights", type=weight_list, help="集成判定的成员权重，逗号分隔，依次对应 --model 与各 --ensemble；省略时为多数投票")
+
+    classify.add_argument("--secondary", default=os.getenv("LLD_SECONDARY_MODEL"), help="备用模型（写法同 --model）：请求超过主模型近期 p95 延迟时对冲，主模型错误率过高时临时转移；默认读取 LLD_SECONDARY_MODEL")
+
+    classify.add_argument("--api-key", help="API Key，默认读取模型对应的环境变量")
+
+    classify.add_argument("--history", help=f"历史记录文件，默认 {BACKUP_FILE}")
+
+    classify.add_argument("--no-history", action="store_true", help="不写入历史记录")
+
+    classify.add_argument("--skip-existing", action="store_true", help="跳过历史记录中已有的词语")
+
+    classify.add_argument("--fresh", action="store_true", help="忽略已保存的进度，从头开始")
+
+    classify.add_argument("-q", "--quiet", action="store_true", help="不输出进度")
+
+    classify.set_defaults(handler=cmd_classify)
+
+    rescore = subparsers.add_parser("rescore", help="按当前规则集分值重新计算历史记录的隶属度（不调用模型）")
+
+    rescore.add_argument("--history", help=f"历史记录文件，默认 {BACKUP_FILE}")
+
+    rescore.add_argument("--dry-run", action="store_true", help="只统计将会变化的记录，不写回")
+
+    rescore.set_defaults(handler=cmd_rescore)
+
+    trace = subparsers.add_parser("trace", help="汇总追踪文件中各阶段的耗时，或转换为 Chrome trace")
+
+    trace.add_argument("file", help="--trace-file 写出的 JSONL 追踪文件")
+
+    trace.add_argument("--chrome", metavar="OUT", help="另存为 Chrome trace JSON（chrome://tracing 或 ui.perfetto.dev 可打开）")
+
+    trace.add_argument("--word", help="只统计包含该词语的追踪")
+
+    trace.set_defaults(handler=cmd_trace)
+
+    models = subparsers.add_parser("models", help="列出可用模型")
+
+    models.set_defaults(handler=cmd_models)
+
+    return parser
+
+def main(argv=None) -> int:
+
+    args = build_parser().parse_args(argv)
+
+    logging.basicConfig(
+
+        level=logging.INFO if args.verbose else logging.WARNING,
+
+        format="%(asctime)s - %(levelname)s - %(message)s",
+
+        stream=sys.stderr
+
+    )
+
+    if args.metrics_port:
+
+        start_metrics_server(args.metrics_port)
+
+    if args.metrics_file:
+
+        start_metrics_file_writer(args.metrics_file)
+
+    if args.trace_file and args.command != "trace":
+
+        tracing.configure(args.trace_file, args.trace_sample)
+
+    try:
+
+        return args.handler(args)
+
+    finally:
+
+        tracing.TRACER.flush()
+
+        if args.metrics_file:
+
+            write_metrics_file(args.metrics_file)  # 写出最终值，不等下一个写出周期
+
+def exit_process(code: int):
+
+    """以 code 退出进程（python -m lld 的入口）。
+
+    被中断时请求已取消、进度与结果文件已写出，但仍在等待响应头的工作线程无法被打断；
+    解释器退出时会逐个等待线程池的工作线程，因此这里不走正常退出流程，直接结束进程。
+    """
+
+    if code == EXIT_INTERRUPTED:
+
+        sys.stdout.flush()
+
+        sys.stderr.flush()
+
+        os._exit(code)
+
+    sys.exit(code)
@@ -0,0 +1,1459 @@
+"""判定核心：规则集、模型配置、提示词模板与评分函数。
+
+只依赖标准库，不导入 Streamlit、pandas、openpyxl 或 requests；工作进程与测试只需要评分或提示词时直接导入本模块即可。
+"""
+
+import json
+
+import re
+
+import os
+
+import hashlib
+
+import functools
+
+import logging
+
+from typing import Tuple, Dict, Any, List, Callable
+
+logger = logging.getLogger(__name__)
+
+RULE_SETS = {
+
+    "名词": [
+
+        {"name": "N1_可受数量词修饰", "desc": "可以受数量词修饰", "match_score": 10, "mismatch_score": 0},
+
+        {"name": "N2_不能受副词修饰", "desc": "不能受副词修饰", "match_score": 20, "mismatch_score": -20},
+
+        {"name": "N3_可作主宾语", "desc": "可以做典型的主语或宾语", "match_score": 20, "mismatch_score": 0},
+
+        {"name": "N4_可作中心语或作定语", "desc": "可以做中心语受其他名词修饰，或者作定语直接修饰其他名词", "match_score": 10, "mismatch_score": 0},
+
+        {"name": "N5_可后附的字结构", "desc": "可以后附助词'的'构成'的'字结构", "match_score": 10, "mismatch_score": 0},
+
+        {"name": "N6_可后附方位词构处所", "desc": "可以后附方位词构成处所结构", "match_score": 10, "mismatch_score": 0},
+
+        {"name": "N7_不能作谓语核心", "desc": "不能做谓语或谓语核心", "match_score": 10, "mismatch_score": -10},
+
+        {"name": "N8_不能作补语/一般不作状语", "desc": "不能作补语，并且一般不能做状语直接修饰动词性成分", "match_score": 10, "mismatch_score": 0},
+
+    ],
+
+    "动词": [
+
+        {"name": "V1_可受否定'不/没有'修饰", "desc": "可以受否定副词'不'或'没有'修饰", "match_score": 10, "mismatch_score": 0},
+
+        {"name": "V2_可后附/插入时体助词'着/了/过'", "desc": "可以后附或中间插入时体助词'着/了/过'", "match_score": 10, "mismatch_score": 0},
+
+        {"name": "V3_可带真宾语或通过介词引导论元", "desc": "可以带真宾语或通过介词引导论元", "match_score": 20, "mismatch_score": 0},
+
+        {"name": "V4_程度副词与带宾语的关系", "desc": "不能受程度副词'很'修饰，或能同时受'很'修饰并带宾语", "match_score": 10, "mismatch_score": -10},
+
+        {"name": "V5_可有重叠/正反重叠形式", "desc": "可以有'VV, V一V, V了V, V不V, V了没有'等形式", "match_score": 10, "mismatch_score": 0},
+
+        {"name": "V6_可做谓语或谓语核心", "desc": "可以做谓语或谓语核心", "match_score": 10, "mismatch_score": -10},
+
+        {"name": "V7_不能作状语修饰动词性成分", "desc": "不能作状语修饰动词性成分", "match_score": 10, "mismatch_score": 0},
+
+        {"name": "V8_可作'怎么/怎样'提问或'这么/这样/那么'回答", "desc": "可以跟在'怎么/怎样'之后提问或跟在'这么/这样/那么'之后回答", "match_score": 10, "mismatch_score": 0},
+
+        {"name": "V9_不能跟在'多/多么'之后提问或表示感叹", "desc": "不能跟在'多'之后对性质提问，不能跟在'多么'之后表示感叹", "match_score": 10, "mismatch_score": -10},
+
+    ],
+
+    "名动词": [
+
+        {"name": "NV1_可被\"不/没有\"否定且肯定形式-1", "desc": "可以用\"不\"和\"没有\"来否定", "match_score": 10, "mismatch_score": -10},
+
+        {"name": "NV2_可附时体助词或进入\"……了没有\"格式", "desc": "可以后附时体助词\"着、了、过\"", "match_score": 10, "mismatch_score": -10},
+
+        {"name": "NV3_可带真宾语且不受\"很\"修饰", "desc": "可以带真宾语，并且不能受程度副词\"很\"等修饰", "match_score": 10, "mismatch_score": -10},
+
+        {"name": "NV4_有重叠和正反重叠形式", "desc": "可以有\"VV、V一V、V了V、V不V\"等重叠和正反重叠形式", "match_score": 10, "mismatch_score": 0},
+
+        {"name": "NV5_可作多种句法成分且可作形式动词宾语", "desc": "既可以作谓语或谓语核心，又可以作主语或宾语", "match_score": 10, "mismatch_score": -10},
+
+        {"name": "NV6_不能直接作状语", "desc": "不能直接作状语修饰动词性成分", "match_score": 10, "mismatch_score": -10},
+
+        {"name": "NV7_可修饰名词或受名词/数量词修饰", "desc": "可以修饰名词或者受名词修饰，或者可以受数量词修饰", "match_score": 10, "mismatch_score": 0},
+
+        {"name": "NV8_可跟在\"怎么/怎样/这么/这样/那么/那样\"之后", "desc": "可以跟在\"怎么、怎样\"之后提问", "match_score": 10, "mismatch_score": 0},
+
+        {"name": "NV9_不能跟在\"多/多么\"之后", "desc": "不能跟在\"多\"之后对性质的程度进行提问", "match_score": 10, "mismatch_score": -10},
+
+        {"name": "NV10_可后附方位词构成处所结构", "desc": "可以后附方位词构成处所结构", "match_score": 10, "mismatch_score": 0},
+
+    ]
+
+}
+
+# ===============================
+# 模型配置
+# ===============================
+
+MODEL_CONFIGS = {
+
+    "deepseek": {
+
+        "base_url": "https://api.deepseek.com/v1",  # 可用 LLD_BASE_URL_<PROVIDER> 覆盖（代理网关或本地模拟服务器）
+
+        "endpoint": "/chat/completions",
+
+        "concurrency": 8,  # 批量处理的初始并发数，自适应控制会按限流反馈上下调整
+
+        "rpm": 1000,  # 每分钟请求数 / token 数配额，按账号等级调整或用 LLD_RPM_<PROVIDER> 覆盖
+
+        "tpm": 2000000,
+
+        "json_mode": True,  # 支持 response_format 原生 JSON 输出，精简模式下启用
+
+        "headers": lambda key: {"Authorization": f"Bearer {key}", "Content-Type": "application/json"},
+
+        "payload": lambda model, messages, **kw: {
+
+            "model": model, "messages": messages, "max_tokens": kw.get("max_tokens", 4096), 
+
+            "temperature": kw.get("temperature", 0.0), 
+
+            "stream": True, 
+
+            "stream_options": {"include_usage": True},  # 在流末尾返回用量（含缓存命中的输入 token）
+
+            **({"response_format": {"type": "json_object"}} if kw.get("json_mode") else {}),
+
+        },
+
+    },
+
+    "openai": {
+
+        "base_url": "https://api.openai.com/v1",
+
+        "endpoint": "/chat/completions",
+
+        "concurrency": 8,
+
+        "rpm": 500,
+
+        "tpm": 200000,
+
+        "json_mode": True,
+
+        "headers": lambda key: {"Authorization": f"Bearer {key}", "Content-Type": "application/json"},
+
+        "payload": lambda model, messages, **kw: {
+
+            "model": model, "messages": messages, "max_tokens": kw.get("max_tokens", 4096), 
+
+            "temperature": kw.get("temperature", 0.0), 
+
+            "stream": True,
+
+            "stream_options": {"include_usage": True},
+
+            **({"response_format": {"type": "json_object"}} if kw.get("json_mode") else {}),
+
+        },
+
+    },
+
+    "gemini": {
+
+        # 核心修正：Base URL 到版本号级，Endpoint 为标准 chat 接口
+
+        "base_url": "https://generativelanguage.googleapis.com/v1beta",
+
+        "endpoint": "/chat/completions",
+
+        "concurrency": 4,
+
+        "rpm": 360,
+
+        "tpm": 4000000,
+
+        "headers": lambda key: {"Authorization": f"Bearer {key}", "Content-Type": "application/json"},
+
+        "payload": lambda model, messages, **kw: {
+
+            "model": model, 
+
+            "messages": messages, 
+
+            "max_tokens": kw.get("max_tokens", 4096), 
+
+            "temperature": kw.get("temperature", 0.0), 
+
+            "stream": True,
+
+        },
+
+    },
+
+    "moonshot": {
+
+        "base_url": "https://api.moonshot.cn/v1",
+
+        "endpoint": "/chat/completions",
+
+        "concurrency": 4,
+
+        "rpm": 200,
+
+        "tpm": 128000,
+
+        "json_mode": True,
+
+        "headers": lambda key: {"Authorization": f"Bearer {key}", "Content-Type": "application/json"},
+
+        "payload": lambda model, messages, **kw: {
+
+            "model": model, "messages": messages, "max_tokens": kw.get("max_tokens", 4096), 
+
+            "temperature": kw.get("temperature", 0.0), 
+
+            "stream": True,
+
+            **({"response_format": {"type": "json_object"}} if kw.get("json_mode") else {}),
+
+        },
+
+    },
+
+    "qwen": {
+
+        "base_url": "https://dashscope.aliyuncs.com/api/v1",
+
+        "endpoint": "/services/aigc/text-generation/generation",
+
+        "concurrency": 4,
+
+        "rpm": 600,
+
+        "tpm": 1000000,
+
+        "json_mode": True,
+
+        "stream_format": "dashscope",  # 流式分片为 DashScope 原生 output 结构，其余提供商为 OpenAI 兼容的 choices[].delta
+
+        "headers": lambda key: {
+
+            "Authorization": f"Bearer {key}", 
+
+            "Content-Type": "application/json",
+
+            "X-DashScope-SSE": "enable",
+
+            "Accept": "text/event-stream"
+
+        },
+
+        "payload": lambda model, messages, **kw: {
+
+            "model": model, 
+
+            "input": {"messages": messages}, 
+
+            "parameters": {
+
+                "max_tokens": kw.get("max_tokens", 4096), 
+
+                "temperature": kw.get("temperature", 0.0),
+
+                "result_format": "message",
+
+                "incremental_output": True,
+
+                **({"response_format": {"type": "json_object"}} if kw.get("json_mode") else {}),
+
+            },
+
+        },
+
+    },
+
+}
+
+# ===============================
+# 模型选项（修正 Gemini 模型名称）
+# ===============================
+
+MODEL_OPTIONS = {
+
+    "DeepSeek Chat": {
+
+        "provider": "deepseek", 
+
+        "model": "deepseek-chat", 
+
+        "batch_size": 8,  # 批量处理时每次请求合并判定的词语数（大上下文模型可调大）
+
+        "api_key": os.getenv("DEEPSEEK_API_KEY"),
+
+        "env_var": "DEEPSEEK_API_KEY"
+
+    },
+
+    "OpenAI GPT-4o（推荐）": {
+
+        "provider": "openai", 
+
+        "model": "gpt-4o-mini", 
+
+        "batch_size": 10,
+
+        "api_key": os.getenv("OPENAI_API_KEY"),
+
+        "env_var": "OPENAI_API_KEY"
+
+    },
+
+    "Google Gemini 1.5 Pro": {
+
+        "provider": "gemini", 
+
+        "model": "models/gemini-1.5-pro",  # 关键点：增加 models/ 前缀
+
+        "batch_size": 10,
+
+        "api_key": os.getenv("GEMINI_API_KEY"),
+
+        "env_var": "GEMINI_API_KEY"
+
+    },
+
+    "Google Gemini 1.5 Flash": {
+
+        "provider": "gemini", 
+
+        "model": "models/gemini-1.5-flash", # 关键点：增加 models/ 前缀
+
+        "batch_size": 10,
+
+        "api_key": os.getenv("GEMINI_API_KEY"),
+
+        "env_var": "GEMINI_API_KEY"
+
+    },
+
+    "Moonshot（Kimi）": {
+
+        "provider": "moonshot", 
+
+        "model": "moonshot-v1-32k", 
+
+        "batch_size": 20,
+
+        "api_key": os.getenv("MOONSHOT_API_KEY"),
+
+        "env_var": "MOONSHOT_API_KEY"
+
+    },
+
+    "Qwen（通义千问）": {
+
+        "provider": "qwen", 
+
+        "model": "qwen-max", 
+
+        "batch_size": 6,
+
+        "api_key": os.getenv("QWEN_API_KEY"),
+
+        "env_var": "QWEN_API_KEY"
+
+    },
+
+}
+
+AVAILABLE_MODEL_OPTIONS = {
+
+    name: info for name, info in MODEL_OPTIONS.items() if info["api_key"]
+
+}
+
+if not AVAILABLE_MODEL_OPTIONS:
+
+    AVAILABLE_MODEL_OPTIONS = MODEL_OPTIONS
+
+# ===============================
+# 提供商配置项（可用环境变量 LLD_<KEY>_<PROVIDER> 覆盖）
+# ===============================
+
+def get_provider_setting(provider: str, key: str, default):
+
+    """读取提供商配置项，可用环境变量 LLD_<KEY>_<PROVIDER> 覆盖（如 LLD_RPM_DEEPSEEK）"""
+
+    value = MODEL_CONFIGS.get(provider, {}).get(key, default)
+
+    env_name = f"LLD_{key.upper()}_{provider.upper()}"
+
+    override = os.getenv(env_name)
+
+    if override:
+
+        try:
+
+            value = type(default)(override)
+
+        except ValueError:
+
+            logger.warning(f"忽略无效的配置 {env_name}={override}")
+
+    return value
+
+DEFAULT_CONCURRENCY = 4
+
+def get_provider_concurrency(provider: str) -> int:
+
+    """读取提供商的初始批量并发数，可用环境变量 LLD_CONCURRENCY_<PROVIDER> 覆盖"""
+
+    return max(1, get_provider_setting(provider, "concurrency", DEFAULT_CONCURRENCY))
+
+
+def get_provider_max_concurrency(provider: str) -> int:
+
+    """自适应并发的上限（默认为初始并发数的 4 倍），同时决定线程池与连接池大小"""
+
+    initial = get_provider_concurrency(provider)
+
+    return max(initial, get_provider_setting(provider, "max_concurrency", initial * 4))
+
+# ===============================
+# 增强型工具函数（解决中断核心）
+# ===============================
+
+def extract_text_from_response(resp_json: Dict[str, Any]) -> str:
+
+    """从不同格式的LLM响应中安全提取文本内容。"""
+
+    if not isinstance(resp_json, dict):
+
+        return ""
+
+    try:
+
+        if "output" in resp_json and "text" in resp_json["output"]:
+
+            return resp_json["output"]["text"]
+
+        if "choices" in resp_json and len(resp_json["choices"]) > 0:
+
+            choice = resp_json["choices"][0]
+
+            if "message" in choice and "content" in choice["message"]:
+
+                return choice["message"]["content"]
+
+        return json.dumps(resp_json, ensure_ascii=False)
+
+    except Exception as e:
+
+        logger.error(f"提取响应文本失败: {e}")
+
+        return json.dumps(resp_json, ensure_ascii=False)
+
+def extract_json_from_text(text: str) -> Tuple[Dict[str, Any], str]:
+
+    """从混合文本中提取并解析JSON对象。"""
+
+    match = re.search(r"(\{.*\})", text.strip(), re.DOTALL)
+
+    if not match:
+
+        return None, text
+
+    json_text = match.group(1).strip()
+
+    try:
+
+        parsed_json = json.loads(json_text)
+
+        return parsed_json, json_text
+
+    except json.JSONDecodeError as e:
+
+        logger.error(f"解析JSON失败: {e}, 原始文本: {json_text[:100]}")
+
+        return None, json_text
+
+def normalize_key(k: str, pos_rules: list) -> str:
+
+    """标准化模型返回的规则名称"""
+
+    if not isinstance(k, str): return None
+
+    rule_set = get_rule_set()
+
+    pos = rule_set.pos_of(pos_rules)
+
+    if pos is not None:
+
+        index = rule_set.slot(pos, k)
+
+        return None if index is None else rule_set.names[index]
+
+    k_norm = RULE_KEY_STRIP.sub('', k).upper()
+
+    for r in pos_rules:
+
+        r_norm = RULE_KEY_STRIP.sub('', r["name"]).upper()
+
+        if r_norm == k_norm:
+
+            return r["name"]
+
+    return None
+
+def rule_code(rule_name: str) -> str:
+
+    """规则编号，如 N1_可受数量词修饰 -> N1"""
+
+    return rule_name.split("_", 1)[0].upper()
+
+def resolve_rule_key(k: str, pos_rules: list) -> str:
+
+    """按完整规则名或规则编号（N1、V2、NV10 等）匹配模型返回的键"""
+
+    rule_set = get_rule_set()
+
+    pos = rule_set.pos_of(pos_rules)
+
+    if pos is not None:
+
+        index = rule_set.slot(pos, k, codes=True)
+
+        return None if index is None else rule_set.names[index]
+
+    normalized_key = normalize_key(k, pos_rules)
+
+    if normalized_key or not isinstance(k, str):
+
+        return normalized_key
+
+    k_code = RULE_KEY_STRIP.sub('', k).upper()
+
+    for r in pos_rules:
+
+        if rule_code(r["name"]) == k_code:
+
+            return r["name"]
+
+    return None
+
+def is_boolean_verdict(raw_val) -> bool:
+
+    """判断模型返回值是否为可识别的是/否判定"""
+
+    if isinstance(raw_val, bool):
+
+        return True
+
+    if isinstance(raw_val, str):
+
+        return raw_val.strip().lower() in ("yes", "y", "true", "是", "√", "符合", "no", "n", "false", "否", "×", "不符合")
+
+    return False
+
+def map_to_allowed_score(rule: dict, raw_val) -> int:
+
+    """将模型返回值映射为规则得分"""
+
+    match_score, mismatch_score = rule["match_score"], rule["mismatch_score"]
+
+    try:
+
+        if isinstance(raw_val, bool):
+
+            return match_score if raw_val else mismatch_score
+
+        if isinstance(raw_val, str):
+
+            s = raw_val.strip().lower()
+
+            if s in ("yes", "y", "true", "是", "√", "符合"):
+
+                return match_score
+
+            if s in ("no", "n", "false", "否", "×", "不符合"):
+
+                return mismatch_score
+
+        if isinstance(raw_val, (int, float)):
+
+            raw_val_int = int(raw_val)
+
+            if raw_val_int == match_score: return match_score
+
+            if raw_val_int == mismatch_score: return mismatch_score
+
+    except Exception as e:
+
+        logger.error(f"映射得分失败: {e}")
+
+    return mismatch_score
+
+def calculate_membership(scores_all: Dict[str, Dict[str, int]]) -> Dict[str, float]:
+
+    """计算隶属度"""
+
+    membership = {}
+
+    try:
+
+        for pos, scores in scores_all.items():
+
+            total_score = sum(scores.values())
+
+            normalized = total_score / 100
+
+            membership[pos] = max(-1.0, min(1.0, normalized))
+
+    except Exception as e:
+
+        logger.error(f"计算隶属度失败: {e}")
+
+    return membership
+
+def scores_from_verdicts(raw_scores: Dict[str, Any]) -> Dict[str, Dict[str, int]]:
+
+    """把单词判定返回的 scores 映射为规则得分，缺失的规则记 0 分；scores 结构无效时返回空字典。
+
+    完整规则名与规则编号均可识别（两种模式相同），与写入历史记录「规则判定」列的 verdicts_from_text 一致，
+    重新计分时由保存的判定得到的隶属度与写入时相同。
+    """
+
+    if not isinstance(raw_scores, dict):
+
+        logger.error(f"处理得分失败: scores 不是对象（{type(raw_scores).__name__}）")
+
+        return {}
+
+    rule_set = get_rule_set()
+
+    return rule_set.scores(rule_set.verdict_vector(raw_scores, codes=True))
+
+def get_top_10_positions(membership: Dict[str, float]) -> List[Tuple[str, float]]:
+
+    """获取隶属度最高的前 10 个词类"""
+
+    try:
+
+        return sorted(membership.items(), key=lambda x: x[1], reverse=True)[:10]
+
+    except Exception as e:
+
+        logger.error(f"排序隶属度失败: {e}")
+
+        return []
+
+# ===============================
+# 编译后的规则集（规则名索引与向量化计分）
+# ===============================
+
+RULE_KEY_STRIP = re.compile(r"[\s_]+")
+
+class RuleSet:
+
+    """RULE_SETS 编译一次后的只读视图。
+
+    所有规则按 (词类, 规则) 顺序排成一行，每条规则占一个下标；规范化规则名与规则编号各建一张索引，
+    模型返回的键只需一次正则和一次字典查找即可定位。单个词语的判定表示为判定向量（1 符合、-1 不符合、0 缺失），
+    N 个词语的判定向量组成 N×R 矩阵，一次矩阵乘法即可算出全部隶属度（numpy 在首次使用时导入）。
+    """
+
+    def __init__(self, rule_sets: Dict[str, List[Dict[str, Any]]]):
+
+        self.pos_names = list(rule_sets)
+
+        self.rules = [(pos, rule) for pos, rules in rule_sets.items() for rule in rules]
+
+        self.names = [rule["name"] for _, rule in self.rules]
+
+        self.match_scores = [rule["match_score"] for _, rule in self.rules]
+
+        self.mismatch_scores = [rule["mismatch_score"] for _, rule in self.rules]
+
+        self.pos_slices = {}
+
+        self._by_name = {pos: {} for pos in self.pos_names}
+
+        self._by_code = {pos: {} for pos in self.pos_names}
+
+        self._by_list = {id(rules): pos for pos, rules in rule_sets.items()}
+
+        self._weights = None
+
+        # 规则布局版本：只取决于规则名及其顺序（即判定向量每一位的含义），分值调整不改变布局
+
+        self.layout = hashlib.sha256("\n".join(self.names).encode("utf-8")).hexdigest()[:8]
+
+        for index, (pos, rule) in enumerate(self.rules):
+
+            # 原样的规则名也登记一份，模型照抄规则名时无需执行正则
+
+            self._by_name[pos][rule["name"]] = index
+
+            self._by_name[pos][RULE_KEY_STRIP.sub("", rule["name"]).upper()] = index
+
+            self._by_code[pos][rule_code(rule["name"])] = index
+
+            start, _ = self.pos_slices.get(pos, (index, index))
+
+            self.pos_slices[pos] = (start, index + 1)
+
+    def __len__(self) -> int:
+
+        return len(self.rules)
+
+    def pos_of(self, pos_rules: list) -> str:
+
+        """RULE_SETS 中某个词类的规则列表对应的词类名；不是其中的列表时返回 None"""
+
+        return self._by_list.get(id(pos_rules))
+
+    def slot(self, pos: str, key, codes: bool = False) -> int:
+
+        """模型返回的键在规则行中的下标：按完整规则名匹配，codes 为 True 时也接受规则编号；无法识别时返回 None"""
+
+        if not isinstance(key, str):
+
+            return None
+
+        index = self._by_name[pos].get(key)
+
+        if index is not None:
+
+            return index
+
+        key_norm = RULE_KEY_STRIP.sub("", key).upper()
+
+        index = self._by_name[pos].get(key_norm)
+
+        if index is None and codes:
+
+            index = self._by_code[pos].get(key_norm)
+
+        return index
+
+    def verdict_vector(self, raw_scores: Dict[str, Any], codes: bool = False, strict: bool = False) -> List[int]:
+
+        """把模型返回的 scores 映射为判定向量（1 符合、-1 不符合、0 缺失）。
+
+        strict 为 True 时只接受是/否判定，其余取值视为缺失（合并判定与完整性检测）；
+        否则按 map_to_allowed_score 的规则映射，无法识别的取值记为不符合（单词判定）。
+        """
+
+        vector = [0] * len(self.rules)
+
+        if not isinstance(raw_scores, dict):
+
+            return vector
+
+        for pos in self.pos_names:
+
+            raw_pos_scores = raw_scores.get(pos)
+
+            if not isinstance(raw_pos_scores, dict):
+
+                continue
+
+            for key, value in raw_pos_scores.items():
+
+                index = self.slot(pos, key, codes)
+
+                if index is None:
+
+                    continue
+
+                if value is True or value is False:
+
+                    vector[index] = 1 if value else -1
+
+                elif not strict or is_boolean_verdict(value):
+
+                    rule = self.rules[index][1]
+
+                    vector[index] = 1 if map_to_allowed_score(rule, value) == rule["match_score"] else -1
+
+        return vector
+
+    def scores(self, vector: List[int], skip_missing: bool = False) -> Dict[str, Dict[str, int]]:
+
+        """判定向量 -> {词类: {规则名: 得分}}，缺失的规则记 0 分（skip_missing 为 True 时不列出）"""
+
+        scores_out = {pos: {} for pos in self.pos_names}
+
+        for index, verdict in enumerate(vector):
+
+            if skip_missing and not verdict:
+
+                continue
+
+            scores_out[self.rules[index][0]][self.names[index]] = self.match_scores[index] if verdict > 0 else self.mismatch_scores[index] if verdict < 0 else 0
+
+        return scores_out
+
+    def missing(self, vector: List[int]) -> List[str]:
+
+        """判定向量中缺失的规则名"""
+
+        return [self.names[index] for index, verdict in enumerate(vector) if not verdict]
+
+    def membership(self, vector: List[int]) -> Dict[str, float]:
+
+        """单个词语的隶属度（纯 Python，与 calculate_membership(self.scores(vector)) 一致）"""
+
+        membership = {}
+
+        for pos, (start, end) in self.pos_slices.items():
+
+            total = sum(
+
+                self.match_scores[i] if vector[i] > 0 else self.mismatch_scores[i] if vector[i] < 0 else 0
+
+                for i in range(start, end)
+
+            )
+
+            membership[pos] = max(-1.0, min(1.0, total / 100))
+
+        return membership
+
+    def encode(self, vector: List[int]) -> str:
+
+        """判定向量的紧凑文本：「布局版本:符合位掩码:已判定位掩码」（十六进制），如 1a2b3c4d:5a3f1b2:7ffffff"""
+
+        matched = sum(1 << index for index, verdict in enumerate(vector) if verdict > 0)
+
+        judged = sum(1 << index for index, verdict in enumerate(vector) if verdict)
+
+        return f"{self.layout}:{matched:x}:{judged:x}"
+
+    def _masks(self, text) -> Tuple[int, int]:
+
+        """解析 encode 的结果；布局版本不一致或格式无效时返回 None"""
+
+        if not isinstance(text, str):
+
+            return None
+
+        parts = text.split(":")
+
+        if len(parts) != 3 or parts[0] != self.layout:
+
+            return None
+
+        try:
+
+            return int(parts[1], 16), int(parts[2], 16)
+
+        except ValueError:
+
+            return None
+
+    def decode(self, text: str) -> List[int]:
+
+        """encode 的逆运算；布局版本不一致（规则增删、改名或调整顺序）或格式无效时返回 None"""
+
+        masks = self._masks(text)
+
+        if masks is None:
+
+            return None
+
+        matched, judged = masks
+
+        return [(1 if matched >> index & 1 else -1) if judged >> index & 1 else 0 for index in range(len(self.rules))]
+
+    def verdict_matrix(self, texts: List[str]):
+
+        """一批 encode 文本 -> (N×R 判定矩阵, 可解析的行)；位展开由 numpy 一次完成，无法解析的行全为 0"""
+
+        import numpy as np
+
+        masks = [self._masks(text) for text in texts]
+
+        valid = np.asarray([m is not None for m in masks], dtype=bool)
+
+        if len(self.rules) > 63:
+
+            matrix = np.asarray([self.decode(text) or [0] * len(self.rules) for text in texts], dtype=np.int8).reshape(-1, len(self.rules))
+
+            return matrix, valid
+
+        matched = np.asarray([m[0] if m else 0 for m in masks], dtype=np.uint64)
+
+        judged = np.asarray([m[1] if m else 0 for m in masks], dtype=np.uint64)
+
+        shifts = np.arange(len(self.rules), dtype=np.uint64)
+
+        matched_bits = ((matched[:, None] >> shifts) & np.uint64(1)).astype(np.int8)
+
+        judged_bits = ((judged[:, None] >> shifts) & np.uint64(1)).astype(np.int8)
+
+        return judged_bits * (2 * matched_bits - 1), valid
+
+    def weight_matrix(self):
+
+        """(2R, P) 权重矩阵：判定取值 v 的得分为 |v|·(符合分+不符合分)/2 + v·(符合分-不符合分)/2，
+        上半部分乘 |V|、下半部分乘 V，再按词类求和"""
+
+        if self._weights is None:
+
+            import numpy as np
+
+            match = np.asarray(self.match_scores, dtype=np.float64)
+
+            mismatch = np.asarray(self.mismatch_scores, dtype=np.float64)
+
+            pos_index = np.asarray([self.pos_names.index(pos) for pos, _ in self.rules])
+
+            onehot = np.zeros((len(self.rules), len(self.pos_names)))
+
+            onehot[np.arange(len(self.rules)), pos_index] = 1.0
+
+            self._weights = np.vstack([onehot * ((match + mismatch) / 2)[:, None], onehot * ((match - mismatch) / 2)[:, None]])
+
+        return self._weights
+
+    def membership_matrix(self, verdicts):
+
+        """N 个词语的判定矩阵（N×R，取值 1/-1/0）-> N×P 隶属度矩阵，列顺序与 pos_names 一致"""
+
+        import numpy as np
+
+        matrix = np.asarray(verdicts, dtype=np.float64).reshape(-1, len(self.rules))
+
+        # 先求整数总分再除以 100，结果与 calculate_membership 逐位相同
+
+        return np.clip(np.hstack([np.abs(matrix), matrix]) @ self.weight_matrix() / 100, -1.0, 1.0)
+
+@functools.lru_cache(maxsize=8)
+
+def _compile_rule_set(version: str) -> RuleSet:
+
+    return RuleSet(RULE_SETS)
+
+def get_rule_set() -> RuleSet:
+
+    """当前规则集版本对应的编译结果"""
+
+    return _compile_rule_set(_RULE_SET_VERSION)
+
+def verdicts_from_text(raw_text: str, rule_set: RuleSet = None) -> List[int]:
+
+    """从保存的原始响应中恢复判定向量（规则名与规则编号均可识别）；无法解析时返回 None。
+    批量调用时传入 rule_set，省去每次按规则集版本查找编译结果"""
+
+    parsed, _ = extract_json_from_text(raw_text or "")
+
+    if not isinstance(parsed, dict) or not isinstance(parsed.get("scores"), dict):
+
+        return None
+
+    return (rule_set or get_rule_set()).verdict_vector(parsed["scores"], codes=True)
+
+def vote_verdicts(vectors: List[List[int]], weights: List[float] = None) -> List[int]:
+
+    """多个模型的判定向量逐条规则加权投票：符合计 +权重、不符合计 -权重、缺失弃权。
+    票数持平时采用排在最前、且对该规则作出判定的模型的结果；所有模型都未判定的规则仍为 0"""
+
+    weights = weights or [1.0] * len(vectors)
+
+    combined = []
+
+    for column in zip(*vectors):
+
+        total = sum(weight * verdict for weight, verdict in zip(weights, column))
+
+        if total:
+
+            combined.append(1 if total > 0 else -1)
+
+        else:
+
+            combined.append(next((verdict for verdict in column if verdict), 0))
+
+    return combined
+
+def vote_predicted_pos(predictions: List[str], weights: List[float] = None, membership: Dict[str, float] = None) -> str:
+
+    """各模型预测词类的加权多数；票数持平时取集成隶属度较高者，仍持平时取排在最前的模型的预测"""
+
+    weights = weights or [1.0] * len(predictions)
+
+    tally = {}
+
+    for pos, weight in zip(predictions, weights):
+
+        if pos in RULE_SETS:
+
+            tally[pos] = tally.get(pos, 0.0) + weight
+
+    if not tally:
+
+        return predictions[0] if predictions else "未知"
+
+    best = max(tally.values())
+
+    tied = [pos for pos, total in tally.items() if total == best]
+
+    if len(tied) > 1 and membership:
+
+        return max(tied, key=lambda pos: membership.get(pos, 0.0))
+
+    return tied[0]
+
+# ===============================
+# 提示词模板（按规则集版本预编译，静态前缀便于提供商缓存）
+# ===============================
+
+def rule_set_version(rule_sets: Dict[str, List[Dict[str, Any]]] = None) -> str:
+
+    """规则集版本：规则名称、描述与分值的哈希，任一改动都会生成新版本。
+
+    不传 rule_sets 时返回当前 RULE_SETS 的版本：导入时计算一次，查找编译结果与写历史记录时不再重新序列化；
+    运行中修改 RULE_SETS 后须调用 reload_rule_sets()。
+    """
+
+    if rule_sets is None:
+
+        return _RULE_SET_VERSION
+
+    payload = json.dumps(rule_sets, ensure_ascii=False, sort_keys=True)
+
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:12]
+
+def reload_rule_sets() -> str:
+
+    """运行中修改 RULE_SETS 后调用：重新计算版本，此后的 get_rule_set() 与提示词按新版本重新编译；返回新版本"""
+
+    global _RULE_SET_VERSION
+
+    _RULE_SET_VERSION = rule_set_version(RULE_SETS)
+
+    return _RULE_SET_VERSION
+
+_RULE_SET_VERSION = rule_set_version(RULE_SETS)
+
+@functools.lru_cache(maxsize=8)
+
+def _compile_prompt_templates(version: str) -> Dict[str, str]:
+
+    """把当前 RULE_SETS 编译为逐字节固定的提示词；词语只出现在末尾的用户消息中"""
+
+    full_rules_by_pos = {
+
+        pos: "\n".join([f"- {r['name']}: {r['desc']}（符合: {r['match_score']} 分，不符合: {r['mismatch_score']} 分）" for r in rules])
+
+        for pos, rules in RULE_SETS.items()
+
+    }
+
+    rules_prefix = f"""你是一名中文词法与语法方面的专家。现在要分析给定词语在下列词类中的表现：
+
+- 需要判断的词类：名词、动词、名动词
+
+- 评分规则已经由系统定义，你**不要**自己设计分值，也**不要**在 JSON 中给出具体数字分数。程序将根据你的判断（true/false）自动赋值。
+
+- 你只需要判断每一条规则是"符合"还是"不符合"。
+
+【各词类的规则说明（仅供你判断使用）】
+
+【名词】
+
+{full_rules_by_pos["名词"]}
+
+【动词】
+
+{full_rules_by_pos["动词"]}
+
+【名动词】
+
+{full_rules_by_pos["名动词"]}
+
+"""
+
+    single_requirements = """【输出要求】
+
+1. 在 explanation 字段中，必须**逐条规则**说明判断依据，并举例（可以自己造句）：
+
+   - 格式示例：
+
+     - 「名词-N1_可受数量词修饰：符合。理由：……。例句：……。」
+
+     - 「动词-V2_可后附/插入时体助词'着/了/过'：不符合。理由：……。例句：……。」
+
+   - explanation 里要覆盖 **三个词类的所有规则**，不能只写几条。
+
+2. 在 JSON 中的 scores 字段里：
+
+   - 每一类下的每一条规则，只能给出 **布尔值 true / false**，表示是否符合该规则
+
+   - 严禁在 scores 里使用数值分数（例如 0, 5, 10 等）
+
+   - 如果你不确定，也必须做出判断（true 或 false），不要用 null、0 或其它值
+
+   - JSON 结构必须是：{"explanation": "...", "predicted_pos": "...", "scores": {"名词": {...}, "动词": {...}, "名动词": {...}}}
+
+3. predicted_pos：
+
+   - 请选择「名词」「动词」「名动词」之一，作为该词语最典型的词类。
+
+4. **最后输出时，先写详细的文字推理，最后单独且完整地给出一段合法的 JSON（不要再加注释）。**
+
+"""
+
+    batch_requirements = """【输出要求】
+
+1. 只输出一个合法的 JSON 数组，不要输出推理过程、注释或其它文字。数组中每个元素对应一个词语，顺序与输入一致，不能遗漏任何词语。
+
+2. 每个元素的结构必须是：{"word": "词语", "predicted_pos": "名词/动词/名动词之一", "explanation": "一句话说明主要依据", "scores": {"名词": {"N1": true, ...}, "动词": {"V1": false, ...}, "名动词": {"NV1": true, ...}}}
+
+3. scores 中以规则编号（规则名称中下划线前的部分，如 N1、V2、NV10）为键，必须覆盖三个词类的**全部规则**，取值只能是布尔值 true / false；不确定时也必须做出判断。
+
+"""
+
+    single_user = """
+请严格按照上述要求分析下面给出的词语。
+
+特别注意：
+
+- 在 JSON 的 scores 部分，只能用 true/false 表示"是否符合规则"，不能使用任何数字。
+
+- explanation 中必须对每一条规则写明"符合/不符合 + 理由 + 例句"。
+
+请先给出详细推理过程，然后在最后单独输出一个 JSON 对象。
+
+"""
+
+    batch_user = """
+请严格按照上述要求分析下面列出的全部词语（words），并输出 JSON 数组：
+
+"""
+
+    # 精简模式：只要布尔判定，不要逐条说明；输出为顶层 JSON 对象，可配合提供商的原生 JSON 输出模式
+
+    lean_requirements = """【输出要求】
+
+1. 只输出一个合法的 JSON 对象，不要输出推理过程、说明、注释或其它文字。
+
+2. 结构必须是：{"predicted_pos": "名词/动词/名动词之一", "scores": {"名词": {"N1": true, ...}, "动词": {"V1": false, ...}, "名动词": {"NV1": true, ...}}}
+
+3. scores 中以规则编号（规则名称中下划线前的部分，如 N1、V2、NV10）为键，必须覆盖三个词类的**全部规则**，取值只能是布尔值 true / false；不确定时也必须做出判断。
+
+"""
+
+    lean_batch_requirements = """【输出要求】
+
+1. 只输出一个合法的 JSON 对象，不要输出推理过程、说明、注释或其它文字。
+
+2. 结构必须是：{"results": [{"word": "词语", "predicted_pos": "名词/动词/名动词之一", "scores": {"名词": {"N1": true, ...}, "动词": {"V1": false, ...}, "名动词": {"NV1": true, ...}}}, ...]}，results 中每个元素对应一个词语，顺序与输入一致，不能遗漏任何词语。
+
+3. scores 中以规则编号（规则名称中下划线前的部分，如 N1、V2、NV10）为键，必须覆盖三个词类的**全部规则**，取值只能是布尔值 true / false；不确定时也必须做出判断。
+
+"""
+
+    lean_user = """
+请严格按照上述要求判定下面给出的词语，只输出 JSON：
+
+"""
+
+    lean_batch_user = """
+请严格按照上述要求判定下面列出的全部词语，只输出 JSON：
+
+"""
+
+    return {
+
+        "version": version,
+
+        "single_system": rules_prefix + single_requirements,
+
+        "single_user": single_user,
+
+        "batch_system": rules_prefix + batch_requirements,
+
+        "batch_user": batch_user,
+
+        "lean_system": rules_prefix + lean_requirements,
+
+        "lean_user": lean_user,
+
+        "lean_batch_system": rules_prefix + lean_batch_requirements,
+
+        "lean_batch_user": lean_batch_user,
+
+    }
+
+def get_prompt_templates() -> Dict[str, str]:
+
+    """当前规则集版本对应的预编译提示词"""
+
+    return _compile_prompt_templates(_RULE_SET_VERSION)
+
+def build_single_word_messages(word: str, lean: bool = False) -> List[Dict[str, str]]:
+
+    """单词判定消息：系统消息为静态前缀，词语位于用户消息末尾；lean=True 时只要求输出布尔判定"""
+
+    templates = get_prompt_templates()
+
+    prefix = "lean" if lean else "single"
+
+    return [
+
+        {"role": "system", "content": templates[f"{prefix}_system"]},
+
+        {"role": "user", "content": templates[f"{prefix}_user"] + f"待分析词语：「{word}」\n"}
+
+    ]
+
+def build_batch_messages(words: List[str], lean: bool = False) -> List[Dict[str, str]]:
+
+    """合并判定消息：与单词判定共用规则前缀，词语列表位于用户消息末尾；lean=True 时结果不含说明"""
+
+    templates = get_prompt_templates()
+
+    prefix = "lean_batch" if lean else "batch"
+
+    word_lines = "\n".join(f"{i + 1}. 「{w}」" for i, w in enumerate(words))
+
+    return [
+
+        {"role": "system", "content": templates[f"{prefix}_system"]},
+
+        {"role": "user", "content": templates[f"{prefix}_user"] + f"共 {len(words)} 个词语：\n{word_lines}\n"}
+
+    ]
+
+def normalize_usage(usage: Dict[str, Any]) -> Dict[str, int]:
+
+    """统一各提供商的用量字段，含命中前缀缓存的输入 token 数"""
+
+    if not isinstance(usage, dict):
+
+        return {}
+
+    details = usage.get("prompt_tokens_details") or usage.get("input_tokens_details") or {}
+
+    cached = usage.get("prompt_cache_hit_tokens")  # DeepSeek
+
+    if cached is None:
+
+        cached = details.get("cached_tokens", usage.get("cached_tokens", 0))  # OpenAI / Qwen / Moonshot
+
+    return {
+
+        "prompt_tokens": int(usage.get("prompt_tokens", usage.get("input_tokens", 0)) or 0),
+
+        "completion_tokens": int(usage.get("completion_tokens", usage.get("output_tokens", 0)) or 0),
+
+        "cached_tokens": int(cached or 0),
+
+    }
+
+# ===============================
+# 多词合并判定结果解析
+# ===============================
+
+BATCH_MAX_TOKENS_PER_WORD = 400
+
+BATCH_MAX_TOKENS_CAP = 8192
+
+# 精简模式（只输出布尔判定）的输出上限：三个词类 27 条规则的判定约 200 token
+
+LEAN_MAX_TOKENS = 512
+
+LEAN_BATCH_MAX_TOKENS_PER_WORD = 200
+
+LEAN_EXPLANATION = "精简模式：未请求逐条说明，可在页面中按需获取。"
+
+def get_model_batch_size(provider: str, model: str) -> int:
+
+    """读取模型每次请求合并判定的词语数，可用环境变量 LLD_BATCH_SIZE 统一覆盖"""
+
+    override = os.getenv("LLD_BATCH_SIZE")
+
+    if override:
+
+        try:
+
+            return max(1, int(override))
+
+        except ValueError:
+
+            logger.warning(f"忽略无效的配置 LLD_BATCH_SIZE={override}")
+
+    for info in MODEL_OPTIONS.values():
+
+        if info["provider"] == provider and info["model"] == model:
+
+            return max(1, int(info.get("batch_size", 1)))
+
+    return 1
+
+def extract_json_array_from_text(text: str):
+
+    """从混合文本中提取 JSON 数组；兼容 {"results": [...]} 形式的包裹对象"""
+
+    match = re.search(r"(\[.*\])", text.strip(), re.DOTALL)
+
+    if match:
+
+        try:
+
+            parsed = json.loads(match.group(1))
+
+            if isinstance(parsed, list):
+
+                return parsed
+
+        except json.JSONDecodeError as e:
+
+            logger.error(f"解析JSON数组失败: {e}, 原始文本: {match.group(1)[:100]}")
+
+    parsed_obj, _ = extract_json_from_text(text)
+
+    if isinstance(parsed_obj, dict):
+
+        for value in parsed_obj.values():
+
+            if isinstance(value, list):
+
+                return value
+
+    return None
+
+def parse_batch_item(item: Dict[str, Any]) -> Tuple[Dict[str, Dict[str, int]], List[str]]:
+
+    """把单个词语的判定结果映射为得分，并返回缺失或无法识别的规则"""
+
+    rule_set = get_rule_set()
+
+    vector = rule_set.verdict_vector(item.get("scores"), codes=True, strict=True)
+
+    return rule_set.scores(vector, skip_missing=True), rule_set.missing(vector)
+
+# ===============================
+# 流式输出的判定完整性检测（判定 JSON 完整到达后即可提前结束读取）
+# ===============================
+
+def is_complete_verdict(value) -> bool:
+
+    """单词判定 JSON 是否完整：含 predicted_pos，scores 按完整规则名覆盖三个词类的全部规则且取值均为是/否"""
+
+    if not isinstance(value, dict) or "predicted_pos" not in value or not isinstance(value.get("scores"), dict):
+
+        return False
+
+    return all(get_rule_set().verdict_vector(value["scores"], strict=True))
+
+def is_complete_coded_verdict(value) -> bool:
+
+    """按规则编号给出的判定（合并判定的单个元素、精简模式的单词判定）是否完整"""
+
+    return isinstance(value, dict) and "predicted_pos" in value and all(get_rule_set().verdict_vector(value.get("scores"), codes=True, strict=True))
+
+def is_complete_batch_verdict(value, words: List[str]) -> bool:
+
+    """合并判定 JSON 数组是否完整：每个待判定词语都有一条覆盖全部规则的结果"""
+
+    if not isinstance(value, list):
+
+        return False
+
+    complete = {str(item.get("word", "")).strip() for item in value if is_complete_coded_verdict(item)}
+
+    return all(w in complete for w in words)
+
+def is_valid_verdict_text(raw_text: str) -> bool:
+
+    """单词判定响应能否写入响应缓存：能解析出判定 JSON，且按规则名或规则编号覆盖全部规则"""
+
+    parsed_json, _ = extract_json_from_text(raw_text or "")
+
+    return is_complete_coded_verdict(parsed_json)
+
+def is_valid_batch_verdict_text(raw_text: str, words: List[str]) -> bool:
+
+    """合并判定响应能否写入响应缓存：每个待判定词语都有完整的判定"""
+
+    return is_complete_batch_verdict(extract_json_array_from_text(raw_text or ""), words)
+
+class VerdictStreamDetector:
+
+    """逐段接收模型输出，在判定 JSON 完整出现时返回 True。
+
+    记录每个开括号的位置；每收到一个对应的闭括号，就从这些位置（由外向内）尝试解析到当前位置为止的文本，
+    解析成功且通过 is_complete 校验即判定完成。闭括号在判定文本中只出现数次，解析开销可以忽略。
+    """
+
+    def __init__(self, is_complete: Callable[[Any], bool], opener: str = "{"):
+
+        self.is_complete = is_complete
+
+        self.opener = opener
+
+        self.closer = {"{": "}", "[": "]"}[opener]
+
+        self.result = None
+
+        self._chunks = []
+
+        self._length = 0
+
+        self._starts = []
+
+    def feed(self, delta: str) -> bool:
+
+        if self.result is not None:
+
+            return True
+
+        if not delta:
+
+            return False
+
+        base = self._length
+
+        self._chunks.append(delta)
+
+        self._length += len(delta)
+
+        text = None
+
+        for offset, ch in enumerate(delta):
+
+            if ch == self.opener:
+
+                self._starts.append(base + offset)
+
+            elif ch == self.closer and self._starts:
+
+                if text is None:
+
+                    text = "".join(self._chunks)
+
+                    self._chunks = [text]
+
+                end = base + offset + 1
+
+                for start in self._starts:
+
+                    try:
+
+                        value = json.loads(text[start:end])
+
+                    except ValueError:
+
+                        continue
+
+                    if self.is_complete(value):
+
+                        self.result = value
+
+                        return True
+
+        return False
@@ -0,0 +1,418 @@
+"""运行指标：计数器与直方图，按 Prometheus 文本格式导出（HTTP 端点或定期写文件），并提供近期样本的分位数供页面展示。
+
+只依赖标准库；接口与 prometheus_client 相近（metric.labels(...).inc() / .observe()），但不需要安装它。
+"""
+
+import math
+
+import os
+
+import tempfile
+
+import threading
+
+import time
+
+from collections import deque
+
+from typing import Dict, List, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+QUANTILE_WINDOW = 1024  # 每个直方图序列保留的最近样本数，用于计算 p50/p95/p99
+
+def percentile(samples, q: float) -> float:
+
+    """最近邻秩法分位数；samples 为空时返回 0"""
+
+    ordered = sorted(samples)
+
+    if not ordered:
+
+        return 0.0
+
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))]
+
+def _escape(value: str) -> str:
+
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+
+    if extra:
+
+        pairs.append(extra)
+
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+
+    if value == math.inf:
+
+        return "+Inf"
+
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+class _CounterChild:
+
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+
+        self.value = 0.0
+
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+
+        with self._lock:
+
+            self.value += amount
+
+class _HistogramChild:
+
+    __slots__ = ("buckets", "counts", "sum", "count", "recent", "_lock")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+
+        self.buckets = buckets
+
+        self.counts = [0] * len(buckets)
+
+        self.sum = 0.0
+
+        self.count = 0
+
+        self.recent = deque(maxlen=QUANTILE_WINDOW)
+
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+
+        with self._lock:
+
+            for index, bound in enumerate(self.buckets):
+
+                if value <= bound:
+
+                    self.counts[index] += 1
+
+                    break
+
+            self.sum += value
+
+            self.count += 1
+
+            self.recent.append(value)
+
+    def quantiles(self, qs: Sequence[float] = (0.5, 0.95, 0.99)) -> List[float]:
+
+        with self._lock:
+
+            samples = list(self.recent)
+
+        return [percentile(samples, q) for q in qs]
+
+class _Metric:
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+
+        self.name = name
+
+        self.documentation = documentation
+
+        self.labelnames = tuple(labelnames)
+
+        self._children = {}
+
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+
+        """按标签取值（顺序与 labelnames 一致）取得一个序列，首次使用时创建"""
+
+        key = tuple(str(value) for value in values)
+
+        child = self._children.get(key)
+
+        if child is None:
+
+            if len(key) != len(self.labelnames):
+
+                raise ValueError(f"{self.name} 需要标签 {self.labelnames}，实际为 {key}")
+
+            with self._lock:
+
+                child = self._children.setdefault(key, self._new_child())
+
+        return child
+
+    def series(self) -> Dict[Tuple[str, ...], object]:
+
+        with self._lock:
+
+            return dict(self._children)
+
+    def clear(self):
+
+        with self._lock:
+
+            self._children.clear()
+
+class Counter(_Metric):
+
+    kind = "counter"
+
+    def _new_child(self):
+
+        return _CounterChild()
+
+    def render(self) -> List[str]:
+
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.value)}" for key, child in sorted(self.series().items())]
+
+class Histogram(_Metric):
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+
+        super().__init__(name, documentation, labelnames)
+
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+
+        return _HistogramChild(self.buckets)
+
+    def render(self) -> List[str]:
+
+        lines = []
+
+        for key, child in sorted(self.series().items()):
+
+            with child._lock:
+
+                counts, total, count = list(child.counts), child.sum, child.count
+
+            cumulative = 0
+
+            for bound, bucket_count in zip(self.buckets, counts):
+
+                cumulative += bucket_count
+
+                le = 'le="%s"' % _format_value(bound)
+
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+
+            le = 'le="+Inf"'
+
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {count}")
+
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+
+        return lines
+
+class Registry:
+
+    """进程内的指标集合；同名指标只注册一次（重复导入模块时返回已有实例）"""
+
+    def __init__(self):
+
+        self._metrics = {}
+
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name, *args, **kwargs):
+
+        with self._lock:
+
+            metric = self._metrics.get(name)
+
+            if metric is None:
+
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+
+        return self._register(Counter, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def get(self, name: str):
+
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+
+        """Prometheus 文本格式（0.0.4）"""
+
+        lines = []
+
+        with self._lock:
+
+            metrics = list(self._metrics.values())
+
+        for metric in metrics:
+
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+
+            lines.extend(metric.render())
+
+        return "\n".join(lines) + "\n"
+
+    def clear(self):
+
+        """清空所有序列（指标定义保留）"""
+
+        with self._lock:
+
+            metrics = list(self._metrics.values())
+
+        for metric in metrics:
+
+            metric.clear()
+
+REGISTRY = Registry()
+
+# ===============================
+# 导出：HTTP 端点与文本文件
+# ===============================
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+def write_metrics_file(path, registry: Registry = REGISTRY):
+
+    """原子地写出 Prometheus 文本文件（可供 node_exporter 的 textfile 收集器读取）"""
+
+    directory = os.path.dirname(os.path.abspath(path))
+
+    fd, tmp_path = tempfile.mkstemp(prefix=".metrics-", dir=directory)
+
+    try:
+
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+
+            f.write(registry.render())
+
+        os.replace(tmp_path, path)
+
+    except BaseException:
+
+        if os.path.exists(tmp_path):
+
+            os.unlink(tmp_path)
+
+        raise
+
+_exporters = {}
+
+_exporters_lock = threading.Lock()
+
+def start_metrics_file_writer(path, interval: float = 15.0, registry: Registry = REGISTRY):
+
+    """后台线程每 interval 秒写一次指标文件；同一路径只启动一次"""
+
+    path = os.path.abspath(path)
+
+    def _loop():
+
+        while True:
+
+            try:
+
+                write_metrics_file(path, registry)
+
+            except OSError:
+
+                pass
+
+            time.sleep(interval)
+
+    with _exporters_lock:
+
+        if ("file", path) in _exporters:
+
+            return
+
+        thread = threading.Thread(target=_loop, name="metrics-file", daemon=True)
+
+        _exporters[("file", path)] = thread
+
+    thread.start()
+
+def start_metrics_server(port: int, host: str = "127.0.0.1", registry: Registry = REGISTRY):
+
+    """在后台线程中提供 GET /metrics；同一端口只启动一次，返回服务器实例"""
+
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+
+                self.send_error(404)
+
+                return
+
+            body = registry.render().encode("utf-8")
+
+            self.send_response(200)
+
+            self.send_header("Content-Type", PROMETHEUS_CONTENT_TYPE)
+
+            self.send_header("Content-Length", str(len(body)))
+
+            self.end_headers()
+
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+
+            pass
+
+    with _exporters_lock:
+
+        server = _exporters.get(("http", port))
+
+        if server is None:
+
+            server = ThreadingHTTPServer((host, port), MetricsHandler)
+
+            server.daemon_threads = True
+
+            threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+
+            _exporters[("http", port)] = server
+
+    return server
+
+def start_exporters_from_env():
+
+    """按环境变量启动导出：LLD_METRICS_PORT（HTTP /metrics）与 LLD_METRICS_FILE（定期写文件）"""
+
+    port = os.getenv("LLD_METRICS_PORT", "").strip()
+
+    if port:
+
+        start_metrics_server(int(port), os.getenv("LLD_METRICS_HOST", "127.0.0.1"))
+
+    path = os.getenv("LLD_METRICS_FILE", "").strip()
+
+    if path:
+
+        start_metrics_file_writer(path)
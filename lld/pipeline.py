@@ -0,0 +1,3954 @@
+"""词类判定流水线：LLM 调用、限流、响应缓存、并发批量执行、历史存储、词表读取与结果导出。
+
+本模块不依赖 Streamlit，可被页面（streamlit_app.py）、命令行批处理（python -m lld）与工作进程直接导入；
+requests、openpyxl 与 pandas 只在实际发起请求或读写工作簿时才导入，规则集、提示词与评分见 lld.core。
+"""
+
+import json
+
+import os
+
+import io
+
+import time
+
+import logging
+
+import fcntl
+
+import csv
+
+import codecs
+
+import struct
+
+import hashlib
+
+import tempfile
+
+import shutil
+
+import sqlite3
+
+import threading
+
+import random
+
+import itertools
+
+import functools
+
+import email.utils
+
+from collections import Counter, OrderedDict, deque
+
+from contextlib import contextmanager
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait as wait_futures
+
+from typing import Tuple, Dict, Any, List, Optional, Callable
+
+from pathlib import Path
+
+from lld import tracing
+
+from lld.metrics import REGISTRY, percentile
+
+from lld.sse import get_stream_adapter, iter_stream_deltas
+
+from lld.core import (
+    BATCH_MAX_TOKENS_CAP,
+    BATCH_MAX_TOKENS_PER_WORD,
+    MODEL_CONFIGS,
+    RULE_SETS,
+    build_batch_messages,
+    build_single_word_messages,
+    calculate_membership,
+    extract_json_array_from_text,
+    extract_json_from_text,
+    extract_text_from_response,
+    get_model_batch_size,
+    get_provider_concurrency,
+    get_provider_max_concurrency,
+    get_provider_setting,
+    get_rule_set,
+    is_complete_batch_verdict,
+    is_complete_coded_verdict,
+    is_complete_verdict,
+    is_valid_batch_verdict_text,
+    is_valid_verdict_text,
+    LEAN_BATCH_MAX_TOKENS_PER_WORD,
+    LEAN_EXPLANATION,
+    LEAN_MAX_TOKENS,
+    normalize_usage,
+    parse_batch_item,
+    rule_set_version,
+    scores_from_verdicts,
+    VerdictStreamDetector,
+    verdicts_from_text,
+    vote_predicted_pos,
+    vote_verdicts,
+)
+
+logger = logging.getLogger(__name__)
+
+def shared_resource(func):
+
+    """进程级共享实例（替代 st.cache_resource）：按参数各创建一次，加锁避免并发重复创建"""
+
+    instances = {}
+
+    lock = threading.Lock()
+
+    @functools.wraps(func)
+
+    def wrapper(*args):
+
+        with lock:
+
+            if args not in instances:
+
+                instances[args] = func(*args)
+
+            return instances[args]
+
+    wrapper.cache_clear = instances.clear
+
+    wrapper.instances = instances
+
+    return wrapper
+
+# ===============================
+# 运行指标（见 lld.metrics：Prometheus 文本格式导出，页面「运行指标」展示近期分位数）
+# ===============================
+
+LLM_REQUESTS = REGISTRY.counter("lld_llm_requests_total", "LLM 调用次数（outcome: success / cache_hit / error / cancelled）", ["provider", "model", "outcome"])
+
+LLM_RETRIES = REGISTRY.counter("lld_llm_retries_total", "LLM 请求的重试次数（cause: rate_limited / server_error / http_error / timeout / stalled / empty / exception）", ["provider", "model", "cause"])
+
+LLM_LATENCY = REGISTRY.histogram("lld_llm_request_seconds", "成功请求从发出到读完响应的耗时（秒）", ["provider", "model"])
+
+LLM_FIRST_BYTE = REGISTRY.histogram("lld_llm_first_byte_seconds", "从发出请求到收到首个输出分片的耗时（秒）", ["provider", "model"])
+
+LLM_TOKENS_PER_SECOND = REGISTRY.histogram("lld_llm_output_tokens_per_second", "首个输出分片之后的输出速度（token/秒）", ["provider", "model"], buckets=(5, 10, 20, 40, 60, 80, 120, 200, 400))
+
+LLM_TOKENS = REGISTRY.counter("lld_llm_tokens_total", "token 用量（kind: prompt / completion / cached）", ["provider", "model", "kind"])
+
+LLM_HEDGES = REGISTRY.counter("lld_llm_hedges_total", "对冲请求次数（winner: primary / secondary / none）", ["provider", "winner"])
+
+LLM_FAILOVER_REQUESTS = REGISTRY.counter("lld_llm_failover_requests_total", "主提供商故障转移期间改由备用模型处理的请求数", ["provider"])
+
+BATCH_SECONDS = REGISTRY.histogram("lld_batch_chunk_seconds", "批量处理中一组词语（合并请求与逐词补判）的耗时（秒）", ["provider", "model"])
+
+BATCH_WORDS = REGISTRY.counter("lld_batch_words_total", "批量判定的词语数（outcome: success / failed / fallback）", ["provider", "model", "outcome"])
+
+HISTORY_WRITE_SECONDS = REGISTRY.histogram("lld_history_write_seconds", "写入一条历史记录的耗时（秒）", ["backend"], buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0))
+
+REQUEST_OUTCOME_LABELS = {"success": "成功", "cache_hit": "缓存命中", "error": "失败", "cancelled": "已取消"}
+
+QUANTILE_COLUMNS = {"p50": 0.5, "p95": 0.95, "p99": 0.99}
+
+def metrics_summary() -> List[Dict[str, Any]]:
+
+    """按 (提供商, 模型) 汇总运行指标：各结果的请求数、按原因的重试次数，以及耗时、首字节与输出速度的近期分位数"""
+
+    rows = {}
+
+    def row(provider, model):
+
+        return rows.setdefault((provider, model), {"提供商": provider, "模型": model, **{label: 0 for label in REQUEST_OUTCOME_LABELS.values()}, "重试": 0, "重试原因": ""})
+
+    for (provider, model, outcome), child in LLM_REQUESTS.series().items():
+
+        row(provider, model)[REQUEST_OUTCOME_LABELS.get(outcome, outcome)] += int(child.value)
+
+    for (provider, model, cause), child in sorted(LLM_RETRIES.series().items()):
+
+        entry = row(provider, model)
+
+        entry["重试"] += int(child.value)
+
+        entry["重试原因"] = "，".join(filter(None, [entry["重试原因"], f"{cause}×{int(child.value)}"]))
+
+    for metric, title, digits in ((LLM_LATENCY, "耗时(秒)", 2), (LLM_FIRST_BYTE, "首字节(秒)", 2), (LLM_TOKENS_PER_SECOND, "token/秒", 1)):
+
+        for (provider, model), child in metric.series().items():
+
+            for (name, _), value in zip(QUANTILE_COLUMNS.items(), child.quantiles(QUANTILE_COLUMNS.values())):
+
+                row(provider, model)[f"{title} {name}"] = round(value, digits)
+
+    return list(rows.values())
+
+# 全局常量（修复：使用绝对路径避免文件路径问题；数据文件仍位于项目根目录）
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+BACKUP_FILE = BASE_DIR / "batch_history_log.csv"
+
+PROGRESS_FILE = BASE_DIR / "process_progress.json"  # 旧版单文件进度，仅用于清理
+
+PROGRESS_DIR = BASE_DIR / "process_progress"  # 断点续传日志目录（每个任务一对 .journal/.json 文件）
+
+# ===============================
+# 历史记录工具函数
+# ===============================
+
+def get_history_count(backup_file):
+
+    """获取最新的历史记录数量（实时更新用，读取旁路索引，常数时间）"""
+
+    try:
+
+        return get_history_store(backup_file).count()
+
+    except Exception as e:
+
+        logger.warning(f"读取历史记录数量失败: {e}")
+
+        return 0
+
+# 新增：文件写入加锁 + 重试（解决文件操作中断）
+
+def safe_write_csv(df, file_path, mode='a', header=False, encoding='utf-8-sig', max_retries=3):
+
+    """安全写入CSV，加文件锁避免冲突，失败自动重试"""
+
+    retry_count = 0
+
+    while retry_count < max_retries:
+
+        try:
+
+            with open(file_path, mode, encoding=encoding) as f:
+
+                fcntl.flock(f, fcntl.LOCK_EX)  # 排他锁
+
+                df.to_csv(f, mode=mode, header=header, index=False)
+
+                fcntl.flock(f, fcntl.LOCK_UN)  # 释放锁
+
+            return True
+
+        except Exception as e:
+
+            retry_count += 1
+
+            logger.warning(f"写入CSV失败（重试{retry_count}/{max_retries}）: {e}")
+
+            time.sleep(1)
+
+    logger.error(f"写入CSV最终失败: {file_path}")
+
+    return False
+
+# ===============================
+# 历史记录存储（CSV + 旁路索引，计数与查重为常数时间）
+# ===============================
+
+# 「规则判定」保存每条规则的是/否判定（RuleSet.encode 的紧凑文本），调整分值后可离线重新计分（rescore）
+
+VERDICT_COLUMN = "规则判定"
+
+HISTORY_COLUMNS = ["序数", "词语", "动词", "名词", "名动词", "差值/距离", "预测词类", "原始响应", "时间戳", VERDICT_COLUMN]
+
+RESCORE_CHUNK_ROWS = 50000  # 重新计分时每块读取并一次矩阵运算的记录数
+
+INDEX_MAGIC = b"LLDIDX1\0"
+
+INDEX_HEADER = struct.Struct("<8sQ")  # 魔数 + 已索引的 CSV 字节数
+
+INDEX_OFFSET = struct.Struct("<Q")  # 每行一个：该行在 CSV 中的起始字节偏移
+
+PREVIEW_ROWS = 50  # 实时预览显示的最近记录条数
+
+class HistoryStore:
+
+    """追加写入的历史 CSV，配套两个旁路文件：
+
+    - <csv>.idx：文件头记录已索引的 CSV 大小，其后每行一个 8 字节偏移，行数 = (文件大小 - 16) / 8；
+    - <csv>.words：每行一个已处理词语，用于查重。
+
+    追加时在锁文件 <csv>.lock 的文件锁内依次写入 CSV、词语与偏移，最后更新文件头
+    （锁不加在 CSV 本身上：rescore 以新文件替换 CSV，等待中的进程持锁后重新打开即写入新文件）；
+    文件头与 CSV 实际大小不一致（旧文件、手工编辑或写入中断）时自动全量重建一次。
+    """
+
+    def __init__(self, csv_path):
+
+        self.csv_path = Path(csv_path)
+
+        self.index_path = Path(f"{csv_path}.idx")
+
+        self.words_path = Path(f"{csv_path}.words")
+
+        self.lock_path = Path(f"{csv_path}.lock")
+
+        self._lock = threading.RLock()
+
+        self._words = set()
+
+        self._words_offset = 0
+
+        self._recent = deque(maxlen=PREVIEW_ROWS)  # 最近写入记录的环形缓冲，供实时预览使用
+
+        self._recent_total = -1  # 环形缓冲对应的总行数，与文件不一致时回源重读
+
+        self._width = None  # 已有文件表头的列数，追加时按此列数写入
+
+        self._width_file = None  # 读取表头时 CSV 的 (st_dev, st_ino)；其他进程 rescore 替换文件后需重新读取表头
+
+    # ---------- 索引维护 ----------
+
+    def _index_valid(self) -> bool:
+
+        try:
+
+            with open(self.index_path, "rb") as f:
+
+                magic, indexed_size = INDEX_HEADER.unpack(f.read(INDEX_HEADER.size))
+
+            return magic == INDEX_MAGIC and indexed_size == os.path.getsize(self.csv_path) and self.words_path.exists()
+
+        except (OSError, struct.error):
+
+            return False
+
+    def _scan_rows(self):
+
+        """逐行扫描 CSV（正确处理引号内换行），产出 (起始偏移, 行字节)，跳过表头"""
+
+        with open(self.csv_path, "rb") as f:
+
+            offset, row_start, in_quotes, is_header = 0, 0, False, True
+
+            buf = []
+
+            for line in f:
+
+                if not in_quotes:
+
+                    row_start, buf = offset, []
+
+                buf.append(line)
+
+                if line.count(b'"') % 2:
+
+                    in_quotes = not in_quotes
+
+                offset += len(line)
+
+                if in_quotes:
+
+                    continue
+
+                if is_header:
+
+                    is_header = False
+
+                    continue
+
+                row = b"".join(buf)
+
+                if row.strip():
+
+                    yield row_start, row
+
+    def _rebuild_index(self):
+
+        """全量扫描 CSV，重建偏移与词语索引"""
+
+        started = time.time()
+
+        offsets, words = [], []
+
+        word_col = HISTORY_COLUMNS.index("词语")
+
+        if self.csv_path.exists():
+
+            with open(self.csv_path, "r", encoding="utf-8-sig", newline="") as f:
+
+                header = next(csv.reader([f.readline()]), [])
+
+            if "词语" in header:
+
+                word_col = header.index("词语")
+
+            for row_start, row in self._scan_rows():
+
+                offsets.append(row_start)
+
+                fields = next(csv.reader(io.StringIO(row.decode("utf-8", errors="replace"))), [])
+
+                words.append(fields[word_col] if len(fields) > word_col else "")
+
+        self._write_index(offsets, words, os.path.getsize(self.csv_path) if self.csv_path.exists() else 0)
+
+        logger.info(f"重建历史索引完成：{len(offsets)} 行，用时 {time.time() - started:.2f} 秒")
+
+    def _write_index(self, offsets: List[int], words: List[str], csv_size: int):
+
+        """整体写出偏移与词语索引，并清空内存中的缓存"""
+
+        with open(self.words_path, "w", encoding="utf-8") as f:
+
+            f.writelines(f"{self._index_word(w)}\n" for w in words)
+
+        with open(self.index_path, "wb") as f:
+
+            f.write(INDEX_HEADER.pack(INDEX_MAGIC, csv_size))
+
+            f.write(b"".join(INDEX_OFFSET.pack(o) for o in offsets))
+
+        self._words, self._words_offset = set(), 0
+
+        self._recent_total = -1
+
+        self._width = None
+
+    def _ensure_index(self, locked: bool = False):
+
+        if not self.csv_path.exists():
+
+            for path in (self.index_path, self.words_path):
+
+                if path.exists():
+
+                    path.unlink()
+
+            self._words, self._words_offset = set(), 0
+
+            return
+
+        if self._index_valid():
+
+            return
+
+        if locked:
+
+            self._rebuild_index()
+
+            return
+
+        # 另一进程可能正在追加：持锁后再确认一次，避免误判后重复重建
+
+        with open(self.lock_path, "ab") as lock:
+
+            fcntl.flock(lock, fcntl.LOCK_EX)
+
+            try:
+
+                if not self._index_valid():
+
+                    self._rebuild_index()
+
+            finally:
+
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    @staticmethod
+
+    def _index_word(word) -> str:
+
+        return str(word).replace("\r", " ").replace("\n", " ")
+
+    def _header_width(self) -> int:
+
+        """已有文件表头的列数：旧文件没有「规则判定」列时按原列数写入，使每行与表头一致（rescore 时升级表头）"""
+
+        with open(self.csv_path, "r", encoding="utf-8-sig", newline="") as f:
+
+            header = next(csv.reader(f), [])
+
+        return len(header) if header and header == HISTORY_COLUMNS[:len(header)] else len(HISTORY_COLUMNS)
+
+    # ---------- 对外接口 ----------
+
+    def count(self) -> int:
+
+        """历史记录条数：只读取索引文件大小，与历史规模无关"""
+
+        with self._lock:
+
+            self._ensure_index()
+
+            if not self.index_path.exists():
+
+                return 0
+
+            return (os.path.getsize(self.index_path) - INDEX_HEADER.size) // INDEX_OFFSET.size
+
+    def _load_words(self):
+
+        """增量读取其他进程新追加的词语到内存集合（调用方持有 self._lock）"""
+
+        self._ensure_index()
+
+        if self.words_path.exists():
+
+            with open(self.words_path, "r", encoding="utf-8") as f:
+
+                f.seek(self._words_offset)
+
+                for line in f:
+
+                    self._words.add(line.rstrip("\n"))
+
+                self._words_offset = f.tell()
+
+    def contains(self, word: str, provider: str = "", model: str = "") -> bool:
+
+        """词语是否已处理：已在内存集合中时直接返回，否则先增量读取新追加的词语再查。
+
+        CSV 不记录提供商与模型，provider、model 仅为与 SqliteHistoryStore 保持接口一致，不参与判断。
+        """
+
+        key = self._index_word(word)
+
+        with self._lock:
+
+            if key in self._words:
+
+                return True
+
+            self._load_words()
+
+            return key in self._words
+
+    def append(self, row: Dict[str, Any], max_retries: int = 3, provider: str = "", model: str = "") -> bool:
+
+        """追加一条记录并同步更新索引，失败自动重试（provider/model 仅 SQLite 后端使用）"""
+
+        started = time.monotonic()
+
+        write_span = tracing.span("history_write", backend="csv")
+
+        for attempt in range(max_retries):
+
+            try:
+
+                with self._lock, open(self.lock_path, "ab") as lock:
+
+                    fcntl.flock(lock, fcntl.LOCK_EX)  # 排他锁：覆盖 CSV 与两个旁路文件的整个更新过程
+
+                    try:
+
+                        with open(self.csv_path, "ab") as f:  # 持锁后再打开：rescore 可能已用新文件替换了 CSV
+
+                            self._ensure_index(locked=True)
+
+                            stat = os.fstat(f.fileno())
+
+                            file_id = (stat.st_dev, stat.st_ino)
+
+                            if f.seek(0, os.SEEK_END) == 0:
+
+                                header = io.StringIO()
+
+                                csv.writer(header, lineterminator="\n").writerow(HISTORY_COLUMNS)
+
+                                f.write(codecs.BOM_UTF8 + header.getvalue().encode("utf-8"))
+
+                                self._width = len(HISTORY_COLUMNS)
+
+                            elif self._width is None or self._width_file != file_id:
+
+                                # 缓存的列数属于被替换前的文件（如另一进程 rescore 升级了表头）：按当前文件的表头重新确定
+
+                                self._width = self._header_width()
+
+                            self._width_file = file_id
+
+                            buffer = io.StringIO()
+
+                            csv.writer(buffer, lineterminator="\n").writerow([row.get(col, "") for col in HISTORY_COLUMNS[:self._width]])
+
+                            row_bytes = buffer.getvalue().encode("utf-8")
+
+                            row_start = f.tell()
+
+                            f.write(row_bytes)
+
+                            f.flush()
+
+                            csv_size = f.tell()
+
+                            with open(self.words_path, "a", encoding="utf-8") as wf:
+
+                                wf.write(f"{self._index_word(row.get('词语', ''))}\n")
+
+                            if not self.index_path.exists():
+
+                                with open(self.index_path, "wb") as idx:
+
+                                    idx.write(INDEX_HEADER.pack(INDEX_MAGIC, 0))
+
+                            with open(self.index_path, "r+b") as idx:
+
+                                rows_before = (idx.seek(0, os.SEEK_END) - INDEX_HEADER.size) // INDEX_OFFSET.size
+
+                                idx.write(INDEX_OFFSET.pack(row_start))
+
+                                idx.seek(0)
+
+                                idx.write(INDEX_HEADER.pack(INDEX_MAGIC, csv_size))
+
+                            if self._recent_total == rows_before:
+
+                                self._recent.append({col: str(row.get(col, "")) for col in HISTORY_COLUMNS})
+
+                                self._recent_total = rows_before + 1
+
+                    finally:
+
+                        fcntl.flock(lock, fcntl.LOCK_UN)  # 释放锁
+
+                HISTORY_WRITE_SECONDS.labels("csv").observe(time.monotonic() - started)
+
+                write_span.finish(attempts=attempt + 1)
+
+                return True
+
+            except Exception as e:
+
+                logger.warning(f"写入历史记录失败（重试{attempt+1}/{max_retries}）: {e}")
+
+                time.sleep(1)
+
+        logger.error(f"写入历史记录最终失败: {self.csv_path}")
+
+        write_span.finish(error="write_failed")
+
+        return False
+
+    # ---------- 尾部预览与分页 ----------
+
+    def read_rows(self, start: int, limit: int) -> List[Dict[str, Any]]:
+
+        """按行号读取 [start, start + limit) 范围的记录：通过偏移索引定位，只读取所需字节"""
+
+        with self._lock:
+
+            total = self.count()
+
+            start = max(0, start)
+
+            end = min(total, start + max(0, limit))
+
+            if start >= end:
+
+                return []
+
+            with open(self.index_path, "rb") as idx:
+
+                idx.seek(INDEX_HEADER.size + start * INDEX_OFFSET.size)
+
+                first = INDEX_OFFSET.unpack(idx.read(INDEX_OFFSET.size))[0]
+
+                idx.seek(INDEX_HEADER.size + end * INDEX_OFFSET.size)
+
+                tail = idx.read(INDEX_OFFSET.size)
+
+                last = INDEX_OFFSET.unpack(tail)[0] if tail else None
+
+            with open(self.csv_path, "rb") as f:
+
+                f.seek(first)
+
+                chunk = f.read(last - first) if last is not None else f.read()
+
+        reader = csv.reader(io.StringIO(chunk.decode("utf-8", errors="replace")))
+
+        return [dict(zip(HISTORY_COLUMNS, fields)) for fields, _ in zip(reader, range(end - start))]
+
+    def tail_rows(self, limit: int = PREVIEW_ROWS) -> List[Dict[str, Any]]:
+
+        """最近 limit 条记录：优先取内存环形缓冲，其他进程写入后才回源读取文件尾部"""
+
+        with self._lock:
+
+            total = self.count()
+
+            if self._recent_total != total or len(self._recent) < min(limit, total, self._recent.maxlen):
+
+                self._recent = deque(self.read_rows(total - PREVIEW_ROWS, PREVIEW_ROWS), maxlen=PREVIEW_ROWS)
+
+                self._recent_total = total
+
+            return list(self._recent)[-limit:]
+
+    def exists(self) -> bool:
+
+        return self.csv_path.exists()
+
+    def export_csv(self) -> Path:
+
+        """CSV 后端的历史文件本身即为导出格式"""
+
+        return self.csv_path
+
+    def clear(self):
+
+        """删除历史文件及其索引"""
+
+        with self._lock:
+
+            for path in (self.csv_path, self.index_path, self.words_path):
+
+                if path.exists():
+
+                    path.unlink()
+
+            self._words, self._words_offset = set(), 0
+
+            self._recent, self._recent_total = deque(maxlen=PREVIEW_ROWS), -1
+
+            self._width = None
+
+    def rescore(self, dry_run: bool = False, chunk_rows: int = RESCORE_CHUNK_ROWS) -> Dict[str, int]:
+
+        """按当前规则集重新计算全部记录的隶属度（见 rescore_rows），dry_run 为 True 时只统计不写回。
+
+        在文件锁内逐块读取 CSV、整块计分并写入同目录的临时文件，fsync 后原子替换原文件：中途崩溃、磁盘写满或被终止时
+        原文件保持不变；同时把表头升级为当前列，写出时顺带记录每行偏移，替换后直接生成新索引而无需再扫描一遍。
+        """
+
+        stats = Counter()
+
+        offsets, words = [], []
+
+        if not self.csv_path.exists():
+
+            return dict(stats)
+
+        tmp_path = self.csv_path.with_name(f".{self.csv_path.name}.rescore.tmp")
+
+        with self._lock, open(self.lock_path, "ab") as lock:
+
+            fcntl.flock(lock, fcntl.LOCK_EX)
+
+            try:
+
+                with open(self.csv_path, "r", encoding="utf-8-sig", newline="") as src, open(tmp_path, "wb") as tmp:
+
+                    reader = csv.reader(src)
+
+                    header = next(reader, None) or HISTORY_COLUMNS
+
+                    line = io.StringIO()
+
+                    writer = csv.writer(line, lineterminator="\n")
+
+                    writer.writerow(HISTORY_COLUMNS)
+
+                    position = tmp.write(codecs.BOM_UTF8 + line.getvalue().encode("utf-8"))
+
+                    while True:
+
+                        rows = [dict(zip(header, fields)) for fields in itertools.islice(reader, chunk_rows) if fields]
+
+                        if not rows:
+
+                            break
+
+                        chunk_stats, _ = rescore_rows(rows)
+
+                        stats.update(chunk_stats)
+
+                        for row in rows:
+
+                            line.seek(0)
+
+                            line.truncate()
+
+                            writer.writerow([row.get(col, "") for col in HISTORY_COLUMNS])
+
+                            offsets.append(position)
+
+                            words.append(row.get("词语", ""))
+
+                            position += tmp.write(line.getvalue().encode("utf-8"))
+
+                    tmp.flush()
+
+                    os.fsync(tmp.fileno())
+
+                if not dry_run:
+
+                    shutil.copymode(self.csv_path, tmp_path)
+
+                    os.replace(tmp_path, self.csv_path)
+
+                    # 目录项也落盘后再重建索引；索引写出前崩溃时，文件头与 CSV 大小不符，下次打开自动全量重建
+
+                    dir_fd = os.open(self.csv_path.parent, os.O_RDONLY)
+
+                    try:
+
+                        os.fsync(dir_fd)
+
+                    finally:
+
+                        os.close(dir_fd)
+
+                    self._write_index(offsets, words, position)
+
+            finally:
+
+                if tmp_path.exists():
+
+                    tmp_path.unlink()
+
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+        return dict(stats)
+
+# SQLite 后端的列与 CSV 列一一对应；另存提供商、模型与规则集版本作为唯一键
+
+SQLITE_COLUMNS = ["seq", "word", "verb", "noun", "noun_verb", "distance", "predicted", "raw_response", "ts", "verdicts"]
+
+class SqliteHistoryStore:
+
+    """SQLite（WAL 模式）历史记录存储，接口与 HistoryStore 一致。
+
+    以 (词语, 提供商, 模型, 规则集版本) 为唯一键执行 upsert，在词语、模型与时间戳上建索引；
+    写入共用一个连接并加锁，读取使用线程私有连接，批处理写入时其他页面仍可并发读取。
+    首次打开且表为空时，自动导入同名 CSV 中的已有记录。
+    """
+
+    def __init__(self, csv_path):
+
+        self.csv_path = Path(csv_path)
+
+        self.db_path = self.csv_path.with_suffix(".sqlite3")
+
+        self.export_path = self.csv_path.with_suffix(".export.csv")
+
+        self._lock = threading.RLock()
+
+        self._local = threading.local()
+
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, timeout=30)
+
+        self._conn.execute("PRAGMA journal_mode=WAL")
+
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+
+        # REPLACE 冲突处理删除旧行时也触发删除触发器，记录条数保持准确
+
+        self._conn.execute("PRAGMA recursive_triggers=ON")
+
+        self._conn.execute(
+
+            "CREATE TABLE IF NOT EXISTS results ("
+
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, seq INTEGER, word TEXT NOT NULL, "
+
+            "provider TEXT NOT NULL DEFAULT '', model TEXT NOT NULL DEFAULT '', rule_version TEXT NOT NULL DEFAULT '', "
+
+            "verb REAL, noun REAL, noun_verb REAL, distance REAL, predicted TEXT, raw_response TEXT, ts TEXT, "
+
+            "verdicts TEXT NOT NULL DEFAULT '', "
+
+            "UNIQUE (word, provider, model, rule_version))"
+
+        )
+
+        # 旧库没有规则判定列：补上（旧记录留空，rescore 时从原始响应中补齐）
+
+        if "verdicts" not in {info[1] for info in self._conn.execute("PRAGMA table_info(results)")}:
+
+            self._conn.execute("ALTER TABLE results ADD COLUMN verdicts TEXT NOT NULL DEFAULT ''")
+
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_results_word ON results(word)")
+
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_results_model ON results(model)")
+
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_results_ts ON results(ts)")
+
+        self._conn.commit()
+
+        self._init_row_count()
+
+        self._import_csv()
+
+    def _init_row_count(self):
+
+        """记录条数由触发器在插入与删除时维护（多个进程写同一个库时同样准确），count() 无需 COUNT(*) 全表扫描；
+        首次打开时在同一事务内建触发器并统计一次已有记录"""
+
+        if self._conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'results_count_delete'").fetchone():
+
+            return
+
+        with self._lock:
+
+            self._conn.execute("BEGIN IMMEDIATE")
+
+            try:
+
+                self._conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+                self._conn.execute("INSERT OR REPLACE INTO counters VALUES ('results', (SELECT COUNT(*) FROM results))")
+
+                self._conn.execute("CREATE TRIGGER IF NOT EXISTS results_count_insert AFTER INSERT ON results BEGIN UPDATE counters SET value = value + 1 WHERE name = 'results'; END")
+
+                self._conn.execute("CREATE TRIGGER IF NOT EXISTS results_count_delete AFTER DELETE ON results BEGIN UPDATE counters SET value = value - 1 WHERE name = 'results'; END")
+
+                self._conn.commit()
+
+            except Exception:
+
+                self._conn.rollback()
+
+                raise
+
+    def _reader(self) -> sqlite3.Connection:
+
+        """线程私有的只读连接（WAL 下读不阻塞写）"""
+
+        conn = getattr(self._local, "conn", None)
+
+        if conn is None:
+
+            conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, timeout=30)
+
+            self._local.conn = conn
+
+        return conn
+
+    def _import_csv(self):
+
+        """表为空且存在旧 CSV 时一次性导入（提供商、模型与规则集版本未知，留空）"""
+
+        if not self.csv_path.exists() or self._conn.execute("SELECT 1 FROM results LIMIT 1").fetchone():
+
+            return
+
+        try:
+
+            with open(self.csv_path, "r", encoding="utf-8-sig", newline="") as f:
+
+                reader = csv.reader(f)
+
+                if next(reader, None) is None:
+
+                    return
+
+                with self._lock, self._conn:
+
+                    self._conn.executemany(
+
+                        f"INSERT OR REPLACE INTO results ({', '.join(SQLITE_COLUMNS)}) VALUES ({', '.join('?' * len(SQLITE_COLUMNS))})",
+
+                        # 旧 CSV 没有规则判定列，按空值补齐
+
+                        ((fields + [""])[:len(SQLITE_COLUMNS)] for fields in reader if len(fields) >= len(SQLITE_COLUMNS) - 1)
+
+                    )
+
+            logger.info(f"已将 {self.csv_path} 导入 {self.db_path}")
+
+        except Exception as e:
+
+            logger.warning(f"导入历史 CSV 失败: {e}")
+
+    @staticmethod
+
+    def _to_row(record) -> Dict[str, Any]:
+
+        return dict(zip(HISTORY_COLUMNS, record))
+
+    def exists(self) -> bool:
+
+        return self.count() > 0
+
+    def count(self) -> int:
+
+        """记录条数：读取触发器维护的计数，与历史规模无关"""
+
+        return self._reader().execute("SELECT value FROM counters WHERE name = 'results'").fetchone()[0]
+
+    def contains(self, word: str, provider: str = "", model: str = "") -> bool:
+
+        """该提供商与模型是否已在当前规则集版本下判定过该词语；与 upsert 的唯一键一致，走同一个唯一索引"""
+
+        return self._reader().execute(
+
+            "SELECT 1 FROM results WHERE word = ? AND provider = ? AND model = ? AND rule_version = ? LIMIT 1",
+
+            (word, provider, model, rule_set_version())
+
+        ).fetchone() is not None
+
+    def append(self, row: Dict[str, Any], max_retries: int = 3, provider: str = "", model: str = "") -> bool:
+
+        """写入一条记录：同一词语、提供商、模型与规则集版本已存在时覆盖原记录"""
+
+        values = [row.get(col, "") for col in HISTORY_COLUMNS]
+
+        started = time.monotonic()
+
+        write_span = tracing.span("history_write", backend="sqlite")
+
+        for attempt in range(max_retries):
+
+            try:
+
+                with self._lock, self._conn:
+
+                    self._conn.execute(
+
+                        f"INSERT INTO results ({', '.join(SQLITE_COLUMNS)}, provider, model, rule_version) "
+
+                        f"VALUES ({', '.join('?' * (len(SQLITE_COLUMNS) + 3))}) "
+
+                        "ON CONFLICT (word, provider, model, rule_version) DO UPDATE SET "
+
+                        + ", ".join(f"{col} = excluded.{col}" for col in SQLITE_COLUMNS if col != "word"),
+
+                        values + [provider, model, rule_set_version()]
+
+                    )
+
+                HISTORY_WRITE_SECONDS.labels("sqlite").observe(time.monotonic() - started)
+
+                write_span.finish(attempts=attempt + 1)
+
+                return True
+
+            except Exception as e:
+
+                logger.warning(f"写入历史记录失败（重试{attempt+1}/{max_retries}）: {e}")
+
+                time.sleep(1)
+
+        logger.error(f"写入历史记录最终失败: {self.db_path}")
+
+        write_span.finish(error="write_failed")
+
+        return False
+
+    def read_rows(self, start: int, limit: int) -> List[Dict[str, Any]]:
+
+        """按 id 键集分页读取：记住本线程上一页结束的位置与 id，顺序翻页（如 iter_history_rows）时
+        直接从 id > 上一页末尾读取；跳页时只按主键定位起点 id，不再用 OFFSET 读取并丢弃前面的整行"""
+
+        start, limit = max(0, start), max(0, limit)
+
+        conn = self._reader()
+
+        cursor = getattr(self._local, "page_cursor", None)
+
+        if start == 0:
+
+            after_id = 0
+
+        elif cursor is not None and cursor[0] == start:
+
+            after_id = cursor[1]
+
+        else:
+
+            boundary = conn.execute("SELECT id FROM results ORDER BY id LIMIT 1 OFFSET ?", (start - 1,)).fetchone()
+
+            if boundary is None:
+
+                return []
+
+            after_id = boundary[0]
+
+        records = conn.execute(
+
+            f"SELECT id, {', '.join(SQLITE_COLUMNS)} FROM results WHERE id > ? ORDER BY id LIMIT ?", (after_id, limit)
+
+        ).fetchall()
+
+        if records:
+
+            self._local.page_cursor = (start + len(records), records[-1][0])
+
+        return [self._to_row(record[1:]) for record in records]
+
+    def tail_rows(self, limit: int = PREVIEW_ROWS) -> List[Dict[str, Any]]:
+
+        records = self._reader().execute(
+
+            f"SELECT {', '.join(SQLITE_COLUMNS)} FROM results ORDER BY id DESC LIMIT ?", (limit,)
+
+        ).fetchall()
+
+        return [self._to_row(record) for record in reversed(records)]
+
+    def export_csv(self) -> Path:
+
+        """按原 CSV 格式导出全部记录（UTF-8 BOM + 表头），返回导出文件路径"""
+
+        # 每次导出使用独立的临时文件：多个会话同时导出时互不覆盖，失败时不留下半个文件
+
+        with tempfile.NamedTemporaryFile("w", encoding="utf-8-sig", newline="", dir=self.export_path.parent, prefix=f".{self.export_path.name}.", suffix=".tmp", delete=False) as f:
+
+            tmp_path = Path(f.name)
+
+            try:
+
+                writer = csv.writer(f, lineterminator="\n")
+
+                writer.writerow(HISTORY_COLUMNS)
+
+                writer.writerows(self._reader().execute(f"SELECT {', '.join(SQLITE_COLUMNS)} FROM results ORDER BY id"))
+
+            except BaseException:
+
+                f.close()
+
+                tmp_path.unlink()
+
+                raise
+
+        os.replace(tmp_path, self.export_path)
+
+        return self.export_path
+
+    def clear(self):
+
+        """删除全部记录"""
+
+        with self._lock, self._conn:
+
+            self._conn.execute("DELETE FROM results")
+
+        if self.export_path.exists():
+
+            self.export_path.unlink()
+
+    def rescore(self, dry_run: bool = False, chunk_rows: int = RESCORE_CHUNK_ROWS) -> Dict[str, int]:
+
+        """按当前规则集重新计算全部记录的隶属度（见 rescore_rows），dry_run 为 True 时只统计不写回。
+
+        重新计分的记录同时更新规则集版本；与同一词语、模型在当前版本下的已有记录冲突时，以重新计分的结果为准。
+        """
+
+        stats = Counter()
+
+        version = rule_set_version()
+
+        cursor = self._reader().execute("SELECT id, verb, noun, noun_verb, distance, raw_response, verdicts FROM results ORDER BY id")
+
+        while True:
+
+            records = cursor.fetchmany(chunk_rows)
+
+            if not records:
+
+                break
+
+            rows = [dict(zip(["动词", "名词", "名动词", "差值/距离", "原始响应", VERDICT_COLUMN], record[1:])) for record in records]
+
+            chunk_stats, scored = rescore_rows(rows)
+
+            stats.update(chunk_stats)
+
+            if dry_run or not scored:
+
+                continue
+
+            with self._lock, self._conn:
+
+                self._conn.executemany(
+
+                    "UPDATE OR REPLACE results SET verb = ?, noun = ?, noun_verb = ?, distance = ?, verdicts = ?, rule_version = ? WHERE id = ?",
+
+                    [
+
+                        (rows[i]["动词"], rows[i]["名词"], rows[i]["名动词"], rows[i]["差值/距离"], rows[i][VERDICT_COLUMN], version, records[i][0])
+
+                        for i in scored
+
+                    ]
+
+                )
+
+        return dict(stats)
+
+# 历史记录后端：csv（默认，追加写入 + 旁路索引）或 sqlite（WAL 模式，支持 upsert 与并发读取）
+
+HISTORY_BACKEND = os.getenv("LLD_HISTORY_BACKEND", "csv").strip().lower()
+
+@shared_resource
+
+def get_history_store(csv_path):
+
+    """每个历史文件一个全局共享的存储实例"""
+
+    if HISTORY_BACKEND == "sqlite":
+
+        return SqliteHistoryStore(csv_path)
+
+    return HistoryStore(csv_path)
+
+# 断点续传：任务由上传文件内容、目标列与模型共同标识，已完成的行号逐条追加到日志并落盘
+
+JOURNAL_RECORD = struct.Struct("<Q")  # 每条记录一个已完成的行号
+
+def make_job_id(source_digest: str, column: str, provider: str, model: str) -> str:
+
+    """任务标识：工作簿内容哈希 + 目标列 + 提供商/模型，同一文件重新上传后仍能匹配"""
+
+    raw_key = json.dumps([source_digest, str(column), provider, model], ensure_ascii=False)
+
+    return hashlib.sha256(raw_key.encode("utf-8")).hexdigest()[:16]
+
+class ProgressJournal:
+
+    """单个任务的进度日志：<job_id>.journal 为定长行号记录，<job_id>.json 为任务信息。
+
+    每条记录单次写入 8 字节并 fsync，进程崩溃或断电后最多丢失正在写入的一条；
+    加载时截掉不完整的尾部记录。任务信息通过临时文件 + fsync + 原子替换写入。
+    """
+
+    def __init__(self, job_id: str, progress_dir=None):
+
+        self.job_id = job_id
+
+        self.progress_dir = Path(progress_dir or PROGRESS_DIR)
+
+        self.journal_path = self.progress_dir / f"{job_id}.journal"
+
+        self.meta_path = self.progress_dir / f"{job_id}.json"
+
+        self.completed = set()
+
+        self._file = None
+
+        self._load()
+
+    def _load(self):
+
+        if not self.journal_path.exists():
+
+            return
+
+        try:
+
+            with open(self.journal_path, "r+b") as f:
+
+                data = f.read()
+
+                usable = len(data) - len(data) % JOURNAL_RECORD.size
+
+                if usable != len(data):
+
+                    f.truncate(usable)  # 丢弃写入中断的半条记录
+
+                self.completed = {index for (index,) in JOURNAL_RECORD.iter_unpack(data[:usable])}
+
+        except Exception as e:
+
+            logger.error(f"加载进度日志失败: {e}")
+
+    @property
+
+    def meta(self) -> Optional[Dict[str, Any]]:
+
+        if not self.meta_path.exists():
+
+            return None
+
+        try:
+
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+
+                return json.load(f)
+
+        except Exception as e:
+
+            logger.error(f"加载进度失败: {e}")
+
+            return None
+
+    def first_pending(self) -> int:
+
+        """第一个未完成的行号（续传起点）"""
+
+        index = 0
+
+        while index in self.completed:
+
+            index += 1
+
+        return index
+
+    def start(self, **meta):
+
+        """开始（或继续）任务：原子写入任务信息并打开日志"""
+
+        self.progress_dir.mkdir(parents=True, exist_ok=True)
+
+        meta = {"job_id": self.job_id, "completed_rows": len(self.completed), "last_update": time.strftime("%Y-%m-%d %H:%M:%S"), **meta}
+
+        tmp_path = self.meta_path.with_suffix(".json.tmp")
+
+        with open(tmp_path, "w", encoding="utf-8") as f:
+
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+
+            f.flush()
+
+            os.fsync(f.fileno())
+
+        os.replace(tmp_path, self.meta_path)
+
+        if self._file is None:
+
+            self._file = open(self.journal_path, "ab", buffering=0)
+
+    def mark(self, index: int):
+
+        """记录一行已完成并落盘"""
+
+        if index in self.completed:
+
+            return
+
+        if self._file is None:
+
+            self.start()
+
+        self._file.write(JOURNAL_RECORD.pack(index))
+
+        os.fsync(self._file.fileno())
+
+        self.completed.add(index)
+
+    def close(self):
+
+        """中断时只关闭日志、保留进度，下次上传同一文件即可续传"""
+
+        if self._file is not None:
+
+            self._file.close()
+
+            self._file = None
+
+    def discard(self):
+
+        """任务全部完成后删除进度"""
+
+        self.close()
+
+        for path in (self.journal_path, self.meta_path):
+
+            if path.exists():
+
+                path.unlink()
+
+        self.completed = set()
+
+def clear_process_progress():
+
+    """清除全部任务的进度日志（含旧版单文件进度）"""
+
+    try:
+
+        if PROGRESS_DIR.exists():
+
+            for path in PROGRESS_DIR.iterdir():
+
+                if path.suffix in (".journal", ".json", ".tmp"):
+
+                    path.unlink()
+
+        if os.path.exists(PROGRESS_FILE):
+
+            os.remove(PROGRESS_FILE)
+
+    except Exception as e:
+
+        logger.error(f"清除进度文件失败: {e}")
+
+# ===============================
+# 响应缓存（进程内 LRU + SQLite 持久化）
+# ===============================
+
+CACHE_FILE = BASE_DIR / "llm_response_cache.sqlite3"
+
+CACHE_TTL_SECONDS = float(os.getenv("LLD_CACHE_TTL_DAYS", "30")) * 86400
+
+CACHE_MAX_ENTRIES = int(os.getenv("LLD_CACHE_MAX_ENTRIES", "100000"))
+
+CACHE_MEMORY_ENTRIES = 1024
+
+class ResponseCache:
+
+    """两级响应缓存：进程内 LRU 在前，SQLite 磁盘层在后，按 TTL 与条目上限淘汰"""
+
+    def __init__(self, db_path, ttl_seconds: float = CACHE_TTL_SECONDS, max_entries: int = CACHE_MAX_ENTRIES, memory_entries: int = CACHE_MEMORY_ENTRIES):
+
+        self.ttl_seconds = ttl_seconds
+
+        self.max_entries = max_entries
+
+        self.memory_entries = memory_entries
+
+        self._memory = OrderedDict()
+
+        self._lock = threading.Lock()
+
+        self._writes_since_evict = 0
+
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0, "evictions": 0, "hit_seconds": 0.0}
+
+        self._conn = sqlite3.connect(str(db_path), check_same_thread=False, timeout=30)
+
+        self._conn.execute("PRAGMA journal_mode=WAL")
+
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+
+        self._conn.execute(
+
+            "CREATE TABLE IF NOT EXISTS responses ("
+
+            "key TEXT PRIMARY KEY, provider TEXT, model TEXT, word TEXT, "
+
+            "response TEXT NOT NULL, created_at REAL NOT NULL, last_access REAL NOT NULL)"
+
+        )
+
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access)")
+
+        self._conn.commit()
+
+    @staticmethod
+
+    def make_key(provider: str, model: str, temperature: float, max_tokens: int, messages: List[Dict[str, str]], word: str = "") -> str:
+
+        """缓存键：提供商、模型、温度、输出上限、渲染后提示词的哈希与词语"""
+
+        prompt_hash = hashlib.sha256(json.dumps(messages, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+        raw_key = json.dumps([provider, model, float(temperature), int(max_tokens), prompt_hash, word], ensure_ascii=False)
+
+        return hashlib.sha256(raw_key.encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+
+        """命中返回响应字典，未命中或已过期返回 None"""
+
+        started = time.perf_counter()
+
+        now = time.time()
+
+        with self._lock:
+
+            entry = self._memory.get(key)
+
+            if entry and now - entry[0] <= self.ttl_seconds:
+
+                self._memory.move_to_end(key)
+
+                self._stats["memory_hits"] += 1
+
+                self._stats["hit_seconds"] += time.perf_counter() - started
+
+                return entry[1]
+
+            try:
+
+                row = self._conn.execute("SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+
+                if row and now - row[1] <= self.ttl_seconds:
+
+                    self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+
+                    self._conn.commit()
+
+                    response = json.loads(row[0])
+
+                    self._remember(key, row[1], response)
+
+                    self._stats["disk_hits"] += 1
+
+                    self._stats["hit_seconds"] += time.perf_counter() - started
+
+                    return response
+
+            except Exception as e:
+
+                logger.warning(f"读取响应缓存失败: {e}")
+
+            self._stats["misses"] += 1
+
+            return None
+
+    def put(self, key: str, provider: str, model: str, word: str, response: Dict[str, Any]):
+
+        """写入一条成功的响应"""
+
+        now = time.time()
+
+        with self._lock:
+
+            self._remember(key, now, response)
+
+            try:
+
+                self._conn.execute(
+
+                    "INSERT OR REPLACE INTO responses (key, provider, model, word, response, created_at, last_access) VALUES (?, ?, ?, ?, ?, ?, ?)",
+
+                    (key, provider, model, word, json.dumps(response, ensure_ascii=False), now, now)
+
+                )
+
+                self._conn.commit()
+
+                self._stats["writes"] += 1
+
+                self._writes_since_evict += 1
+
+                if self._writes_since_evict >= 200:
+
+                    self._evict(now)
+
+            except Exception as e:
+
+                logger.warning(f"写入响应缓存失败: {e}")
+
+    def _remember(self, key, created_at, response):
+
+        self._memory[key] = (created_at, response)
+
+        self._memory.move_to_end(key)
+
+        while len(self._memory) > self.memory_entries:
+
+            self._memory.popitem(last=False)
+
+    def _evict(self, now: float):
+
+        """删除过期条目，并按最近访问时间淘汰超出上限的条目"""
+
+        self._writes_since_evict = 0
+
+        removed = self._conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,)).rowcount
+
+        overflow = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0] - self.max_entries
+
+        if overflow > 0:
+
+            removed += self._conn.execute(
+
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_access LIMIT ?)", (overflow,)
+
+            ).rowcount
+
+        self._conn.commit()
+
+        self._stats["evictions"] += max(0, removed)
+
+    def delete(self, key: str):
+
+        """删除单个条目（两级缓存）；用于移除命中后校验不通过的旧响应"""
+
+        with self._lock:
+
+            self._memory.pop(key, None)
+
+            try:
+
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+
+                self._conn.commit()
+
+            except Exception as e:
+
+                logger.warning(f"删除响应缓存条目失败: {e}")
+
+    def clear(self):
+
+        """清空两级缓存"""
+
+        with self._lock:
+
+            self._memory.clear()
+
+            self._conn.execute("DELETE FROM responses")
+
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+
+        """命中统计（含平均命中耗时，毫秒）"""
+
+        with self._lock:
+
+            stats = dict(self._stats)
+
+            try:
+
+                stats["entries"] = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+            except Exception:
+
+                stats["entries"] = len(self._memory)
+
+        hits = stats["memory_hits"] + stats["disk_hits"]
+
+        hit_seconds = stats.pop("hit_seconds")
+
+        stats["hits"] = hits
+
+        stats["avg_hit_ms"] = round(hit_seconds / hits * 1000, 2) if hits else 0.0
+
+        return stats
+
+@shared_resource
+
+def get_response_cache() -> ResponseCache:
+
+    """全局共享的响应缓存实例（跨会话、跨工作线程）"""
+
+    return ResponseCache(CACHE_FILE)
+
+# ===============================
+# 提供商长连接池（跨会话、跨线程复用 TCP/TLS 连接）
+# ===============================
+
+SESSION_WARM_INTERVAL = 60  # 秒；超过该时间未预热则重新建立连接
+
+class ProviderSession:
+
+    """单个提供商的长连接会话：按并发数设定连接池大小，统计连接复用情况。
+
+    urllib3 连接池本身是线程安全的；会话创建后不再修改其配置，
+    因此同一实例可被多个 Streamlit 会话与批量工作线程同时使用。
+    """
+
+    def __init__(self, provider: str):
+
+        self.provider = provider
+
+        self.base_url = get_provider_setting(provider, "base_url", "").rstrip("/")
+
+        self.pool_size = get_provider_max_concurrency(provider) + 4  # 预留给单词分析、连接测试与预热
+
+        import requests
+
+        from requests.adapters import HTTPAdapter
+
+        self.session = requests.Session()
+
+        self.session.headers["Connection"] = "keep-alive"
+
+        self._adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_size, max_retries=0)
+
+        self.session.mount("https://", self._adapter)
+
+        self.session.mount("http://", self._adapter)
+
+        self._lock = threading.Lock()
+
+        self._last_warm = 0.0
+
+    def post(self, url: str, **kwargs):
+
+        return self.session.post(url, **kwargs)
+
+    def warm(self):
+
+        """后台预先建立到提供商的 TCP/TLS 连接，最近已预热则跳过"""
+
+        with self._lock:
+
+            if time.time() - self._last_warm < SESSION_WARM_INTERVAL:
+
+                return
+
+            self._last_warm = time.time()
+
+        def _warm():
+
+            try:
+
+                with self.session.head(self.base_url, timeout=10, allow_redirects=False):
+
+                    pass
+
+            except Exception as e:
+
+                logger.warning(f"预热 {self.provider} 连接失败: {e}")
+
+        threading.Thread(target=_warm, name=f"warm-{self.provider}", daemon=True).start()
+
+    def stats(self) -> Dict[str, int]:
+
+        """连接复用统计：请求数、新建连接数、复用次数、当前空闲连接数"""
+
+        requests_sent, connections_opened, idle = 0, 0, 0
+
+        pools = self._adapter.poolmanager.pools
+
+        for key in list(pools.keys()):
+
+            pool = pools.get(key)
+
+            if pool is None:
+
+                continue
+
+            requests_sent += pool.num_requests
+
+            connections_opened += pool.num_connections
+
+            idle += sum(1 for conn in list(pool.pool.queue) if conn is not None) if pool.pool else 0
+
+        return {
+
+            "requests": requests_sent,
+
+            "connections": connections_opened,
+
+            "reused": max(0, requests_sent - connections_opened),
+
+            "idle": idle,
+
+            "pool_size": self.pool_size,
+
+        }
+
+@shared_resource
+
+def get_provider_session(provider: str) -> ProviderSession:
+
+    """每个提供商一个全局共享的长连接会话"""
+
+    return ProviderSession(provider)
+
+# ===============================
+# 配额感知限流与自适应并发（AIMD）
+# ===============================
+
+BACKOFF_BASE_SECONDS = 1.0
+
+BACKOFF_MAX_SECONDS = 60.0
+
+def api_key_fingerprint(api_key: str) -> str:
+
+    """API Key 的短指纹，用于区分不同 Key 的配额而不在内存键中保存明文"""
+
+    return hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:12]
+
+def estimate_text_tokens(text: str) -> int:
+
+    """粗略估算文本 token 数：汉字约 1 token/字，其余字符约 4 字符/token"""
+
+    if not text:
+
+        return 0
+
+    cjk = sum(1 for ch in text if "一" <= ch <= "鿿")
+
+    return cjk + (len(text) - cjk) // 4 + 1
+
+def estimate_request_tokens(messages: List[Dict[str, str]], max_tokens: int) -> int:
+
+    """估算一次请求消耗的 token（提示词 + 预计输出，输出按上限的一半计）"""
+
+    prompt_tokens = sum(estimate_text_tokens(m.get("content", "")) for m in messages)
+
+    return prompt_tokens + max_tokens // 2
+
+def parse_retry_after(value) -> float:
+
+    """解析 Retry-After 响应头（秒数或 HTTP 日期），无法解析时返回 None"""
+
+    if not value:
+
+        return None
+
+    try:
+
+        return max(0.0, float(value))
+
+    except ValueError:
+
+        pass
+
+    try:
+
+        retry_at = email.utils.parsedate_to_datetime(value)
+
+        return max(0.0, retry_at.timestamp() - time.time())
+
+    except Exception:
+
+        return None
+
+class TokenBucket:
+
+    """令牌桶：按固定速率补充，允许透支并返回需要等待的秒数"""
+
+    def __init__(self, rate_per_second: float, capacity: float):
+
+        self.rate = max(rate_per_second, 1e-6)
+
+        self.capacity = max(capacity, 1.0)
+
+        self.tokens = self.capacity
+
+        self.updated = time.monotonic()
+
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float) -> float:
+
+        """预扣 amount 个令牌，返回调用方应等待的秒数"""
+
+        with self._lock:
+
+            now = time.monotonic()
+
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+
+            self.updated = now
+
+            self.tokens -= amount
+
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def refund(self, amount: float):
+
+        """按实际用量多退少补（amount 为负时追加扣除）"""
+
+        with self._lock:
+
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+class AdaptiveConcurrency:
+
+    """AIMD 并发控制：延迟健康时每轮加 1，遇到 429/5xx/超时时减半"""
+
+    def __init__(self, initial: int, minimum: int = 1, maximum: int = 64):
+
+        self.minimum = max(1, minimum)
+
+        self.maximum = max(self.minimum, maximum)
+
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+
+        self.in_flight = 0
+
+        self._cond = threading.Condition()
+
+        self._latencies = deque(maxlen=50)
+
+        self._last_decrease = 0.0
+
+    def acquire(self):
+
+        with self._cond:
+
+            while self.in_flight >= int(self.limit):
+
+                self._cond.wait()
+
+            self.in_flight += 1
+
+    def release(self):
+
+        with self._cond:
+
+            self.in_flight = max(0, self.in_flight - 1)
+
+            self._cond.notify_all()
+
+    def on_success(self, latency: float):
+
+        """延迟不超过近期最小延迟的 2 倍视为健康，加性增加上限"""
+
+        with self._cond:
+
+            self._latencies.append(latency)
+
+            if latency <= min(self._latencies) * 2:
+
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+
+                self._cond.notify_all()
+
+    def on_overload(self):
+
+        """乘性减小上限；同一延迟窗口内的连续过载只收缩一次"""
+
+        with self._cond:
+
+            window = min(self._latencies) if self._latencies else 1.0
+
+            now = time.monotonic()
+
+            if now - self._last_decrease < window:
+
+                return
+
+            self._last_decrease = now
+
+            self.limit = max(self.minimum, self.limit / 2)
+
+class ProviderRateLimiter:
+
+    """单个提供商 + API Key 的限流器：请求数与 token 两个令牌桶，外加 AIMD 并发上限"""
+
+    def __init__(self, provider: str):
+
+        self.provider = provider
+
+        rpm = get_provider_setting(provider, "rpm", 60)
+
+        tpm = get_provider_setting(provider, "tpm", 100000)
+
+        # 桶容量取 10 秒的配额，允许小幅突发
+
+        self.request_bucket = TokenBucket(rpm / 60.0, rpm / 6.0)
+
+        self.token_bucket = TokenBucket(tpm / 60.0, tpm / 6.0)
+
+        self.concurrency = AdaptiveConcurrency(
+
+            initial=get_provider_concurrency(provider),
+
+            maximum=get_provider_max_concurrency(provider)
+
+        )
+
+        self._paused_until = 0.0
+
+        self._lock = threading.Lock()
+
+    def acquire(self, estimated_tokens: int):
+
+        """占用一个并发名额，并等待请求数、token 配额与 Retry-After 暂停期"""
+
+        self.concurrency.acquire()
+
+        wait = max(self.request_bucket.reserve(1), self.token_bucket.reserve(estimated_tokens))
+
+        with self._lock:
+
+            wait = max(wait, self._paused_until - time.monotonic())
+
+        if wait > 0:
+
+            time.sleep(wait)
+
+    def release(self):
+
+        self.concurrency.release()
+
+    def record_success(self, latency: float, estimated_tokens: int, actual_tokens: int):
+
+        self.token_bucket.refund(estimated_tokens - actual_tokens)
+
+        self.concurrency.on_success(latency)
+
+    def record_overload(self, retry_after: float = None):
+
+        """429/5xx/超时：收缩并发；给出 Retry-After 时该 Key 的所有请求一起暂停"""
+
+        self.concurrency.on_overload()
+
+        if retry_after:
+
+            with self._lock:
+
+                self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+
+            logger.warning(f"{self.provider} 触发限流，暂停 {retry_after:.1f} 秒")
+
+    def backoff_delay(self, attempt: int, retry_after: float = None) -> float:
+
+        """重试前的等待：优先遵循 Retry-After，否则指数退避并加随机抖动"""
+
+        if retry_after is not None:
+
+            return min(retry_after, BACKOFF_MAX_SECONDS)
+
+        return min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+    def snapshot(self) -> Dict[str, Any]:
+
+        return {
+
+            "limit": round(self.concurrency.limit, 2),
+
+            "in_flight": self.concurrency.in_flight,
+
+            "paused_seconds": round(max(0.0, self._paused_until - time.monotonic()), 1),
+
+        }
+
+@shared_resource
+
+def get_rate_limiter(provider: str, key_fingerprint: str) -> ProviderRateLimiter:
+
+    """每个 (提供商, API Key) 一个全局共享的限流器"""
+
+    return ProviderRateLimiter(provider)
+
+class UsageStats:
+
+    """按 (提供商, 模型) 累计 token 用量，用于衡量提供商前缀缓存的节省效果"""
+
+    def __init__(self):
+
+        self._lock = threading.Lock()
+
+        self._totals = {}
+
+    def record(self, provider: str, model: str, usage: Dict[str, int]):
+
+        if not usage:
+
+            return
+
+        with self._lock:
+
+            totals = self._totals.setdefault((provider, model), {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0})
+
+            totals["requests"] += 1
+
+            for key in ("prompt_tokens", "completion_tokens", "cached_tokens"):
+
+                totals[key] += usage.get(key, 0)
+
+    def get(self, provider: str, model: str) -> Dict[str, Any]:
+
+        with self._lock:
+
+            totals = dict(self._totals.get((provider, model), {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0}))
+
+        totals["cached_ratio"] = totals["cached_tokens"] / totals["prompt_tokens"] if totals["prompt_tokens"] else 0.0
+
+        return totals
+
+@shared_resource
+
+def get_usage_stats() -> UsageStats:
+
+    """全局共享的 token 用量统计"""
+
+    return UsageStats()
+
+# ===============================
+# 提供商健康状况：对冲请求与故障转移
+# ===============================
+
+# 请求超过主模型近期 p95 延迟仍未完成时，向备用模型发出一份相同的请求，取先完成者；设置 LLD_HEDGE=0 可关闭
+
+HEDGE_ENABLED = os.getenv("LLD_HEDGE", "1").strip() != "0"
+
+HEDGE_PERCENTILE = 0.95
+
+HEDGE_MIN_SAMPLES = 20  # 同类请求的延迟样本少于该数量时不对冲（p95 尚不可靠）
+
+HEDGE_MIN_DELAY_SECONDS = 1.0
+
+LATENCY_WINDOW = 200  # 每类请求保留的最近延迟样本数
+
+FAILOVER_WINDOW = 20  # 计算错误率的最近请求数
+
+FAILOVER_MIN_REQUESTS = 5
+
+FAILOVER_ERROR_RATE = float(os.getenv("LLD_FAILOVER_ERROR_RATE", "0.5"))
+
+FAILOVER_COOLDOWN_SECONDS = float(os.getenv("LLD_FAILOVER_COOLDOWN", "60"))
+
+# 自适应超时：连接超时取提供商配置；首字节与分片间隔超时取近期同类请求 p99 的 TIMEOUT_MULTIPLIER 倍，
+# 样本不足时使用 DEFAULT_READ_TIMEOUT（即原先固定的 120 秒）
+
+DEFAULT_CONNECT_TIMEOUT = 10.0
+
+DEFAULT_READ_TIMEOUT = 120.0
+
+TIMEOUT_PERCENTILE = 0.99
+
+TIMEOUT_MULTIPLIER = 3.0
+
+MIN_FIRST_BYTE_TIMEOUT = 10.0
+
+MIN_CHUNK_TIMEOUT = 5.0
+
+# 输出速度下限（token/秒，可用 LLD_MIN_TOKENS_PER_SECOND_<PROVIDER> 覆盖）：首个分片到达 STALL_GRACE_SECONDS 秒后
+# 平均速度仍低于下限的流视为卡顿，提前中止并重试
+
+STREAM_MIN_TOKENS_PER_SECOND = 2.0
+
+STALL_GRACE_SECONDS = 10.0
+
+class ProviderHealth:
+
+    """单个提供商的健康状况：各类请求的近期延迟（决定对冲时机）与近期错误率（决定是否故障转移）。
+
+    延迟按 max_tokens 分类记录：单词完整判定、精简判定与不同大小的合并判定耗时相差数倍，混在一起的 p95 没有意义。
+    错误率超过 FAILOVER_ERROR_RATE 后进入故障转移，冷却期内的请求全部发往备用模型；冷却结束后重新统计。
+    首字节延迟（同样按 max_tokens 分类）与每个请求中最长的分片间隔用于推算自适应超时。
+    """
+
+    def __init__(self, provider: str):
+
+        self.provider = provider
+
+        self._latencies = {}
+
+        self._first_byte = {}
+
+        self._gaps = deque(maxlen=LATENCY_WINDOW)
+
+        self._outcomes = deque(maxlen=FAILOVER_WINDOW)
+
+        self._failover_until = 0.0
+
+        self._lock = threading.Lock()
+
+        self.hedged = 0
+
+        self.hedge_wins = 0
+
+        self.failovers = 0
+
+    def record(self, ok: bool, latency: float = None, max_tokens: int = 0, first_byte: float = None, max_gap: float = None):
+
+        """记录一次请求尝试的结果；成功时同时记录从发出请求到读完响应的延迟、首个分片的延迟与最长分片间隔"""
+
+        with self._lock:
+
+            self._outcomes.append(ok)
+
+            if ok and latency is not None:
+
+                self._latencies.setdefault(max_tokens, deque(maxlen=LATENCY_WINDOW)).append(latency)
+
+            if ok and first_byte is not None:
+
+                self._first_byte.setdefault(max_tokens, deque(maxlen=LATENCY_WINDOW)).append(first_byte)
+
+            if ok and max_gap is not None:
+
+                self._gaps.append(max_gap)
+
+            if ok or self._failover_until > time.monotonic() or len(self._outcomes) < FAILOVER_MIN_REQUESTS:
+
+                return
+
+            error_rate = self._outcomes.count(False) / len(self._outcomes)
+
+            if error_rate >= FAILOVER_ERROR_RATE:
+
+                self._failover_until = time.monotonic() + FAILOVER_COOLDOWN_SECONDS
+
+                self._outcomes.clear()
+
+                self.failovers += 1
+
+                logger.warning(f"{self.provider} 近期错误率 {error_rate:.0%}，{FAILOVER_COOLDOWN_SECONDS:g} 秒内转由备用模型处理")
+
+    def record_hedge(self, won: bool = False):
+
+        """记录一次对冲请求；won 为 True 表示备用模型先返回"""
+
+        with self._lock:
+
+            if won:
+
+                self.hedge_wins += 1
+
+            else:
+
+                self.hedged += 1
+
+    def failing_over(self) -> bool:
+
+        with self._lock:
+
+            return self._failover_until > time.monotonic()
+
+    def hedge_delay(self, max_tokens: int) -> Optional[float]:
+
+        """同类请求的近期 p95 延迟；样本不足时返回 None（不对冲）"""
+
+        with self._lock:
+
+            samples = list(self._latencies.get(max_tokens, ()))
+
+        if len(samples) < HEDGE_MIN_SAMPLES:
+
+            return None
+
+        return max(HEDGE_MIN_DELAY_SECONDS, percentile(samples, HEDGE_PERCENTILE))
+
+    def timeouts(self, max_tokens: int) -> Tuple[float, float, float]:
+
+        """(连接超时, 首字节超时, 分片间隔超时)：后两者取近期 p99 的 TIMEOUT_MULTIPLIER 倍，限制在下限与 DEFAULT_READ_TIMEOUT 之间"""
+
+        with self._lock:
+
+            first_byte = list(self._first_byte.get(max_tokens, ()))
+
+            gaps = list(self._gaps)
+
+        def learned(samples, minimum):
+
+            if len(samples) < HEDGE_MIN_SAMPLES:
+
+                return DEFAULT_READ_TIMEOUT
+
+            return min(DEFAULT_READ_TIMEOUT, max(minimum, percentile(samples, TIMEOUT_PERCENTILE) * TIMEOUT_MULTIPLIER))
+
+        connect = get_provider_setting(self.provider, "connect_timeout", DEFAULT_CONNECT_TIMEOUT)
+
+        return connect, learned(first_byte, MIN_FIRST_BYTE_TIMEOUT), learned(gaps, MIN_CHUNK_TIMEOUT)
+
+    def snapshot(self) -> Dict[str, Any]:
+
+        with self._lock:
+
+            outcomes = list(self._outcomes)
+
+            failover_seconds = max(0.0, self._failover_until - time.monotonic())
+
+        return {
+
+            "error_rate": round(outcomes.count(False) / len(outcomes), 2) if outcomes else 0.0,
+
+            "failover_seconds": round(failover_seconds, 1),
+
+            "failovers": self.failovers,
+
+            "hedged": self.hedged,
+
+            "hedge_wins": self.hedge_wins,
+
+        }
+
+@shared_resource
+
+def get_provider_health(provider: str) -> ProviderHealth:
+
+    """每个提供商一个全局共享的健康状况统计"""
+
+    return ProviderHealth(provider)
+
+class RequestCancel:
+
+    """对冲请求的取消句柄：取消后流式读取在下一个分片处停止、不再重试，并尽力中断已建立的连接。
+
+    sent_at 为首次发出请求的时间（排队等待限流器的时间不计入对冲计时）。
+    """
+
+    def __init__(self):
+
+        self.event = threading.Event()
+
+        self.sent_at = None
+
+        self._response = None
+
+        self._lock = threading.Lock()
+
+    def is_set(self) -> bool:
+
+        return self.event.is_set()
+
+    def mark_sent(self):
+
+        if self.sent_at is None:
+
+            self.sent_at = time.monotonic()
+
+    def attach(self, response):
+
+        with self._lock:
+
+            self._response = response
+
+        if self.event.is_set():
+
+            self._close(response)
+
+    def detach(self):
+
+        with self._lock:
+
+            self._response = None
+
+    def cancel(self):
+
+        self.event.set()
+
+        with self._lock:
+
+            response = self._response
+
+        if response is not None:
+
+            self._close(response)
+
+    @staticmethod
+
+    def _close(response):
+
+        # shutdown 能唤醒阻塞在读取上的线程；close 只释放连接
+
+        try:
+
+            shutdown = getattr(response.raw, "shutdown", None)
+
+            shutdown() if shutdown else response.close()
+
+        except Exception:
+
+            pass
+
+class OpenRequests:
+
+    """进行中的模型请求（每个请求一个 RequestCancel）；批量任务中断时统一取消，此后发起的请求也立即取消"""
+
+    def __init__(self):
+
+        self.closed = threading.Event()
+
+        self._handles = set()
+
+        self._lock = threading.Lock()
+
+    @contextmanager
+
+    def track(self, cancel: RequestCancel):
+
+        with self._lock:
+
+            self._handles.add(cancel)
+
+        if self.closed.is_set():
+
+            cancel.cancel()
+
+        try:
+
+            yield cancel
+
+        finally:
+
+            with self._lock:
+
+                self._handles.discard(cancel)
+
+    def cancel_all(self) -> int:
+
+        self.closed.set()
+
+        with self._lock:
+
+            handles = list(self._handles)
+
+        for cancel in handles:
+
+            cancel.cancel()
+
+        return len(handles)
+
+OPEN_REQUESTS = OpenRequests()
+
+# 判定 JSON 完整到达后提前结束流式读取，设置 LLD_EARLY_STOP=0 可关闭
+
+EARLY_STOP_ENABLED = os.getenv("LLD_EARLY_STOP", "1").strip() != "0"
+
+def set_read_timeout(response, seconds: float):
+
+    """修改流式响应底层套接字的读取超时（首个分片到达后由首字节超时切换为分片间隔超时）；取不到套接字时保持不变"""
+
+    sock = getattr(getattr(response.raw, "connection", None), "sock", None)
+
+    if sock is None:
+
+        # 响应不复用连接时 http.client 已释放连接对象上的引用，套接字仍由响应的读取文件持有
+
+        fp = getattr(getattr(response.raw, "_fp", None), "fp", None)
+
+        sock = getattr(getattr(fp, "raw", None), "_sock", None)
+
+    try:
+
+        if sock is not None:
+
+            sock.settimeout(seconds)
+
+    except OSError:
+
+        pass
+
+def is_read_timeout(error: Exception) -> bool:
+
+    """读取超时：requests 的 Timeout，或流式读取中 urllib3 的 ReadTimeoutError（iter_content 会将其包装为 ConnectionError）"""
+
+    import requests
+
+    from urllib3.exceptions import ReadTimeoutError
+
+    if isinstance(error, (requests.exceptions.Timeout, ReadTimeoutError, TimeoutError)):
+
+        return True
+
+    return any(isinstance(arg, ReadTimeoutError) for arg in getattr(error, "args", ()))
+
+def iter_response_bytes(response, chunk_size: int = 8192):
+
+    """流式响应的字节（已按 Content-Encoding 解压），数据一到达就产出：分块传输时逐块读取；否则用 read1 取已到达的字节，
+    不等待填满缓冲区（iter_content 在非分块响应上会一直读到 chunk_size 或连接关闭）。
+    requests 以 decode_content=False 打开响应，read1 须显式要求解压，否则网关压缩过的流会原样交给 SSE 解析器"""
+
+    raw = response.raw
+
+    chunked = getattr(raw, "chunked", False)
+
+    if chunked or not hasattr(raw, "read1"):
+
+        return response.iter_content(chunk_size=None if chunked else 512)
+
+    return iter(functools.partial(raw.read1, chunk_size, decode_content=True), b"")
+
+def record_request_metrics(provider: str, model: str, latency: float, first_byte: Optional[float], generation_seconds: float, usage: Dict[str, int], content: str):
+
+    """记录一次成功请求的指标：耗时、首字节延迟、输出速度与 token 用量（无用量时按文本估算输出 token）"""
+
+    LLM_REQUESTS.labels(provider, model, "success").inc()
+
+    LLM_LATENCY.labels(provider, model).observe(latency)
+
+    if first_byte is not None:
+
+        LLM_FIRST_BYTE.labels(provider, model).observe(first_byte)
+
+    completion_tokens = usage.get("completion_tokens") if usage else None
+
+    if completion_tokens is None:
+
+        completion_tokens = estimate_text_tokens(content)
+
+    if generation_seconds > 0:
+
+        LLM_TOKENS_PER_SECOND.labels(provider, model).observe(completion_tokens / generation_seconds)
+
+    LLM_TOKENS.labels(provider, model, "completion").inc(completion_tokens)
+
+    for kind in ("prompt", "cached"):
+
+        if usage and usage.get(f"{kind}_tokens"):
+
+            LLM_TOKENS.labels(provider, model, kind).inc(usage[f"{kind}_tokens"])
+
+# ===============================
+# 增强型LLM调用（集成调试与路径修复）
+# ===============================
+
+def call_llm_api_cached(_provider, _model, _api_key, messages, max_tokens=4096, temperature=0.0, max_retries=3, word="", use_cache=True, stop_detector=None, json_mode=False, cancel=None, validate=None):
+
+    """封装LLM调用逻辑，彻底解决路径拼接与格式兼容问题；成功的响应写入本地缓存，命中时直接返回。
+
+    stop_detector 为返回 VerdictStreamDetector 的无参函数（每次尝试新建一个）：判定 JSON 完整到达后立即关闭连接，
+    不再等待模型输出剩余文本，也不再为其付费。
+
+    json_mode 为 True 且提供商支持原生 JSON 输出（MODEL_CONFIGS 中 json_mode）时，要求模型只输出一个 JSON 对象。
+
+    cancel 为 RequestCancel 时可被对冲请求的另一方取消：取消后的结果不写缓存、不计入提供商健康状况。
+    未传入时也新建一个并登记在 OPEN_REQUESTS 中，批量任务中断时由 cancel_open_requests 统一取消。
+
+    validate 为接收响应文本、返回布尔值的函数（如判定 JSON 能否解析、规则是否齐全）：未通过校验的响应照常返回给调用方，
+    但不写入缓存，调用方重试时会重新请求；命中的缓存条目未通过校验时删除并重新请求。
+
+    超时随提供商近期表现自适应（ProviderHealth.timeouts）：连接、首字节与分片间隔分别计时，
+    输出速度低于 min_tokens_per_second 的卡顿流提前中止并重试。
+    """
+
+    if cancel is None:
+
+        cancel = RequestCancel()
+
+    with OPEN_REQUESTS.track(cancel):
+
+        return _request_llm_api(_provider, _model, _api_key, messages, max_tokens, temperature, max_retries, word, use_cache, stop_detector, json_mode, cancel, validate)
+
+def _request_llm_api(_provider, _model, _api_key, messages, max_tokens, temperature, max_retries, word, use_cache, stop_detector, json_mode, cancel, validate):
+
+    """call_llm_api_cached 的实现：缓存查找、限流排队、流式读取与重试"""
+
+    if not _api_key: 
+
+        return False, {"error": "API Key 为空"}, "API Key 未提供"
+
+    if _provider not in MODEL_CONFIGS: 
+
+        return False, {"error": f"未知提供商 {_provider}"}, f"未知提供商 {_provider}"
+
+    cfg = MODEL_CONFIGS[_provider]
+
+    # 显式处理 URL 拼接，避免多余或丢失斜杠；LLD_BASE_URL_<PROVIDER> 可指向代理网关或本地模拟服务器（benchmarks/mock_llm.py）
+
+    base_url = get_provider_setting(_provider, "base_url", "").rstrip('/')
+
+    endpoint = cfg['endpoint'].lstrip('/')
+
+    url = f"{base_url}/{endpoint}"
+
+    headers = cfg["headers"](_api_key)
+
+    http = get_provider_session(_provider)
+
+    limiter = get_rate_limiter(_provider, api_key_fingerprint(_api_key))
+
+    health = get_provider_health(_provider)
+
+    payload = cfg["payload"](_model, messages, max_tokens=max_tokens, temperature=temperature, json_mode=json_mode and cfg.get("json_mode", False))
+
+    cache = get_response_cache() if use_cache else None
+
+    cache_key = ResponseCache.make_key(_provider, _model, temperature, max_tokens, messages, word) if cache else None
+
+    if cache:
+
+        with tracing.span("cache_lookup") as lookup:
+
+            cached = cache.get(cache_key)
+
+            lookup.set(hit=bool(cached))
+
+        if cached and validate is not None and not validate(extract_text_from_response(cached)):
+
+            logger.warning(f"{word or _provider} 的缓存响应未通过校验，已删除并重新请求")
+
+            cache.delete(cache_key)
+
+            cached = None
+
+        if cached:
+
+            LLM_REQUESTS.labels(_provider, _model, "cache_hit").inc()
+
+            return True, dict(cached, cache_hit=True), ""
+
+    estimated_tokens = estimate_request_tokens(messages, max_tokens)
+
+    error_msg = "未知错误"
+
+    adapter = get_stream_adapter(cfg.get("stream_format", "openai"))
+
+    min_tokens_per_second = get_provider_setting(_provider, "min_tokens_per_second", STREAM_MIN_TOKENS_PER_SECOND)
+
+    for attempt in range(max_retries):
+
+        parts = []
+
+        usage = {}
+
+        overloaded = False
+
+        stopped_early = False
+
+        stalled = False
+
+        cause = "exception"
+
+        first_at, last_at, max_gap, streamed_tokens = None, None, 0.0, 0
+
+        # 连接超时与等待响应头、首个分片的超时；首个分片到达后切换为分片间隔超时
+
+        connect_timeout, first_byte_timeout, chunk_timeout = health.timeouts(max_tokens)
+
+        detector = stop_detector() if stop_detector and EARLY_STOP_ENABLED else None
+
+        retry_after = None
+
+        # 按提供商/API Key 的 RPM、TPM 配额与自适应并发上限排队
+
+        with tracing.span("rate_limit_wait"):
+
+            limiter.acquire(estimated_tokens)
+
+        started = time.monotonic()
+
+        # 网络等待（network_ms）与流解析（sse_parse_ms）交错进行，记录为同一阶段的两项累计耗时
+
+        request_span = tracing.span("http_request", provider=_provider, model=_model, attempt=attempt + 1)
+
+        try:
+
+            if cancel is not None:
+
+                if cancel.is_set():
+
+                    error_msg = "请求已取消"
+
+                    cause = "cancelled"
+
+                    break
+
+                cancel.mark_sent()
+
+            with http.post(url, headers=headers, json=payload, stream=True, timeout=(connect_timeout, first_byte_timeout)) as response:
+
+                if cancel is not None:
+
+                    cancel.attach(response)
+
+                # 状态码非 200 处理
+
+                if response.status_code != 200:
+
+                    status_code = response.status_code
+
+                    request_span.set(status=status_code)
+
+                    try:
+
+                        detail = response.json()
+
+                    except:
+
+                        detail = response.text
+
+                    if status_code == 404:
+
+                        error_msg = f"路径错误 (404)。请确保请求地址正确：{url}"
+
+                    elif status_code == 401:
+
+                        error_msg = "鉴权失败 (401)。请检查 API Key 权限。"
+
+                    elif status_code == 429:
+
+                        error_msg = f"触发限流 (429)，第{attempt+1}次尝试: {detail}"
+
+                    else:
+
+                        error_msg = f"API 错误: {status_code} - {detail}"
+
+                    cause = "rate_limited" if status_code == 429 else "server_error" if status_code >= 500 else "http_error"
+
+                    # 404 和 401 通常是配置问题，不进行盲目重试
+
+                    if status_code in [404, 401]: break
+
+                    # 429 与 5xx 说明提供商已过载：收缩并发，并遵循 Retry-After
+
+                    overloaded = status_code == 429 or status_code >= 500
+
+                    retry_after = parse_retry_after(response.headers.get("Retry-After"))
+
+                else:
+
+                    # 按原始字节增量解析 SSE 事件，再由提供商适配函数取出增量文本与用量
+
+                    deltas = iter_stream_deltas(tracing.timed(iter_response_bytes(response), request_span, "network_ms"), adapter)
+
+                    for delta_text, chunk_usage in tracing.timed(deltas, request_span, "stream_ms"):
+
+                        # 用量：OpenAI 兼容接口在末尾分片返回，DashScope 每个分片携带累计值
+
+                        if chunk_usage:
+
+                            usage = normalize_usage(chunk_usage)
+
+                        if delta_text:
+
+                            parts.append(delta_text)
+
+                            now = time.monotonic()
+
+                            if first_at is None:
+
+                                first_at = now
+
+                                set_read_timeout(response, chunk_timeout)
+
+                            else:
+
+                                max_gap = max(max_gap, now - last_at)
+
+                            last_at = now
+
+                            # 输出速度低于下限：每隔几秒才吐出一个 token 的流不会触发读取超时，按平均速度提前中止
+
+                            streamed_tokens += estimate_text_tokens(delta_text)
+
+                            if now - first_at > STALL_GRACE_SECONDS and streamed_tokens < min_tokens_per_second * (now - first_at):
+
+                                stalled = True
+
+                                break
+
+                        if cancel is not None and cancel.is_set():
+
+                            break
+
+                        # 判定已完整：提前关闭连接。未读完的连接不能归还连接池，下次请求需重新握手，
+                        # 与模型继续生成的等待时间和输出 token 相比可以忽略
+
+                        if detector is not None and detector.feed(delta_text):
+
+                            stopped_early = True
+
+                            break
+
+            # 被取消的流只读到一部分，不能当作成功的响应
+
+            if cancel is not None and cancel.is_set():
+
+                error_msg = "请求已取消"
+
+                cause = "cancelled"
+
+                break
+
+            full_content = "".join(parts)
+
+            if stalled:
+
+                overloaded = True
+
+                cause = "stalled"
+
+                error_msg = f"流式输出过慢（{streamed_tokens / (last_at - first_at):.1f} token/秒，低于下限 {min_tokens_per_second:g}），第{attempt+1}次尝试提前中止"
+
+            elif full_content:
+
+                latency = time.monotonic() - started
+
+                if usage:
+
+                    actual_tokens = usage["prompt_tokens"] + usage["completion_tokens"]
+
+                else:
+
+                    actual_tokens = estimate_request_tokens(messages, 0) + estimate_text_tokens(full_content)
+
+                limiter.record_success(latency, estimated_tokens, actual_tokens)
+
+                record_request_metrics(_provider, _model, latency, first_at - started if first_at else None, last_at - first_at if first_at else 0.0, usage, full_content)
+
+                health.record(True, latency, max_tokens, first_byte=first_at - started if first_at else None, max_gap=max_gap if last_at != first_at else None)
+
+                get_usage_stats().record(_provider, _model, usage)
+
+                resp_json = {"choices": [{"message": {"content": full_content}}], "usage": usage}
+
+                if stopped_early:
+
+                    resp_json["stopped_early"] = True
+
+                    logger.info(f"{_provider} 判定 JSON 已完整，提前结束流式读取（{len(full_content)} 字符）")
+
+                if cache and (validate is None or validate(full_content)):
+
+                    cache.put(cache_key, _provider, _model, word, resp_json)
+
+                elif cache:
+
+                    logger.warning(f"{word or _provider} 的响应未通过校验，不写入缓存")
+
+                cause = "success"
+
+                request_span.set(status=200, chars=len(full_content), stopped_early=stopped_early, first_byte_ms=(first_at - started) * 1000 if first_at else None)
+
+                return True, resp_json, ""
+
+            elif response.status_code == 200:
+
+                error_msg = "模型未返回有效文本内容。"
+
+                cause = "empty"
+
+        except Exception as e:
+
+            # 连接、首字节或分片间隔超时（流式读取中的超时由 urllib3 抛出，不一定是 requests 的 Timeout）
+
+            if is_read_timeout(e):
+
+                overloaded = True
+
+                cause = "timeout"
+
+                error_msg = f"请求超时（第{attempt+1}次尝试，{'分片间隔' if first_at else '首字节'}超时 {chunk_timeout if first_at else first_byte_timeout:.0f} 秒）: {str(e)}"
+
+            else:
+
+                error_msg = f"请求异常（第{attempt+1}次尝试）: {str(e)}"
+
+        finally:
+
+            limiter.release()
+
+            if cancel is not None:
+
+                cancel.detach()
+
+            if "stream_ms" in request_span.attrs:
+
+                request_span.attrs["sse_parse_ms"] = request_span.attrs.pop("stream_ms") - request_span.attrs["network_ms"]
+
+            request_span.finish(outcome=cause)
+
+        if cancel is not None and cancel.is_set():
+
+            error_msg = "请求已取消"
+
+            break
+
+        health.record(False)
+
+        if overloaded:
+
+            limiter.record_overload(retry_after)
+
+        logger.warning(f"{_provider} 请求失败: {error_msg}")
+
+        if attempt < max_retries - 1:
+
+            LLM_RETRIES.labels(_provider, _model, cause).inc()
+
+            delay = limiter.backoff_delay(attempt, retry_after)
+
+            # 可取消的请求在退避期间被取消时立即返回
+
+            if cancel is not None:
+
+                cancel.event.wait(delay)
+
+            else:
+
+                time.sleep(delay)
+
+    LLM_REQUESTS.labels(_provider, _model, "cancelled" if cancel is not None and cancel.is_set() else "error").inc()
+
+    return False, {"error": error_msg}, error_msg
+
+@shared_resource
+
+def get_hedge_executor(provider: str) -> ThreadPoolExecutor:
+
+    """对冲请求的线程池：主请求与备用请求各占一个线程，调用方线程只负责等待先完成的一方"""
+
+    return ThreadPoolExecutor(max_workers=get_provider_max_concurrency(provider) * 2 + 4, thread_name_prefix=f"hedge-{provider}")
+
+def get_secondary_model(secondary: Optional[Dict[str, Any]], provider: str, model: str) -> Optional[Dict[str, Any]]:
+
+    """校验备用模型配置（AVAILABLE_MODEL_OPTIONS 中的一项）：缺少 API Key、提供商未知或与主模型相同时不启用"""
+
+    if not secondary or not secondary.get("api_key") or secondary.get("provider") not in MODEL_CONFIGS:
+
+        return None
+
+    if (secondary["provider"], secondary["model"]) == (provider, model):
+
+        return None
+
+    return secondary
+
+def call_llm_with_failover(_provider, _model, _api_key, messages, secondary: Dict[str, Any] = None, **kwargs):
+
+    """带对冲与故障转移的 LLM 调用，返回值与 call_llm_api_cached 相同；由备用模型返回的响应带 served_by 字段。
+
+    - 主提供商处于故障转移冷却期：直接请求备用模型，备用模型也失败时再试主模型；
+    - 已积累足够延迟样本：主请求发出后超过同类请求的 p95 延迟仍未完成，向备用模型发出相同请求，
+      取先成功的一方并取消另一方；
+    - 未配置备用模型或样本不足：与 call_llm_api_cached 相同。
+    """
+
+    backup = get_secondary_model(secondary, _provider, _model)
+
+    if backup is None:
+
+        return call_llm_api_cached(_provider, _model, _api_key, messages, **kwargs)
+
+    health = get_provider_health(_provider)
+
+    def call_backup(cancel=None):
+
+        ok, resp_json, err_msg = call_llm_api_cached(backup["provider"], backup["model"], backup["api_key"], messages, cancel=cancel, **kwargs)
+
+        if ok:
+
+            resp_json["served_by"] = f"{backup['provider']}:{backup['model']}"
+
+        return ok, resp_json, err_msg
+
+    if health.failing_over():
+
+        LLM_FAILOVER_REQUESTS.labels(_provider).inc()
+
+        ok, resp_json, err_msg = call_backup()
+
+        return (ok, resp_json, err_msg) if ok else call_llm_api_cached(_provider, _model, _api_key, messages, **kwargs)
+
+    delay = health.hedge_delay(kwargs.get("max_tokens", 4096)) if HEDGE_ENABLED else None
+
+    if delay is None:
+
+        return call_llm_api_cached(_provider, _model, _api_key, messages, **kwargs)
+
+    executor = get_hedge_executor(_provider)
+
+    primary_cancel = RequestCancel()
+
+    primary = executor.submit(tracing.bind(call_llm_api_cached), _provider, _model, _api_key, messages, cancel=primary_cancel, **kwargs)
+
+    # 对冲计时从主请求实际发出开始（命中缓存时直接完成，不会对冲）
+
+    while True:
+
+        sent_at = primary_cancel.sent_at
+
+        remaining = 0.05 if sent_at is None else sent_at + delay - time.monotonic()
+
+        if remaining <= 0 or wait_futures([primary], timeout=remaining).done:
+
+            break
+
+    if primary.done():
+
+        return primary.result()
+
+    health.record_hedge()
+
+    logger.info(f"{_provider} 请求超过 p95 延迟 {delay:.1f} 秒仍未完成，向备用模型 {backup['provider']}:{backup['model']} 发出对冲请求")
+
+    backup_cancel = RequestCancel()
+
+    pending = {primary: primary_cancel, executor.submit(tracing.bind(call_backup), backup_cancel): backup_cancel}
+
+    first_failure = None
+
+    while pending:
+
+        done, _ = wait_futures(pending, return_when=FIRST_COMPLETED)
+
+        for future in done:
+
+            pending.pop(future)
+
+            try:
+
+                result = future.result()
+
+            except Exception as e:
+
+                result = (False, {"error": str(e)}, f"请求异常: {e}")
+
+            if result[0]:
+
+                for other in pending.values():
+
+                    other.cancel()
+
+                if future is not primary:
+
+                    health.record_hedge(won=True)
+
+                LLM_HEDGES.labels(_provider, "primary" if future is primary else "secondary").inc()
+
+                return result
+
+            first_failure = first_failure or result
+
+    LLM_HEDGES.labels(_provider, "none").inc()
+
+    return first_failure
+
+# ===============================
+# 词类判定主函数
+# ===============================
+
+def ask_model_for_pos_and_scores(word: str, provider: str, model: str, api_key: str, notify: Callable[[str, str], None] = None, lean: bool = False, secondary: Dict[str, Any] = None) -> Tuple[Dict[str, Dict[str, int]], str, str, str, str]:
+
+    """词类判定核心函数；notify(级别, 消息) 用于向页面反馈（级别为 error/warning/caption），不传时只写日志。
+
+    lean 为 True 时使用精简模式：只要求按规则编号输出布尔判定（不含逐条说明），并启用提供商的原生 JSON 输出。
+    secondary 为备用模型配置（AVAILABLE_MODEL_OPTIONS 中的一项），用于对冲慢请求与主提供商故障时的转移。
+    返回 (得分, 原始响应, 预测词类, 说明, 实际作答的模型)；最后一项在备用模型作答时为「提供商:模型」，否则为空。
+    """
+
+    if not word:
+
+        return {}, "", "未知", "", ""
+
+    notify = notify or (lambda level, message: None)
+
+    with tracing.span("build_prompt"):
+
+        messages = build_single_word_messages(word, lean=lean)
+
+    with tracing.span("llm_call", provider=provider, model=model):
+
+        ok, resp_json, err_msg = call_llm_with_failover(
+
+            _provider=provider,
+
+            _model=model,
+
+            _api_key=api_key,
+
+            messages=messages,
+
+            max_tokens=LEAN_MAX_TOKENS if lean else 4096,
+
+            word=word,
+
+            stop_detector=lambda: VerdictStreamDetector(is_complete_coded_verdict if lean else is_complete_verdict),
+
+            json_mode=lean,
+
+            validate=is_valid_verdict_text,
+
+            secondary=secondary
+
+        )
+
+    if not ok:
+
+        notify("error", f"模型调用失败: {err_msg}")
+
+        logger.error(f"模型调用失败 - 词语:{word}, 错误:{err_msg}")
+
+        return {}, f"调用失败: {err_msg}", "未知", f"模型调用失败: {err_msg}", ""
+
+    if resp_json.get("cache_hit"):
+
+        notify("caption", "⚡ 命中本地响应缓存，未重新调用模型")
+
+        logger.info(f"命中响应缓存 - 词语:{word}, 模型:{model}")
+
+    if resp_json.get("served_by"):
+
+        notify("caption", f"主模型响应缓慢或故障，本次结果由备用模型 {resp_json['served_by']} 返回")
+
+    elif resp_json.get("usage"):
+
+        usage = resp_json["usage"]
+
+        notify("caption", f"输入 {usage['prompt_tokens']} token（其中 {usage['cached_tokens']} 命中提供商前缀缓存），输出 {usage['completion_tokens']} token")
+
+    with tracing.span("extract_json"):
+
+        raw_text = extract_text_from_response(resp_json)
+
+        parsed_json, cleaned_json_text = extract_json_from_text(raw_text)
+
+    if parsed_json and isinstance(parsed_json, dict):
+
+        explanation = parsed_json.get("explanation", LEAN_EXPLANATION if lean else "模型未提供详细推理过程。")
+
+        predicted_pos = parsed_json.get("predicted_pos", "未知")
+
+        raw_scores = parsed_json.get("scores", {})
+
+        if predicted_pos not in RULE_SETS:
+
+            notify("warning", f"模型预测的词类 '{predicted_pos}' 不在分析范围内 ('名词', '动词', '名动词')。")
+
+            logger.warning(f"模型预测的词类不在分析范围内 - 词语:{word}, 词类:{predicted_pos}")
+
+    else:
+
+        notify("error", " 未能从模型响应中解析出有效的JSON。请检查模型输出是否符合要求。")
+
+        logger.error(f"未能解析模型输出的JSON - 词语:{word}")
+
+        explanation = "无法解析模型输出。原始响应：\n" + raw_text
+
+        predicted_pos = "未知"
+
+        # 无法解析时不计分（全部记 0 分会被当作成功保存），由调用方重试
+
+        return {}, raw_text, predicted_pos, explanation, ""
+
+    with tracing.span("score"):
+
+        scores_out = scores_from_verdicts(raw_scores)
+
+    return scores_out, raw_text, predicted_pos, explanation, resp_json.get("served_by", "")
+
+# ===============================
+# 多词合并判定（一次请求判定 K 个词语）
+# ===============================
+
+def ask_model_for_pos_batch(words: List[str], provider: str, model: str, api_key: str, lean: bool = False, secondary: Dict[str, Any] = None) -> Tuple[Dict[str, Tuple[Dict[str, Dict[str, int]], str, str, str]], List[str]]:
+
+    """一次请求判定多个词语；返回 ({词语: (得分, 原始响应, 预测词类, 说明, 实际作答的模型)}, 未完整返回的词语)。
+
+    lean 为 True 时只要求输出判定（包裹在 {"results": [...]} 中以兼容原生 JSON 输出），输出上限按精简判定估算。
+    """
+
+    words = list(dict.fromkeys(w for w in words if w))
+
+    if not words:
+
+        return {}, []
+
+    per_word = LEAN_BATCH_MAX_TOKENS_PER_WORD if lean else BATCH_MAX_TOKENS_PER_WORD
+
+    max_tokens = min(BATCH_MAX_TOKENS_CAP, per_word * len(words) + 256)
+
+    with tracing.span("build_prompt", words=len(words)):
+
+        messages = build_batch_messages(words, lean=lean)
+
+    with tracing.span("llm_call", provider=provider, model=model, words=len(words)):
+
+        ok, resp_json, err_msg = call_llm_with_failover(
+
+            _provider=provider,
+
+            _model=model,
+
+            _api_key=api_key,
+
+            messages=messages,
+
+            max_tokens=max_tokens,
+
+            word="\n".join(words),
+
+            stop_detector=lambda: VerdictStreamDetector(functools.partial(is_complete_batch_verdict, words=words), opener="["),
+
+            json_mode=lean,
+
+            validate=functools.partial(is_valid_batch_verdict_text, words=words),
+
+            secondary=secondary
+
+        )
+
+    if not ok:
+
+        logger.error(f"合并判定调用失败 - 词语数:{len(words)}, 错误:{err_msg}")
+
+        return {}, words
+
+    with tracing.span("extract_json", words=len(words)):
+
+        raw_text = extract_text_from_response(resp_json)
+
+        items = extract_json_array_from_text(raw_text)
+
+    if not isinstance(items, list):
+
+        logger.error(f"未能从合并判定响应中解析出JSON数组 - 词语数:{len(words)}")
+
+        return {}, words
+
+    results = {}
+
+    score_span = tracing.span("score", words=len(words))
+
+    for item in items:
+
+        if not isinstance(item, dict):
+
+            continue
+
+        word = str(item.get("word", "")).strip()
+
+        if word not in words or word in results:
+
+            continue
+
+        scores_out, missing_rules = parse_batch_item(item)
+
+        if missing_rules:
+
+            logger.warning(f"合并判定结果缺少规则 - 词语:{word}, 缺失:{len(missing_rules)} 条")
+
+            continue
+
+        predicted_pos = item.get("predicted_pos", "未知")
+
+        explanation = item.get("explanation", LEAN_EXPLANATION if lean else "模型未提供说明。")
+
+        results[word] = (scores_out, json.dumps(item, ensure_ascii=False), predicted_pos, explanation, resp_json.get("served_by", ""))
+
+    score_span.finish(missing=len(words) - len(results))
+
+    missing_words = [w for w in words if w not in results]
+
+    return results, missing_words
+
+# ===============================
+# 并发批量执行器（按提供商限定并发）
+# ===============================
+
+@shared_resource
+
+def get_provider_executor(provider: str) -> ThreadPoolExecutor:
+
+    """每个提供商一个常驻线程池，跨 Streamlit 会话共享；线程数取并发上限，实际在途数由限流器控制"""
+
+    return ThreadPoolExecutor(max_workers=get_provider_max_concurrency(provider), thread_name_prefix=f"llm-{provider}")
+
+def cancel_open_requests() -> int:
+
+    """批量任务中断时调用：取消全部进行中的模型请求（此后发起的请求也立即取消），
+    撤销各提供商线程池与对冲线程池中尚未开始的任务并关闭线程池，不等待工作线程退出；返回取消的请求数。
+    """
+
+    cancelled = OPEN_REQUESTS.cancel_all()
+
+    for factory in (get_provider_executor, get_hedge_executor):
+
+        for executor in list(factory.instances.values()):
+
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        factory.cache_clear()
+
+    return cancelled
+
+def classify_word_with_retries(word: str, provider: str, model: str, api_key: str, max_retries: int = 3, lean: bool = False, secondary: Dict[str, Any] = None) -> Tuple[bool, Dict[str, Dict[str, int]], str, str, str, str]:
+
+    """在工作线程中判定单个词语，失败自动重试；返回 (是否成功, 得分, 原始响应, 预测词类, 说明, 实际作答的模型)。
+
+    最后一项在备用模型作答时为「提供商:模型」，否则为空；写入历史记录时按它记录提供商与模型（见 result_source）。
+    """
+
+    scores, raw_text, pred_pos, explanation, served_by = {}, "", "处理失败", "无响应", ""
+
+    success = False
+
+    for attempt in range(max_retries):
+
+        try:
+
+            scores, raw_text, pred_pos, explanation, served_by = ask_model_for_pos_and_scores(
+
+                word=word,
+
+                provider=provider,
+
+                model=model,
+
+                api_key=api_key,
+
+                lean=lean,
+
+                secondary=secondary
+
+            )
+
+            success = bool(scores)
+
+            if success:
+
+                break
+
+        except Exception as e:
+
+            explanation = f"调用异常: {str(e)}"
+
+            logger.error(f"处理词语{word}失败（尝试{attempt+1}）: {e}")
+
+    # 限流与退避由 call_llm_api_cached 中的限流器负责，这里不再固定休眠
+
+    return success, scores, raw_text, pred_pos, explanation, served_by
+
+def classify_words_batched(words: List[str], provider: str, model: str, api_key: str, max_rounds: int = 2, lean: bool = False, secondary: Dict[str, Any] = None) -> Dict[str, Tuple[bool, Dict[str, Dict[str, int]], str, str, str, str]]:
+
+    """在工作线程中合并判定一组词语；只把缺失的词语重新排队，多轮后仍缺失的逐个单独判定"""
+
+    started = time.monotonic()
+
+    results = {}
+
+    remaining = list(dict.fromkeys(words))
+
+    if len(remaining) > 1:
+
+        for round_index in range(max_rounds):
+
+            try:
+
+                batch_results, remaining = ask_model_for_pos_batch(remaining, provider, model, api_key, lean=lean, secondary=secondary)
+
+            except Exception as e:
+
+                logger.error(f"合并判定失败（第{round_index+1}轮）: {e}")
+
+                continue
+
+            for word, (scores, raw_text, pred_pos, explanation, served_by) in batch_results.items():
+
+                results[word] = (True, scores, raw_text, pred_pos, explanation, served_by)
+
+            if not remaining:
+
+                break
+
+            logger.info(f"合并判定第{round_index+1}轮缺失 {len(remaining)} 个词语，重新排队")
+
+    if len(words) > 1 and remaining:
+
+        BATCH_WORDS.labels(provider, model, "fallback").inc(len(remaining))
+
+    for word in remaining:
+
+        results[word] = classify_word_with_retries(word, provider, model, api_key, lean=lean, secondary=secondary)
+
+    succeeded = sum(1 for result in results.values() if result[0])
+
+    BATCH_WORDS.labels(provider, model, "success").inc(succeeded)
+
+    BATCH_WORDS.labels(provider, model, "failed").inc(len(results) - succeeded)
+
+    BATCH_SECONDS.labels(provider, model).observe(time.monotonic() - started)
+
+    return results
+
+# ===============================
+# 多模型集成判定（各模型同时判定，逐条规则投票后再计算隶属度）
+# ===============================
+
+FAILED_RESULT = (False, {}, "", "处理失败", "调用异常: 未返回结果", "")
+
+def ensemble_model_id(members: List[Dict[str, Any]]) -> str:
+
+    """集成成员的标识，用作断点续传任务标识与 SQLite 历史记录中的模型名"""
+
+    return "+".join(f"{member['provider']}:{member['model']}" for member in members)
+
+def combine_ensemble_results(member_results, members: List[Dict[str, Any]]) -> Tuple[bool, Dict[str, Dict[str, int]], str, str, str, str]:
+
+    """把同一词语在各成员模型上的判定结果合并为一条（格式与 classify_word_with_retries 相同）。
+
+    各模型的规则判定按成员权重（member["weight"]，默认 1，即多数投票）逐条投票，再由投票结果计分；
+    原始响应保存投票结果与每个模型的判定（votes），规则判定列与重新计分均按投票结果处理。
+    至少一个模型成功即视为成功，失败的模型在 votes 中记录原因。
+    """
+
+    rule_set = get_rule_set()
+
+    vectors, weights, predictions, votes = [], [], [], {}
+
+    explanation = ""
+
+    for member, (success, _, raw_text, pred_pos, member_explanation, served_by) in zip(members, member_results):
+
+        name = f"{member['provider']}:{member['model']}"
+
+        weight = float(member.get("weight", 1.0))
+
+        vector = verdicts_from_text(raw_text, rule_set) if success else None
+
+        if vector is None:
+
+            votes[name] = {"weight": weight, "error": member_explanation if not success else "无法解析规则判定"}
+
+            continue
+
+        vectors.append(vector)
+
+        weights.append(weight)
+
+        predictions.append(pred_pos)
+
+        votes[name] = {"weight": weight, "predicted_pos": pred_pos, "verdicts": rule_set.encode(vector)}
+
+        if served_by:
+
+            votes[name]["served_by"] = served_by
+
+        explanation = explanation or member_explanation
+
+    if not vectors:
+
+        reasons = "；".join(f"{name}: {vote['error']}" for name, vote in votes.items())
+
+        return False, {}, "", "处理失败", f"集成判定的模型全部失败（{reasons}）", ""
+
+    combined = vote_verdicts(vectors, weights)
+
+    predicted_pos = vote_predicted_pos(predictions, weights, rule_set.membership(combined))
+
+    verdict_json = {pos: {} for pos in rule_set.pos_names}
+
+    for index, verdict in enumerate(combined):
+
+        if verdict:
+
+            verdict_json[rule_set.rules[index][0]][rule_set.names[index]] = verdict > 0
+
+    raw_text = json.dumps({"predicted_pos": predicted_pos, "scores": verdict_json, "votes": votes}, ensure_ascii=False)
+
+    summary = "，".join(f"{name} → {vote.get('predicted_pos', '失败')}" for name, vote in votes.items())
+
+    method = "加权投票" if len(set(weights)) > 1 else "多数投票"
+
+    # 集成结果记在集成标识名下，各成员由备用模型作答的情况记录在 votes 中
+
+    return True, rule_set.scores(combined), raw_text, predicted_pos, f"集成判定（{method}）：{summary}\n\n{explanation}", ""
+
+
+def run_batch_ordered(jobs, provider: str, model: str, api_key: str, batch_size: int = None, lean: bool = False, secondary: Dict[str, Any] = None, ensemble: List[Dict[str, Any]] = None):
+
+    """并发判定 (序号, 词语) 序列，并按输入顺序逐条产出 (序号, 词语, 判定结果)。
+
+    相邻的 batch_size 个词语合并为一次请求（默认取模型配置），各请求在提供商线程池中并发执行；
+    结果在调用方线程中按序消费，由调用方统一写盘，因此历史文件的行顺序与输入表格保持一致。
+    lean 为 True 时使用精简模式，只取回判定、不取逐条说明；secondary 为备用模型配置，启用对冲与故障转移。
+
+    ensemble 为集成判定的成员列表（每项含 provider、model、api_key 与可选的 weight，通常首项即主模型）：
+    每组词语同时提交给各成员所属提供商的线程池，等待全部返回后按规则投票，耗时取决于最慢的成员而非各成员之和。
+    """
+
+    members = ensemble or [{"provider": provider, "model": model, "api_key": api_key}]
+
+    batch_size = max(1, batch_size or min(get_model_batch_size(m["provider"], m["model"]) for m in members))
+
+    # 预提交窗口大于并发数：队首请求较慢时，其余工作线程仍可继续处理后续词语
+
+    window = max(get_provider_max_concurrency(m["provider"]) for m in members) * 2
+
+    jobs = iter(jobs)
+
+    pending = deque()
+
+    try:
+
+        while True:
+
+            while len(pending) < window:
+
+                chunk = list(itertools.islice(jobs, batch_size))
+
+                if not chunk:
+
+                    break
+
+                # 每组词语一条追踪（按 LLD_TRACE_SAMPLE 抽样）：根阶段从提交开始，到本组结果全部被调用方消费为止
+
+                trace = tracing.start_trace("classify_batch", provider=provider, model=model, words=[word for _, word in chunk])
+
+                futures = [
+
+                    get_provider_executor(m["provider"]).submit(
+
+                        tracing.bind(classify_words_batched, trace, "classify_words", provider=m["provider"], model=m["model"]),
+
+                        [word for _, word in chunk], m["provider"], m["model"], m["api_key"], lean=lean, secondary=secondary
+
+                    )
+
+                    for m in members
+
+                ]
+
+                pending.append((chunk, futures, trace))
+
+            if not pending:
+
+                break
+
+            chunk, futures, trace = pending.popleft()
+
+            member_results = []
+
+            for member, future in zip(members, futures):
+
+                try:
+
+                    member_results.append(future.result())
+
+                except Exception as e:
+
+                    logger.error(f"处理词语{[word for _, word in chunk]}失败（{member['provider']}:{member['model']}）: {e}")
+
+                    member_results.append({})
+
+            for index, word in chunk:
+
+                # 调用方处理本条结果（写盘、更新页面）期间仍处于本组的追踪中，其阶段归入同一条追踪
+
+                with tracing.activate(trace):
+
+                    if ensemble:
+
+                        with tracing.span("ensemble_vote", word=word):
+
+                            result = combine_ensemble_results([results.get(word, FAILED_RESULT) for results in member_results], members)
+
+                    else:
+
+                        result = member_results[0].get(word, FAILED_RESULT)
+
+                    yield index, word, result
+
+            trace.finish()
+
+    finally:
+
+        # 页面重跑或中途退出时，撤销尚未开始的请求
+
+        for _, futures, _ in pending:
+
+            for future in futures:
+
+                future.cancel()
+
+def iter_pending_words(words, is_processed: Callable[[str], bool], skipped: Dict[str, int], on_skip: Callable[[int], None] = None):
+
+    """过滤空值与已处理词语（含本次任务中重复出现的词语），产出待判定的 (序号, 词语)。
+
+    is_processed 为历史存储的 contains（按索引逐个查询，不加载全部词语），为 None 时不查历史；
+    本次任务中已排队的词语另记在 scheduled 中。on_skip(序号) 在跳过一行时调用，
+    前端用它把跳过的行记入进度日志，续传起点不会停在第一个跳过的行上。
+    """
+
+    scheduled = set()
+
+    for index, value in words:
+
+        word = str(value).strip()
+
+        if not word:
+
+            skipped["empty"] = skipped.get("empty", 0) + 1
+
+            if on_skip is not None:
+
+                on_skip(index)
+
+            continue
+
+        if word in scheduled or (is_processed is not None and is_processed(word)):
+
+            skipped["existing"] = skipped.get("existing", 0) + 1
+
+            if on_skip is not None:
+
+                on_skip(index)
+
+            continue
+
+        scheduled.add(word)
+
+        yield index, word
+
+def build_history_row(index: int, word: str, result) -> Dict[str, Any]:
+
+    """根据判定结果构造一条历史记录；规则判定从原始响应中解析，供以后调整分值时离线重新计分"""
+
+    success, scores, raw_text, pred_pos, explanation, _ = result
+
+    membership = calculate_membership(scores) if success else {}
+
+    verdicts = verdicts_from_text(raw_text) if success else None
+
+    return {
+
+        "序数": index + 1,
+
+        "词语": word,
+
+        "动词": membership.get("动词", 0.0),
+
+        "名词": membership.get("名词", 0.0),
+
+        "名动词": membership.get("名动词", 0.0),
+
+        "差值/距离": round(abs(membership.get("动词", 0.0) - membership.get("名词", 0.0)), 4),
+
+        "预测词类": pred_pos,
+
+        "原始响应": raw_text if success else f"错误: {explanation}",
+
+        "时间戳": time.strftime("%Y-%m-%d %H:%M:%S"),
+
+        VERDICT_COLUMN: get_rule_set().encode(verdicts) if verdicts else ""
+
+    }
+
+def result_source(result, provider: str, model: str) -> Dict[str, str]:
+
+    """写入历史记录的提供商与模型（history_store.append 的关键字参数）：
+    备用模型作答的结果记在备用模型名下，否则为本次任务的提供商与模型"""
+
+    served_by = result[5]
+
+    if served_by:
+
+        provider, model = served_by.split(":", 1)
+
+    return {"provider": provider, "model": model}
+
+def rescore_rows(rows: List[Dict[str, Any]]) -> Tuple[Dict[str, int], List[int]]:
+
+    """按当前规则集的分值原地重新计算一批历史记录的隶属度，整批只做一次矩阵运算。
+
+    优先使用「规则判定」列；该列为空或规则布局已变化时，从原始响应中重新解析判定并补写该列。
+    失败记录（原始响应以「错误」开头）与无法解析的记录保持不变。返回 (统计, 重新计分的行下标)。
+    """
+
+    import numpy as np
+
+    rule_set = get_rule_set()
+
+    matrix, valid = rule_set.verdict_matrix([row.get(VERDICT_COLUMN, "") for row in rows])
+
+    stats = {"rows": len(rows), "from_verdicts": int(valid.sum()), "backfilled": 0, "skipped": 0, "changed": 0}
+
+    for i in np.flatnonzero(~valid):
+
+        raw_text = str(rows[i].get("原始响应") or "")
+
+        vector = None if raw_text.startswith("错误") else verdicts_from_text(raw_text, rule_set)
+
+        if not vector or not any(vector):
+
+            stats["skipped"] += 1
+
+            continue
+
+        matrix[i] = vector
+
+        valid[i] = True
+
+        rows[i][VERDICT_COLUMN] = rule_set.encode(vector)
+
+        stats["backfilled"] += 1
+
+    scored = np.flatnonzero(valid).tolist()
+
+    membership = rule_set.membership_matrix(matrix[valid]) if scored else []
+
+    columns = [rule_set.pos_names.index(pos) for pos in ("动词", "名词", "名动词")]
+
+    for i, values in zip(scored, membership):
+
+        verb, noun, noun_verb = (float(values[c]) for c in columns)
+
+        try:
+
+            previous = [float(rows[i].get(col)) for col in ("动词", "名词", "名动词")]
+
+        except (TypeError, ValueError):
+
+            previous = None
+
+        if previous != [verb, noun, noun_verb]:
+
+            stats["changed"] += 1
+
+        rows[i].update({"动词": verb, "名词": noun, "名动词": noun_verb, "差值/距离": round(abs(verb - noun), 4)})
+
+    return stats, scored
+
+# ===============================
+# 词表文件流式读取（只读表头识别目标列，逐行惰性产出词语）
+# ===============================
+
+WORD_FILE_TYPES = ["xlsx", "csv", "tsv", "txt", "xls"]
+
+def file_digest(fileobj, chunk_size: int = 1 << 20) -> str:
+
+    """分块计算文件内容的 SHA-256，不整体复制到内存"""
+
+    digest = hashlib.sha256()
+
+    fileobj.seek(0)
+
+    for chunk in iter(lambda: fileobj.read(chunk_size), b""):
+
+        digest.update(chunk)
+
+    fileobj.seek(0)
+
+    return digest.hexdigest()
+
+def detect_target_column(columns):
+
+    """第一个列名包含「词」或 word 的列"""
+
+    return next((col for col in columns if "词" in str(col) or "word" in str(col).lower()), None)
+
+class WordFileReader:
+
+    """按扩展名逐行读取词表文件，内存占用与行数无关：
+
+    - xlsx：openpyxl 只读模式读取第一个工作表；
+    - csv/tsv：csv 模块逐行解析，第一行为表头；
+    - txt：每行一个词语，无表头，列名固定为「词语」；
+    - xls：openpyxl 不支持旧格式，退回 pandas 整表读取。
+    """
+
+    def __init__(self, fileobj, name: str):
+
+        self.fileobj = fileobj
+
+        self.kind = Path(name).suffix.lower().lstrip(".")
+
+    def _rows(self):
+
+        """逐行产出单元格值（第一行为表头）"""
+
+        self.fileobj.seek(0)
+
+        if self.kind == "xlsx":
+
+            from openpyxl import load_workbook
+
+            workbook = load_workbook(self.fileobj, read_only=True, data_only=True)
+
+            try:
+
+                yield from workbook.worksheets[0].iter_rows(values_only=True)
+
+            finally:
+
+                workbook.close()
+
+        elif self.kind in ("csv", "tsv", "txt"):
+
+            text = io.TextIOWrapper(self.fileobj, encoding="utf-8-sig", errors="replace", newline="")
+
+            try:
+
+                if self.kind == "txt":
+
+                    yield ("词语",)
+
+                    for line in text:
+
+                        yield (line.strip(),)
+
+                else:
+
+                    yield from csv.reader(text, delimiter="\t" if self.kind == "tsv" else ",")
+
+            finally:
+
+                text.detach()  # 保留底层文件对象，供后续再次读取
+
+        else:
+
+            import pandas as pd
+
+            df = pd.read_excel(self.fileobj)
+
+            df = df.astype(object).where(df.notna(), None)  # 空单元格统一为 None
+
+            yield tuple(df.columns)
+
+            yield from df.itertuples(index=False, name=None)
+
+    def columns(self) -> List[str]:
+
+        """只读取表头行"""
+
+        rows = self._rows()
+
+        try:
+
+            return ["" if col is None else str(col) for col in next(rows, ())]
+
+        finally:
+
+            rows.close()
+
+    def count_rows(self) -> int:
+
+        """数据行数（不含表头）：xlsx 直接取工作表维度信息，其他格式逐行计数"""
+
+        if self.kind == "xlsx":
+
+            self.fileobj.seek(0)
+
+            from openpyxl import load_workbook
+
+            workbook = load_workbook(self.fileobj, read_only=True)
+
+            try:
+
+                max_row = workbook.worksheets[0].max_row
+
+            finally:
+
+                workbook.close()
+
+            if max_row:
+
+                return max(0, max_row - 1)
+
+        return max(0, sum(1 for _ in self._rows()) - 1)
+
+    def iter_words(self, column, start: int = 0):
+
+        """惰性产出 (行号, 词语)：行号从 0 开始、不含表头，空单元格产出空字符串"""
+
+        rows = self._rows()
+
+        try:
+
+            header = ["" if col is None else str(col) for col in next(rows, ())]
+
+            position = header.index(str(column))
+
+            for index, row in enumerate(rows):
+
+                if index < start:
+
+                    continue
+
+                value = row[position] if position < len(row) else None
+
+                yield index, "" if value is None else str(value).strip()
+
+        finally:
+
+            rows.close()
+
+# ===============================
+# 结果导出（openpyxl 只写模式流式写入临时文件）
+# ===============================
+
+EXPORT_COLUMNS = ["词语", "动词", "名词", "名动词", "差值/距离", "预测词类", "原始响应"]
+
+EXPORT_NUMERIC_COLUMNS = {"动词", "名词", "名动词", "差值/距离"}
+
+EXPORT_PAGE_ROWS = 5000  # 从历史存储分页读取的每页行数
+
+HIGHLIGHT_COLOR = "FFFF00"  # 预测词类对应单元格的高亮颜色
+
+def iter_history_rows(history_store, page_rows: int = EXPORT_PAGE_ROWS):
+
+    """分页遍历全部历史记录，每次只持有一页"""
+
+    start = 0
+
+    while True:
+
+        rows = history_store.read_rows(start, page_rows)
+
+        if not rows:
+
+            return
+
+        yield from rows
+
+        start += len(rows)
+
+class ExcelResultWriter:
+
+    """逐行写入结果工作簿：只写模式下行数据直接写入临时文件，内存占用与行数无关；
+    预测词类对应列的黄色高亮由一条条件格式规则完成，不再逐个单元格设置样式。
+    """
+
+    def __init__(self, path=None):
+
+        self.path = Path(path) if path else None
+
+        from openpyxl import Workbook
+
+        self.workbook = Workbook(write_only=True)
+
+        self.worksheet = self.workbook.create_sheet("分析结果")
+
+        self.worksheet.append(EXPORT_COLUMNS)
+
+        self.rows = 0
+
+    @staticmethod
+
+    def _cell_value(col: str, value):
+
+        """CSV 历史读出的数值列为字符串，写入前还原为数字"""
+
+        if col in EXPORT_NUMERIC_COLUMNS and isinstance(value, str):
+
+            try:
+
+                return float(value)
+
+            except ValueError:
+
+                return value
+
+        return value
+
+    def append(self, row: Dict[str, Any]):
+
+        self.worksheet.append([self._cell_value(col, row.get(col, "")) for col in EXPORT_COLUMNS])
+
+        self.rows += 1
+
+    def close(self) -> Path:
+
+        """添加高亮规则并保存，返回文件路径"""
+
+        if self.rows:
+
+            from openpyxl.styles import PatternFill
+
+            from openpyxl.formatting.rule import FormulaRule
+
+            # 动词/名词/名动词三列（B:D）中，表头等于本行「预测词类」（F 列）的单元格高亮
+
+            self.worksheet.conditional_formatting.add(
+
+                f"B2:D{self.rows + 1}",
+
+                FormulaRule(formula=["B$1=$F2"], fill=PatternFill(start_color=HIGHLIGHT_COLOR, end_color=HIGHLIGHT_COLOR, fill_type="solid"))
+
+            )
+
+        if self.path is None:
+
+            fd, path = tempfile.mkstemp(prefix="lld_results_", suffix=".xlsx")
+
+            os.close(fd)
+
+            self.path = Path(path)
+
+        self.workbook.save(self.path)
+
+        return self.path
+
+def export_results_xlsx(rows, path=None) -> Path:
+
+    """把结果行流式写成 Excel 文件"""
+
+    writer = ExcelResultWriter(path)
+
+    for row in rows:
+
+        writer.append(row)
+
+    return writer.close()
+
+def read_export_bytes(export_path) -> bytes:
+
+    """读取导出文件后删除，供下载按钮在点击时调用"""
+
+    path = Path(export_path)
+
+    try:
+
+        return path.read_bytes()
+
+    finally:
+
+        if path.exists():
+
+            path.unlink()
+
+def build_history_xlsx(history_store) -> bytes:
+
+    """把历史记录导出为带高亮的 Excel（下载按钮点击时在后台线程执行）"""
+
+    return read_export_bytes(export_results_xlsx(iter_history_rows(history_store)))
+
@@ -0,0 +1,279 @@
+"""流式响应（Server-Sent Events）的增量解码：按字节缓冲切分事件，并把各提供商的分片映射为增量文本与用量。
+
+只依赖标准库；安装了 orjson 时自动用它解析分片 JSON。
+"""
+
+import json
+
+import itertools
+
+from typing import Any, Dict, List, Optional, Tuple
+
+_STDLIB_DECODER = json.JSONDecoder()
+
+def stdlib_json_loads(raw: bytes):
+
+    """标准库解析：事件数据固定为 UTF-8，直接解码后交给 JSONDecoder，省去 json.loads 的编码探测"""
+
+    return _STDLIB_DECODER.decode(raw.decode("utf-8", errors="replace"))
+
+try:
+
+    import orjson
+
+    json_loads = orjson.loads
+
+    JSON_DECODER = "orjson"
+
+except ImportError:
+
+    json_loads = stdlib_json_loads
+
+    JSON_DECODER = "json"
+
+# 解析失败时抛出的异常类型（orjson.JSONDecodeError 是 json.JSONDecodeError 的子类）
+
+JSONDecodeError = json.JSONDecodeError
+
+class SSEEvent:
+
+    """一个完整的 SSE 事件；raw 为各 data 字段按换行拼接后的原始字节，data 为其解码文本"""
+
+    __slots__ = ("event", "raw", "id")
+
+    def __init__(self, event: str = "message", raw: bytes = b"", id: Optional[str] = None):
+
+        self.event = event
+
+        self.raw = raw
+
+        self.id = id
+
+    @property
+
+    def data(self) -> str:
+
+        return self.raw.decode("utf-8", errors="replace")
+
+    def __repr__(self):
+
+        return f"SSEEvent(event={self.event!r}, data={self.data!r}, id={self.id!r})"
+
+class SSEDecoder:
+
+    """增量 SSE 解析器：feed() 接收任意切分的原始字节，返回其中已完整的事件。
+
+    按 WHATWG 规范处理：行结束符可为 \\r\\n、\\n 或 \\r；同一事件的多个 data 行以换行拼接；
+    以冒号开头的注释行（心跳）忽略；空行派发事件。事件数据保持为字节，交给 JSON 解析器直接解码，
+    换行字节不会出现在多字节字符内部，因此跨分片截断的汉字不会被损坏。
+    """
+
+    def __init__(self):
+
+        self._buffer = b""
+
+        self._data = []
+
+        self._event = ""
+
+        self._id = None
+
+        self.last_event_id = None
+
+    def feed(self, chunk: bytes) -> List[SSEEvent]:
+
+        if not chunk:
+
+            return []
+
+        lines = (self._buffer + chunk if self._buffer else chunk).splitlines(True)
+
+        # 最后一行没有结束符时留到下一分片；以单独的 \r 结尾时也要等待，下一分片可能以 \n 开头
+
+        last = lines[-1]
+
+        if last[-1:] == b"\n":
+
+            self._buffer = b""
+
+        else:
+
+            self._buffer = lines.pop()
+
+        events = []
+
+        for line in lines:
+
+            line = line.rstrip(b"\r\n")
+
+            # 绝大多数行是单行 data 字段，直接处理
+
+            if line[:6] == b"data: ":
+
+                self._data.append(line[6:])
+
+            elif line:
+
+                self._process_field(line)
+
+            elif self._data or self._id is not None:
+
+                event = self._dispatch()
+
+                if event is not None:
+
+                    events.append(event)
+
+            else:
+
+                self._event = ""
+
+        return events
+
+    def close(self) -> List[SSEEvent]:
+
+        """流结束：处理未以换行结尾的最后一行，并派发缺少结尾空行的事件（部分提供商省略最后的空行）"""
+
+        line, self._buffer = self._buffer.rstrip(b"\r\n"), b""
+
+        if line:
+
+            self._process_field(line)
+
+        event = self._dispatch()
+
+        return [event] if event is not None else []
+
+    def _process_field(self, line: bytes):
+
+        if line[:1] == b":":
+
+            return
+
+        field, sep, value = line.partition(b":")
+
+        if sep and value[:1] == b" ":
+
+            value = value[1:]
+
+        if field == b"data":
+
+            self._data.append(value)
+
+        elif field == b"event":
+
+            self._event = value.decode("utf-8", errors="replace")
+
+        elif field == b"id" and b"\0" not in value:
+
+            self._id = value.decode("utf-8", errors="replace")
+
+    def _dispatch(self) -> Optional[SSEEvent]:
+
+        if self._id is not None:
+
+            self.last_event_id, self._id = self._id, None
+
+        event = None
+
+        if self._data:
+
+            raw = self._data[0] if len(self._data) == 1 else b"\n".join(self._data)
+
+            event = SSEEvent(self._event or "message", raw, self.last_event_id)
+
+        self._data = []
+
+        self._event = ""
+
+        return event
+
+# ===============================
+# 提供商分片适配：分片 JSON -> (增量文本, 用量原始字典)
+# ===============================
+
+def openai_delta(chunk: Dict[str, Any]) -> Tuple[str, Optional[Dict[str, Any]]]:
+
+    """OpenAI 兼容格式（DeepSeek / Moonshot / Gemini 的 OpenAI 适配层）：choices[0].delta.content；
+    用量位于末尾分片的 usage（Moonshot 位于 choices[0].usage）"""
+
+    choices = chunk.get("choices")
+
+    choice = choices[0] if choices else None
+
+    usage = chunk.get("usage") or (choice.get("usage") if choice else None)
+
+    if not choice:
+
+        return "", usage
+
+    delta = choice.get("delta") or choice.get("message") or {}
+
+    return delta.get("content") or "", usage
+
+def dashscope_delta(chunk: Dict[str, Any]) -> Tuple[str, Optional[Dict[str, Any]]]:
+
+    """DashScope 原生格式（incremental_output=True）：output.choices[0].message.content 或 output.text；
+    每个分片携带累计用量"""
+
+    output = chunk.get("output")
+
+    usage = chunk.get("usage")
+
+    if not output:
+
+        # 兼容 OpenAI 兼容模式的 DashScope 端点
+
+        return openai_delta(chunk) if "choices" in chunk else ("", usage)
+
+    choices = output.get("choices")
+
+    if choices:
+
+        return (choices[0].get("message") or {}).get("content") or "", usage
+
+    return output.get("text") or "", usage
+
+STREAM_ADAPTERS = {
+
+    "openai": openai_delta,
+
+    "dashscope": dashscope_delta,
+
+}
+
+def get_stream_adapter(stream_format: str = "openai"):
+
+    """按 MODEL_CONFIGS 中的 stream_format 取分片适配函数，未知格式按 OpenAI 兼容处理"""
+
+    return STREAM_ADAPTERS.get(stream_format, openai_delta)
+
+def iter_stream_deltas(byte_chunks, adapter=openai_delta):
+
+    """把原始字节分片解码为 (增量文本, 用量原始字典) 序列；[DONE] 与无法解析的事件跳过"""
+
+    decoder = SSEDecoder()
+
+    loads = json_loads
+
+    for events in itertools.chain(map(decoder.feed, byte_chunks), (decoder.close(),)):
+
+        for event in events:
+
+            # 不在 [DONE] 处中断：读完流的剩余部分，连接才能归还连接池复用
+
+            if event.raw == b"[DONE]":
+
+                continue
+
+            try:
+
+                chunk = loads(event.raw)
+
+            except (JSONDecodeError, UnicodeDecodeError):
+
+                continue
+
+            if isinstance(chunk, dict):
+
+                yield adapter(chunk)
@@ -0,0 +1,447 @@
+"""分阶段耗时追踪：单词分析按词语、批量处理按每组合并请求的词语生成一条追踪（trace_id），记录提示词构建、
+限流排队、网络请求、流解析、JSON 提取、计分、写盘与页面更新等阶段（span）的耗时。
+
+追踪写入 JSONL 文件，每行一个 Chrome trace 事件；`python -m lld trace FILE` 汇总各阶段耗时，
+`--chrome OUT.json` 转为 chrome://tracing / Perfetto 可直接打开的文件。
+
+按比例抽样（LLD_TRACE_SAMPLE，默认 0.1）；未设置 LLD_TRACE_FILE 或未抽中的追踪中，每个阶段只多一次上下文变量读取。
+只依赖标准库。
+"""
+
+import atexit
+
+import contextvars
+
+import json
+
+import os
+
+import random
+
+import threading
+
+import time
+
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+DEFAULT_SAMPLE_RATE = 0.1
+
+FLUSH_EVENTS = 1000  # 缓冲的事件数达到该值时写盘；每条追踪的根阶段结束时也会写盘
+
+# 进程启动时 perf_counter 与墙上时间的差值：事件时间戳取墙上时间（微秒），便于对照多个进程的追踪
+
+_WALL_OFFSET = time.time() - time.perf_counter()
+
+_current = contextvars.ContextVar("lld_trace_span", default=None)
+
+class _NoopSpan:
+
+    """未启用或未抽中时的占位阶段：所有操作为空，布尔值为 False"""
+
+    __slots__ = ()
+
+    attrs = {}
+
+    def __bool__(self):
+
+        return False
+
+    def __enter__(self):
+
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+
+        return False
+
+    def set(self, **attrs):
+
+        pass
+
+    def finish(self, **attrs):
+
+        pass
+
+NOOP_SPAN = _NoopSpan()
+
+class Span:
+
+    """一个阶段：创建时开始计时，finish() 或 with 块结束时写出；用作 with 时在块内成为当前阶段（子阶段的父阶段）"""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "attrs", "start", "tid", "_token", "_finished")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attrs: Dict[str, Any]):
+
+        self.name = name
+
+        self.trace_id = trace_id
+
+        self.span_id = "%016x" % random.getrandbits(64)
+
+        self.parent_id = parent_id
+
+        self.attrs = attrs
+
+        self.tid = threading.get_native_id()
+
+        self._token = None
+
+        self._finished = False
+
+        self.start = time.perf_counter()
+
+    def __bool__(self):
+
+        return True
+
+    def __enter__(self):
+
+        self._token = _current.set(self)
+
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+
+        _current.reset(self._token)
+
+        if exc_type is not None:
+
+            self.attrs["error"] = exc_type.__name__
+
+        self.finish()
+
+        return False
+
+    def set(self, **attrs):
+
+        self.attrs.update(attrs)
+
+    def finish(self, **attrs):
+
+        if self._finished:
+
+            return
+
+        self._finished = True
+
+        self.attrs.update(attrs)
+
+        TRACER.emit(self, time.perf_counter())
+
+class Tracer:
+
+    """追踪配置与事件缓冲；事件追加写入 JSONL 文件（多个进程可写同一文件）"""
+
+    def __init__(self, path: Optional[str] = None, sample_rate: float = DEFAULT_SAMPLE_RATE):
+
+        self._lock = threading.Lock()
+
+        self._buffer = []
+
+        self._threads = set()
+
+        self.configure(path, sample_rate)
+
+    def configure(self, path: Optional[str], sample_rate: Optional[float] = None):
+
+        """设置追踪文件与抽样比例；path 为空时关闭追踪"""
+
+        self.flush()
+
+        with self._lock:
+
+            self.path = os.path.abspath(path) if path else None
+
+            if sample_rate is not None:
+
+                self.sample_rate = min(1.0, max(0.0, float(sample_rate)))
+
+            self._threads.clear()
+
+    def sampled(self, sample_rate: Optional[float] = None) -> bool:
+
+        if self.path is None:
+
+            return False
+
+        rate = self.sample_rate if sample_rate is None else sample_rate
+
+        return rate >= 1.0 or random.random() < rate
+
+    def emit(self, span: Span, end: float):
+
+        args = {"trace_id": span.trace_id, "span_id": span.span_id}
+
+        if span.parent_id:
+
+            args["parent_id"] = span.parent_id
+
+        args.update(span.attrs)
+
+        event = {
+
+            "name": span.name,
+
+            "cat": "lld",
+
+            "ph": "X",
+
+            "ts": round((span.start + _WALL_OFFSET) * 1e6),
+
+            "dur": round((end - span.start) * 1e6),
+
+            "pid": os.getpid(),
+
+            "tid": span.tid,
+
+            "args": args
+
+        }
+
+        with self._lock:
+
+            # 每个线程首次出现时附带线程名元数据，查看器按线程名显示各行（阶段可能在其他线程结束，此时不记录）
+
+            if span.tid not in self._threads and span.tid == threading.get_native_id():
+
+                self._threads.add(span.tid)
+
+                self._buffer.append({"name": "thread_name", "ph": "M", "pid": event["pid"], "tid": span.tid, "args": {"name": threading.current_thread().name}})
+
+            self._buffer.append(event)
+
+            should_flush = span.parent_id is None or len(self._buffer) >= FLUSH_EVENTS
+
+        if should_flush:
+
+            self.flush()
+
+    def flush(self):
+
+        with self._lock:
+
+            events, self._buffer = self._buffer, []
+
+            path = getattr(self, "path", None)
+
+        if not events or path is None:
+
+            return
+
+        lines = "".join(json.dumps(event, ensure_ascii=False, default=str) + "\n" for event in events)
+
+        try:
+
+            with open(path, "a", encoding="utf-8") as f:
+
+                f.write(lines)
+
+        except OSError:
+
+            pass
+
+TRACER = Tracer(os.getenv("LLD_TRACE_FILE") or None, float(os.getenv("LLD_TRACE_SAMPLE", DEFAULT_SAMPLE_RATE)))
+
+atexit.register(TRACER.flush)
+
+def configure(path: Optional[str], sample_rate: Optional[float] = None):
+
+    """启用（或在 path 为空时关闭）追踪，见 Tracer.configure"""
+
+    TRACER.configure(path, sample_rate)
+
+def current():
+
+    """当前线程上下文中的阶段；不在抽中的追踪内时返回 None"""
+
+    return _current.get()
+
+def start_trace(name: str, sample_rate: Optional[float] = None, **attrs):
+
+    """开始一条新追踪并返回其根阶段；未启用或未抽中时返回 NOOP_SPAN。
+
+    sample_rate 覆盖全局抽样比例（如单词分析传 1.0，每次都记录）。根阶段需调用 finish() 或用作 with 块。
+    """
+
+    if not TRACER.sampled(sample_rate):
+
+        return NOOP_SPAN
+
+    return Span(name, "%032x" % random.getrandbits(128), None, attrs)
+
+def span(name: str, parent=None, **attrs):
+
+    """开始当前阶段（或 parent）下的子阶段；不在抽中的追踪内时返回 NOOP_SPAN"""
+
+    parent = parent if parent is not None else _current.get()
+
+    if not parent:
+
+        return NOOP_SPAN
+
+    return Span(name, parent.trace_id, parent.span_id, attrs)
+
+class activate:
+
+    """在 with 块内把 parent 设为当前阶段（跨线程或在生成器中继续同一条追踪）；parent 为 NOOP_SPAN 时不做任何事"""
+
+    __slots__ = ("parent", "_token")
+
+    def __init__(self, parent):
+
+        self.parent = parent
+
+        self._token = None
+
+    def __enter__(self):
+
+        if self.parent:
+
+            self._token = _current.set(self.parent)
+
+        return self.parent
+
+    def __exit__(self, exc_type, exc, tb):
+
+        if self._token is not None:
+
+            try:
+
+                _current.reset(self._token)
+
+            except ValueError:
+
+                pass  # 生成器在另一个上下文中被回收关闭
+
+        return False
+
+def bind(fn: Callable, parent=None, name: Optional[str] = None, **attrs) -> Callable:
+
+    """把 fn 绑定到 parent（默认为当前阶段），用于提交到线程池：工作线程中的阶段仍归入同一条追踪。
+
+    给出 name 时整个调用记录为一个阶段（attrs 为其属性）；不在抽中的追踪内时原样返回 fn。
+    """
+
+    parent = parent if parent is not None else _current.get()
+
+    if not parent:
+
+        return fn
+
+    def bound(*args, **kwargs):
+
+        with activate(parent):
+
+            if name is None:
+
+                return fn(*args, **kwargs)
+
+            with span(name, **attrs):
+
+                return fn(*args, **kwargs)
+
+    return bound
+
+def timed(iterable: Iterable, target, key: str) -> Iterable:
+
+    """逐项迭代 iterable，把等待每一项的耗时（毫秒）累加到 target 阶段的属性 key；target 未抽中时原样返回"""
+
+    if not target:
+
+        return iterable
+
+    return _timed(iterable, target.attrs, key)
+
+def _timed(iterable: Iterable, attrs: Dict[str, Any], key: str) -> Iterator:
+
+    iterator = iter(iterable)
+
+    attrs[key] = attrs.get(key, 0.0)
+
+    while True:
+
+        started = time.perf_counter()
+
+        try:
+
+            item = next(iterator)
+
+        except StopIteration:
+
+            attrs[key] += (time.perf_counter() - started) * 1000
+
+            return
+
+        attrs[key] += (time.perf_counter() - started) * 1000
+
+        yield item
+
+# ===============================
+# 读取追踪文件：汇总与转换
+# ===============================
+
+def read_events(path) -> List[Dict[str, Any]]:
+
+    """读取 JSONL 追踪文件中的事件，跳过无法解析的行（如进程中断时写了一半的行）"""
+
+    events = []
+
+    with open(path, encoding="utf-8") as f:
+
+        for line in f:
+
+            try:
+
+                events.append(json.loads(line))
+
+            except ValueError:
+
+                continue
+
+    return events
+
+def summarize_events(events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+
+    """按阶段名汇总耗时：次数、总耗时与 p50/p95/p99（毫秒），按总耗时降序"""
+
+    from lld.metrics import percentile
+
+    durations = {}
+
+    for event in events:
+
+        if event.get("ph") == "X":
+
+            durations.setdefault(event["name"], []).append(event["dur"] / 1000)
+
+    rows = [
+
+        {
+
+            "阶段": name,
+
+            "次数": len(values),
+
+            "总耗时(毫秒)": sum(values),
+
+            "p50": percentile(values, 0.5),
+
+            "p95": percentile(values, 0.95),
+
+            "p99": percentile(values, 0.99)
+
+        }
+
+        for name, values in durations.items()
+
+    ]
+
+    return sorted(rows, key=lambda row: row["总耗时(毫秒)"], reverse=True)
+
+def write_chrome_trace(events: List[Dict[str, Any]], path):
+
+    """写出 Chrome trace（JSON 对象格式），可在 chrome://tracing 或 ui.perfetto.dev 中打开"""
+
+    with open(path, "w", encoding="utf-8") as f:
+
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, ensure_ascii=False)
@@ -1,32 +1,14 @@
 import streamlit as st
 
-import requests
-
-import json
-
-import re
+import time
 
 import os
 
-import pandas as pd
-
-import plotly.graph_objects as go
-
-import io
-
-import time
-
 import logging
 
-import fcntl
+import functools
 
-from typing import Tuple, Dict, Any, List
-
-from openpyxl import load_workbook
-
-from openpyxl.styles import PatternFill
-
-from pathlib import Path
+from typing import Tuple, Dict, Any
 
 # ===============================
 # 基础配置与日志（新增：定位中断原因）
@@ -534,1373 +516,334 @@ hr {
 
 st.markdown(custom_css, unsafe_allow_html=True)
 
-# 全局常量（修复：使用绝对路径避免文件路径问题）
-
-BASE_DIR = Path(__file__).parent
-
-BACKUP_FILE = BASE_DIR / "batch_history_log.csv"
-
-PROGRESS_FILE = BASE_DIR / "process_progress.json"  # 新增：保存处理进度
-
-RULE_SETS = {
-
-    "名词": [
-
-        {"name": "N1_可受数量词修饰", "desc": "可以受数量词修饰", "match_score": 10, "mismatch_score": 0},
-
-        {"name": "N2_不能受副词修饰", "desc": "不能受副词修饰", "match_score": 20, "mismatch_score": -20},
-
-        {"name": "N3_可作主宾语", "desc": "可以做典型的主语或宾语", "match_score": 20, "mismatch_score": 0},
-
-        {"name": "N4_可作中心语或作定语", "desc": "可以做中心语受其他名词修饰，或者作定语直接修饰其他名词", "match_score": 10, "mismatch_score": 0},
-
-        {"name": "N5_可后附的字结构", "desc": "可以后附助词'的'构成'的'字结构", "match_score": 10, "mismatch_score": 0},
-
-        {"name": "N6_可后附方位词构处所", "desc": "可以后附方位词构成处所结构", "match_score": 10, "mismatch_score": 0},
-
-        {"name": "N7_不能作谓语核心", "desc": "不能做谓语或谓语核心", "match_score": 10, "mismatch_score": -10},
-
-        {"name": "N8_不能作补语/一般不作状语", "desc": "不能作补语，并且一般不能做状语直接修饰动词性成分", "match_score": 10, "mismatch_score": 0},
-
-    ],
-
-    "动词": [
-
-        {"name": "V1_可受否定'不/没有'修饰", "desc": "可以受否定副词'不'或'没有'修饰", "match_score": 10, "mismatch_score": 0},
-
-        {"name": "V2_可后附/插入时体助词'着/了/过'", "desc": "可以后附或中间插入时体助词'着/了/过'", "match_score": 10, "mismatch_score": 0},
-
-        {"name": "V3_可带真宾语或通过介词引导论元", "desc": "可以带真宾语或通过介词引导论元", "match_score": 20, "mismatch_score": 0},
-
-        {"name": "V4_程度副词与带宾语的关系", "desc": "不能受程度副词'很'修饰，或能同时受'很'修饰并带宾语", "match_score": 10, "mismatch_score": -10},
-
-        {"name": "V5_可有重叠/正反重叠形式", "desc": "可以有'VV, V一V, V了V, V不V, V了没有'等形式", "match_score": 10, "mismatch_score": 0},
-
-        {"name": "V6_可做谓语或谓语核心", "desc": "可以做谓语或谓语核心", "match_score": 10, "mismatch_score": -10},
-
-        {"name": "V7_不能作状语修饰动词性成分", "desc": "不能作状语修饰动词性成分", "match_score": 10, "mismatch_score": 0},
-
-        {"name": "V8_可作'怎么/怎样'提问或'这么/这样/那么'回答", "desc": "可以跟在'怎么/怎样'之后提问或跟在'这么/这样/那么'之后回答", "match_score": 10, "mismatch_score": 0},
-
-        {"name": "V9_不能跟在'多/多么'之后提问或表示感叹", "desc": "不能跟在'多'之后对性质提问，不能跟在'多么'之后表示感叹", "match_score": 10, "mismatch_score": -10},
-
-    ],
-
-    "名动词": [
-
-        {"name": "NV1_可被\"不/没有\"否定且肯定形式-1", "desc": "可以用\"不\"和\"没有\"来否定", "match_score": 10, "mismatch_score": -10},
-
-        {"name": "NV2_可附时体助词或进入\"……了没有\"格式", "desc": "可以后附时体助词\"着、了、过\"", "match_score": 10, "mismatch_score": -10},
-
-        {"name": "NV3_可带真宾语且不受\"很\"修饰", "desc": "可以带真宾语，并且不能受程度副词\"很\"等修饰", "match_score": 10, "mismatch_score": -10},
-
-        {"name": "NV4_有重叠和正反重叠形式", "desc": "可以有\"VV、V一V、V了V、V不V\"等重叠和正反重叠形式", "match_score": 10, "mismatch_score": 0},
-
-        {"name": "NV5_可作多种句法成分且可作形式动词宾语", "desc": "既可以作谓语或谓语核心，又可以作主语或宾语", "match_score": 10, "mismatch_score": -10},
-
-        {"name": "NV6_不能直接作状语", "desc": "不能直接作状语修饰动词性成分", "match_score": 10, "mismatch_score": -10},
-
-        {"name": "NV7_可修饰名词或受名词/数量词修饰", "desc": "可以修饰名词或者受名词修饰，或者可以受数量词修饰", "match_score": 10, "mismatch_score": 0},
-
-        {"name": "NV8_可跟在\"怎么/怎样/这么/这样/那么/那样\"之后", "desc": "可以跟在\"怎么、怎样\"之后提问", "match_score": 10, "mismatch_score": 0},
-
-        {"name": "NV9_不能跟在\"多/多么\"之后", "desc": "不能跟在\"多\"之后对性质的程度进行提问", "match_score": 10, "mismatch_score": -10},
-
-        {"name": "NV10_可后附方位词构成处所结构", "desc": "可以后附方位词构成处所结构", "match_score": 10, "mismatch_score": 0},
+# 判定核心与流水线（不依赖 Streamlit，命令行批处理 python -m lld 共用同一实现）
+
+from lld.core import (
+    AVAILABLE_MODEL_OPTIONS,
+    MODEL_OPTIONS,
+    RULE_SETS,
+    calculate_membership,
+    get_model_batch_size,
+    get_provider_concurrency,
+    get_top_10_positions,
+    rule_set_version,
+)
 
-    ]
+from lld import tracing
+
+from lld.metrics import REGISTRY, start_exporters_from_env
+
+from lld.pipeline import (
+    BACKUP_FILE,
+    HISTORY_COLUMNS,
+    HISTORY_WRITE_SECONDS,
+    PREVIEW_ROWS,
+    ProgressJournal,
+    WORD_FILE_TYPES,
+    WordFileReader,
+    api_key_fingerprint,
+    ask_model_for_pos_and_scores,
+    build_history_row,
+    build_history_xlsx,
+    call_llm_api_cached,
+    clear_process_progress,
+    detect_target_column,
+    ensemble_model_id,
+    file_digest,
+    get_history_count,
+    get_history_store,
+    get_provider_health,
+    get_provider_session,
+    get_rate_limiter,
+    get_response_cache,
+    get_usage_stats,
+    iter_pending_words,
+    make_job_id,
+    metrics_summary,
+    result_source,
+    run_batch_ordered,
+)
 
-}
+# 指标导出（LLD_METRICS_PORT / LLD_METRICS_FILE）；每个进程只启动一次，页面重跑不会重复启动
+start_exporters_from_env()
 
 # ===============================
-# 模型配置
+# 单词判定（页面交互）
 # ===============================
 
-MODEL_CONFIGS = {
-
-    "deepseek": {
-
-        "base_url": "https://api.deepseek.com/v1",
-
-        "endpoint": "/chat/completions",
-
-        "headers": lambda key: {"Authorization": f"Bearer {key}", "Content-Type": "application/json"},
-
-        "payload": lambda model, messages, **kw: {
-
-            "model": model, "messages": messages, "max_tokens": kw.get("max_tokens", 4096), 
-
-            "temperature": kw.get("temperature", 0.0), 
-
-            "stream": True, 
-
-        },
-
-    },
-
-    "openai": {
-
-        "base_url": "https://api.openai.com/v1",
-
-        "endpoint": "/chat/completions",
+def analyze_word_interactive(word: str, provider: str, model: str, api_key: str, secondary: Dict[str, Any] = None) -> Tuple[Dict[str, Dict[str, int]], str, str, str, str]:
 
-        "headers": lambda key: {"Authorization": f"Bearer {key}", "Content-Type": "application/json"},
+    """单词分析页：显示加载提示，并把判定过程中的提示信息渲染为页面组件"""
 
-        "payload": lambda model, messages, **kw: {
+    def notify(level: str, message: str):
 
-            "model": model, "messages": messages, "max_tokens": kw.get("max_tokens", 4096), 
+        getattr(st, level)(message)
 
-            "temperature": kw.get("temperature", 0.0), 
-
-            "stream": True,
-
-        },
-
-    },
-
-    "gemini": {
-
-        # 核心修正：Base URL 到版本号级，Endpoint 为标准 chat 接口
-
-        "base_url": "https://generativelanguage.googleapis.com/v1beta",
-
-        "endpoint": "/chat/completions",
-
-        "headers": lambda key: {"Authorization": f"Bearer {key}", "Content-Type": "application/json"},
-
-        "payload": lambda model, messages, **kw: {
-
-            "model": model, 
-
-            "messages": messages, 
-
-            "max_tokens": kw.get("max_tokens", 4096), 
-
-            "temperature": kw.get("temperature", 0.0), 
-
-            "stream": True,
-
-        },
-
-    },
-
-    "moonshot": {
-
-        "base_url": "https://api.moonshot.cn/v1",
-
-        "endpoint": "/chat/completions",
-
-        "headers": lambda key: {"Authorization": f"Bearer {key}", "Content-Type": "application/json"},
-
-        "payload": lambda model, messages, **kw: {
-
-            "model": model, "messages": messages, "max_tokens": kw.get("max_tokens", 4096), 
-
-            "temperature": kw.get("temperature", 0.0), 
-
-            "stream": True,
-
-        },
-
-    },
-
-    "qwen": {
-
-        "base_url": "https://dashscope.aliyuncs.com/api/v1",
-
-        "endpoint": "/services/aigc/text-generation/generation",
-
-        "headers": lambda key: {
-
-            "Authorization": f"Bearer {key}", 
-
-            "Content-Type": "application/json",
-
-            "X-DashScope-SSE": "enable",
-
-            "Accept": "text/event-stream"
-
-        },
-
-        "payload": lambda model, messages, **kw: {
-
-            "model": model, 
-
-            "input": {"messages": messages}, 
-
-            "parameters": {
-
-                "max_tokens": kw.get("max_tokens", 4096), 
-
-                "temperature": kw.get("temperature", 0.0),
-
-                "result_format": "message",
+    with st.spinner(f"正在调用大模型 ({model}) 进行分析，请稍候..."):
 
-                "incremental_output": True 
+        return ask_model_for_pos_and_scores(word=word, provider=provider, model=model, api_key=api_key, notify=notify, secondary=secondary)
 
-            },
+def history_frame(rows):
 
-        },
+    """历史记录行转为表格（pandas 在首次展示表格时才导入）"""
 
-    },
+    import pandas as pd
 
-}
+    return pd.DataFrame(rows, columns=HISTORY_COLUMNS)
 
 # ===============================
-# 模型选项（修正 Gemini 模型名称）
+# 雷达图绘制函数
 # ===============================
 
-MODEL_OPTIONS = {
-
-    "DeepSeek Chat": {
+def plot_radar_chart_streamlit(scores_norm: Dict[str, float], title: str):
 
-        "provider": "deepseek", 
+    """绘制词类隶属度雷达图"""
 
-        "model": "deepseek-chat", 
+    if not scores_norm:
 
-        "api_key": os.getenv("DEEPSEEK_API_KEY"),
+        st.warning("无法绘制雷达图：没有有效数据。")
 
-        "env_var": "DEEPSEEK_API_KEY"
+        return
 
-    },
+    
 
-    "OpenAI GPT-4o（推荐）": {
+    categories = list(scores_norm.keys())
 
-        "provider": "openai", 
+    if not categories:
 
-        "model": "gpt-4o-mini", 
+        st.warning("无法绘制雷达图：没有有效词类。")
 
-        "api_key": os.getenv("OPENAI_API_KEY"),
+        return
 
-        "env_var": "OPENAI_API_KEY"
+        
 
-    },
+    values = list(scores_norm.values())
 
-    "Google Gemini 1.5 Pro": {
+    categories += [categories[0]]
 
-        "provider": "gemini", 
+    values += [values[0]]
 
-        "model": "models/gemini-1.5-pro",  # 关键点：增加 models/ 前缀
+    
 
-        "api_key": os.getenv("GEMINI_API_KEY"),
+    min_val = min(values)
 
-        "env_var": "GEMINI_API_KEY"
+    max_val = max(values)
 
-    },
+    axis_min = min(min_val, -0.1) 
 
-    "Google Gemini 1.5 Flash": {
+    axis_max = max(max_val, 1.0)
 
-        "provider": "gemini", 
+    
 
-        "model": "models/gemini-1.5-flash", # 关键点：增加 models/ 前缀
+    import plotly.graph_objects as go
 
-        "api_key": os.getenv("GEMINI_API_KEY"),
+    fig = go.Figure(data=[
 
-        "env_var": "GEMINI_API_KEY"
+        go.Scatterpolar(
 
-    },
+            r=values, 
 
-    "Moonshot（Kimi）": {
+            theta=categories, 
 
-        "provider": "moonshot", 
+            fill="toself", 
 
-        "model": "moonshot-v1-32k", 
+            name="隶属度",
 
-        "api_key": os.getenv("MOONSHOT_API_KEY"),
+            hovertemplate = '<b>%{theta}</b><br>隶属度: %{r:.4f}<extra></extra>'
 
-        "env_var": "MOONSHOT_API_KEY"
+        )
 
-    },
+    ])
 
-    "Qwen（通义千问）": {
+    fig.update_layout(
 
-        "provider": "qwen", 
+        polar=dict(
 
-        "model": "qwen-max", 
+            radialaxis=dict(
 
-        "api_key": os.getenv("QWEN_API_KEY"),
+                visible=True, 
 
-        "env_var": "QWEN_API_KEY"
+                range=[axis_min, axis_max],
 
-    },
+                tickvals=[0, 0.25, 0.5, 0.75, 1.0] if axis_min >= 0 else [-1.0, -0.5, 0, 0.5, 1.0]
 
-}
+            )
 
-AVAILABLE_MODEL_OPTIONS = {
+        ),
 
-    name: info for name, info in MODEL_OPTIONS.items() if info["api_key"]
+        showlegend=False,
 
-}
+        title=dict(text=title, x=0.5, font=dict(size=16))
 
-if not AVAILABLE_MODEL_OPTIONS:
+    )
 
-    AVAILABLE_MODEL_OPTIONS = MODEL_OPTIONS
+    st.plotly_chart(fig, use_container_width=True)
 
 # ===============================
-# 增强型工具函数（解决中断核心）
+# 上传词表信息（按会话缓存）
 # ===============================
 
-def extract_text_from_response(resp_json: Dict[str, Any]) -> str:
-
-    """从不同格式的LLM响应中安全提取文本内容。"""
-
-    if not isinstance(resp_json, dict):
-
-        return ""
+def inspect_word_file(uploaded_file) -> Dict[str, Any]:
 
-    try:
+    """上传文件的表头、目标列、行数与内容哈希；按文件缓存在会话中，重跑脚本时不再读取"""
 
-        if "output" in resp_json and "text" in resp_json["output"]:
+    cache_key = f"word_file_{uploaded_file.file_id}"
 
-            return resp_json["output"]["text"]
+    if cache_key not in st.session_state:
 
-        if "choices" in resp_json and len(resp_json["choices"]) > 0:
+        reader = WordFileReader(uploaded_file, uploaded_file.name)
 
-            choice = resp_json["choices"][0]
+        columns = reader.columns()
 
-            if "message" in choice and "content" in choice["message"]:
+        st.session_state[cache_key] = {
 
-                return choice["message"]["content"]
+            "columns": columns,
 
-        return json.dumps(resp_json, ensure_ascii=False)
+            "target_col": detect_target_column(columns),
 
-    except Exception as e:
+            "total_rows": reader.count_rows(),
 
-        logger.error(f"提取响应文本失败: {e}")
+            "digest": file_digest(uploaded_file)
 
-        return json.dumps(resp_json, ensure_ascii=False)
-
-def extract_json_from_text(text: str) -> Tuple[Dict[str, Any], str]:
-
-    """从混合文本中提取并解析JSON对象。"""
+        }
 
-    match = re.search(r"(\{.*\})", text.strip(), re.DOTALL)
+    return st.session_state[cache_key]
 
-    if not match:
+# ===============================
+# 主页面逻辑（UI优化版）
+# ===============================
 
-        return None, text
+def main():
+    # ===== 顶部标题高亮卡片 =====
+    st.markdown("""
+    <div class="title-header-card">
+        <h1>基于大语言模型的汉语词类隶属度检测划类平台</h1>
+        <div class="subtitle">Chinese Membership Detection and Classification Platform Based on Large Language Models (LLMs)</div>
+        <div class="badges">
+            <span class="badge">多模型支持</span>
+            <span class="badge">隶属度分析</span>
+            <span class="badge">可视化展示</span>
+            <span class="badge">批量处理</span>
+        </div>
+    </div>
+    """, unsafe_allow_html=True)
 
-    json_text = match.group(1).strip()
+    # ===== 顶部控制区 =====
+    control_container = st.container()
+    with control_container:
+        col1, col2 = st.columns([3, 1])
+        
+        with col1:
+            # 模型设置高亮容器
+            st.markdown('<div class="section-title"><span class="icon-dot"></span> 模型设置（LLM）</div>', unsafe_allow_html=True)
+            
+            if not AVAILABLE_MODEL_OPTIONS:
+                st.error("找不到可用的 API Key！请设置以下任意一个环境变量来启用模型:")
+                for name, info in MODEL_OPTIONS.items():
+                    st.code(f"export {info['env_var']}='你的API Key'", language="bash")
+                st.markdown('</div>', unsafe_allow_html=True)
+                selected_model_display_name = list(MODEL_OPTIONS.keys())[0]
+                selected_model_info = MODEL_OPTIONS[selected_model_display_name]
+                secondary_model_info = None
+                st.selectbox("选择大模型 (不可用)", list(MODEL_OPTIONS.keys()), disabled=True)
+            else:
+                selected_model_display_name = st.selectbox(
+                    "选择大模型", 
+                    list(AVAILABLE_MODEL_OPTIONS.keys()), 
+                    key="model_select"
+                )
+                selected_model_info = AVAILABLE_MODEL_OPTIONS[selected_model_display_name]
+                # 选中模型后即在后台建立长连接，首个请求无需再握手
+                get_provider_session(selected_model_info["provider"]).warm()
+                # 备用模型：主模型请求超过近期 p95 延迟时发出对冲请求，主提供商错误率过高时临时转移
+                secondary_choices = ["不启用"] + [name for name in AVAILABLE_MODEL_OPTIONS if name != selected_model_display_name]
+                default_secondary = os.getenv("LLD_SECONDARY_MODEL", "不启用")
+                secondary_model_name = st.selectbox(
+                    "备用模型（对冲慢请求与故障转移）",
+                    secondary_choices,
+                    index=secondary_choices.index(default_secondary) if default_secondary in secondary_choices else 0,
+                    key="secondary_model_select",
+                    help="主模型的请求超过其近期 p95 延迟仍未完成时，同时向备用模型发出相同请求并采用先返回的结果；主模型近期错误率过高时，一段时间内改由备用模型处理"
+                )
+                secondary_model_info = AVAILABLE_MODEL_OPTIONS.get(secondary_model_name)
+                # 显示当前模型状态
+                st.markdown(f"""
+                <div style="display: flex; align-items: center; gap: 0.5rem; margin-top: 0.5rem;">
+                    <span class="status-badge success">● 已配置</span>
+                    <span style="color: #64748b; font-size: 0.85rem;">提供商: {selected_model_info['provider'].upper()}</span>
+                </div>
+                """, unsafe_allow_html=True)
+            
+            st.markdown('</div>', unsafe_allow_html=True)
+                
+        with col2:
+            # 连接测试高亮容器
+            st.markdown('<div class="section-title" style="justify-content: center;"><span class="icon-dot"></span> 连接测试</div>', unsafe_allow_html=True)
+            st.write("")
+            if not selected_model_info["api_key"]:
+                st.button("测试模型链接 (不可用)", type="secondary", disabled=True)
+            else:
+                if st.button("测试模型链接", type="secondary"):
+                    with st.spinner("正在测试连接..."):
+                        ok, _, err_msg = call_llm_api_cached(
+                            _provider=selected_model_info["provider"],
+                            _model=selected_model_info["model"],
+                            _api_key=selected_model_info["api_key"],
+                            messages=[{"role": "user", "content": "请回复'pong'"}],
+                            max_tokens=10,
+                            use_cache=False
+                        )
+                    if ok:
+                        st.success("成功！")
+                    else:
+                        st.error(f"失败: {err_msg}")
+                conn_stats = get_provider_session(selected_model_info["provider"]).stats()
+                st.caption(f"连接复用: {conn_stats['reused']}/{conn_stats['requests']} 次请求 · 新建连接 {conn_stats['connections']} 个")
+            st.markdown('</div>', unsafe_allow_html=True)
 
-    try:
+    st.markdown("---")
 
-        parsed_json = json.loads(json_text)
+    # ===== 分页 =====
+    tab1, tab2, tab3 = st.tabs(["单个词语详细分析", "Excel 批量处理", "运行指标"])
 
-        return parsed_json, json_text
+    # ===== 单个词语分析 =====
+    with tab1:
+        # 输入区卡片
+        st.markdown('<div class="section-title"><span class="icon-dot"></span> 词语输入</div>', unsafe_allow_html=True)
+        word = st.text_input("请输入要分析的汉语词语", placeholder="例如：苹果、跑、美丽...", key="word_input")
+        analyze_button = st.button(
+            "开始分析", 
+            type="primary",
+            disabled=not (selected_model_info["api_key"] and word)
+        )
+        
+        with st.expander("ℹ️ 使用说明", expanded=False):
+            st.info("""
+            1. **配置 API Key**: 请在运行程序前设置必要的环境变量。
+            2. **词语输入**：在上方的"词语输入"框中输入一个汉语词。
+            3. **开始分析**：点击"开始分析"按钮。
+            4. **结果解析**：系统将显示隶属度、雷达图和详细规则得分。
+            """)
+            st.markdown('</div>', unsafe_allow_html=True)
+        st.markdown('</div>', unsafe_allow_html=True)
 
-    except json.JSONDecodeError as e:
+        if analyze_button and word and selected_model_info["api_key"]:
+            # 单词分析不抽样，每次都记录追踪（未设置 LLD_TRACE_FILE 时不记录）
+            trace = tracing.start_trace("analyze_word", sample_rate=1.0, word=word, provider=selected_model_info["provider"], model=selected_model_info["model"])
+            status_placeholder = st.empty()
+            status_placeholder.info(f"正在为词语「{word}」启动分析，使用模型：{selected_model_display_name}...")
 
-        logger.error(f"解析JSON失败: {e}, 原始文本: {json_text[:100]}")
-
-        return None, json_text
-
-def normalize_key(k: str, pos_rules: list) -> str:
-
-    """标准化模型返回的规则名称"""
-
-    if not isinstance(k, str): return None
-
-    k_norm = re.sub(r'[\s_]+', '', k).upper()
-
-    for r in pos_rules:
-
-        r_norm = re.sub(r'[\s_]+', '', r["name"]).upper()
-
-        if r_norm == k_norm:
-
-            return r["name"]
-
-    return None
-
-def map_to_allowed_score(rule: dict, raw_val) -> int:
-
-    """将模型返回值映射为规则得分"""
-
-    match_score, mismatch_score = rule["match_score"], rule["mismatch_score"]
-
-    try:
-
-        if isinstance(raw_val, bool):
-
-            return match_score if raw_val else mismatch_score
-
-        if isinstance(raw_val, str):
-
-            s = raw_val.strip().lower()
-
-            if s in ("yes", "y", "true", "是", "√", "符合"):
-
-                return match_score
-
-            if s in ("no", "n", "false", "否", "×", "不符合"):
-
-                return mismatch_score
-
-        if isinstance(raw_val, (int, float)):
-
-            raw_val_int = int(raw_val)
-
-            if raw_val_int == match_score: return match_score
-
-            if raw_val_int == mismatch_score: return mismatch_score
-
-    except Exception as e:
-
-        logger.error(f"映射得分失败: {e}")
-
-    return mismatch_score
-
-def calculate_membership(scores_all: Dict[str, Dict[str, int]]) -> Dict[str, float]:
-
-    """计算隶属度"""
-
-    membership = {}
-
-    try:
-
-        for pos, scores in scores_all.items():
-
-            total_score = sum(scores.values())
-
-            normalized = total_score / 100
-
-            membership[pos] = max(-1.0, min(1.0, normalized))
-
-    except Exception as e:
-
-        logger.error(f"计算隶属度失败: {e}")
-
-    return membership
-
-def get_top_10_positions(membership: Dict[str, float]) -> List[Tuple[str, float]]:
-
-    """获取隶属度最高的前 10 个词类"""
-
-    try:
-
-        return sorted(membership.items(), key=lambda x: x[1], reverse=True)[:10]
-
-    except Exception as e:
-
-        logger.error(f"排序隶属度失败: {e}")
-
-        return []
-
-def get_history_count(backup_file):
-
-    """获取最新的历史记录数量（实时更新用）"""
-
-    if not os.path.exists(backup_file):
-
-        return 0
-
-    try:
-
-        temp_history = pd.read_csv(backup_file, encoding='utf-8-sig')
-
-        return len(temp_history)
-
-    except Exception as e:
-
-        logger.warning(f"读取历史记录数量失败: {e}")
-
-        return 0
-
-# 新增：文件写入加锁 + 重试（解决文件操作中断）
-
-def safe_write_csv(df, file_path, mode='a', header=False, encoding='utf-8-sig', max_retries=3):
-
-    """安全写入CSV，加文件锁避免冲突，失败自动重试"""
-
-    retry_count = 0
-
-    while retry_count < max_retries:
-
-        try:
-
-            with open(file_path, mode, encoding=encoding) as f:
-
-                fcntl.flock(f, fcntl.LOCK_EX)  # 排他锁
-
-                df.to_csv(f, mode=mode, header=header, index=False)
-
-                fcntl.flock(f, fcntl.LOCK_UN)  # 释放锁
-
-            return True
-
-        except Exception as e:
-
-            retry_count += 1
-
-            logger.warning(f"写入CSV失败（重试{retry_count}/{max_retries}）: {e}")
-
-            time.sleep(1)
-
-    logger.error(f"写入CSV最终失败: {file_path}")
-
-    return False
-
-# 新增：保存/加载处理进度（解决断点续传中断）
-
-def save_process_progress(file_name, current_row, total_rows):
-
-    """保存处理进度"""
-
-    try:
-
-        progress_data = {
-
-            "file_name": file_name,
-
-            "current_row": current_row,
-
-            "total_rows": total_rows,
-
-            "last_update": time.strftime("%Y-%m-%d %H:%M:%S")
-
-        }
-
-        with open(PROGRESS_FILE, 'w', encoding='utf-8') as f:
-
-            json.dump(progress_data, f, ensure_ascii=False, indent=2)
-
-    except Exception as e:
-
-        logger.error(f"保存进度失败: {e}")
-
-def load_process_progress():
-
-    """加载处理进度"""
-
-    if not os.path.exists(PROGRESS_FILE):
-
-        return None
-
-    try:
-
-        with open(PROGRESS_FILE, 'r', encoding='utf-8') as f:
-
-            return json.load(f)
-
-    except Exception as e:
-
-        logger.error(f"加载进度失败: {e}")
-
-        return None
-
-# 新增：清除进度文件
-
-def clear_process_progress():
-
-    """清除进度文件"""
-
-    if os.path.exists(PROGRESS_FILE):
-
-        try:
-
-            os.remove(PROGRESS_FILE)
-
-        except Exception as e:
-
-            logger.error(f"清除进度文件失败: {e}")
-
-# ===============================
-# 增强型LLM调用（集成调试与路径修复）
-# ===============================
-
-def call_llm_api_cached(_provider, _model, _api_key, messages, max_tokens=4096, temperature=0.0, max_retries=3):
-
-    """封装LLM调用逻辑，彻底解决路径拼接与格式兼容问题"""
-
-    if not _api_key: 
-
-        return False, {"error": "API Key 为空"}, "API Key 未提供"
-
-    if _provider not in MODEL_CONFIGS: 
-
-        return False, {"error": f"未知提供商 {_provider}"}, f"未知提供商 {_provider}"
-
-    cfg = MODEL_CONFIGS[_provider]
-
-    # 显式处理 URL 拼接，避免多余或丢失斜杠
-
-    base_url = cfg['base_url'].rstrip('/')
-
-    endpoint = cfg['endpoint'].lstrip('/')
-
-    url = f"{base_url}/{endpoint}"
-
-    
-
-    headers = cfg["headers"](_api_key)
-
-    payload = cfg["payload"](_model, messages, max_tokens=max_tokens, temperature=temperature)
-
-    streaming_placeholder = st.empty()
-
-    full_content = ""
-
-    error_msg = "未知错误"
-
-    for attempt in range(max_retries):
-
-        try:
-
-            with requests.post(url, headers=headers, json=payload, stream=True, timeout=120) as response:
-
-                # 状态码非 200 处理
-
-                if response.status_code != 200:
-
-                    status_code = response.status_code
-
-                    try:
-
-                        detail = response.json()
-
-                    except:
-
-                        detail = response.text
-
-                    
-
-                    if status_code == 404:
-
-                        error_msg = f"路径错误 (404)。请确保请求地址正确：{url}"
-
-                    elif status_code == 401:
-
-                        error_msg = "鉴权失败 (401)。请检查 API Key 权限。"
-
-                    else:
-
-                        error_msg = f"API 错误: {status_code} - {detail}"
-
-                    
-
-                    # 404 和 401 通常是配置问题，不进行盲目重试
-
-                    if status_code in [404, 401]: break
-
-                    response.raise_for_status()
-
-                # 处理 SSE 流
-
-                for line in response.iter_lines():
-
-                    if not line: continue
-
-                    line_text = line.decode('utf-8').strip()
-
-                    
-
-                    # 剥离 "data: " 前缀
-
-                    json_str = line_text[5:].strip() if line_text.startswith("data:") else line_text
-
-                    if json_str == "[DONE]": break
-
-                    
-
-                    try:
-
-                        chunk = json.loads(json_str)
-
-                        delta_text = ""
-
-                        # 兼容 OpenAI/DeepSeek/Gemini-OpenAI-Adapter 格式
-
-                        if "choices" in chunk and len(chunk["choices"]) > 0:
-
-                            choice = chunk["choices"][0]
-
-                            if "delta" in choice:
-
-                                delta_text = choice["delta"].get("content", "")
-
-                            elif "message" in choice:
-
-                                delta_text = choice["message"].get("content", "")
-
-                        # 兼容 Qwen 格式
-
-                        elif "output" in chunk:
-
-                            output = chunk["output"]
-
-                            if "choices" in output:
-
-                                delta_text = output["choices"][0].get("message", {}).get("content", "")
-
-                            elif "text" in output:
-
-                                delta_text = output["text"]
-
-                        
-
-                        if delta_text:
-
-                            full_content += delta_text
-
-                    except json.JSONDecodeError:
-
-                        continue
-
-            if full_content:
-
-                streaming_placeholder.empty()
-
-                return True, {"choices": [{"message": {"content": full_content}}]}, ""
-
-            else:
-
-                error_msg = "模型未返回有效文本内容。"
-
-        except Exception as e:
-
-            error_msg = f"请求异常（第{attempt+1}次尝试）: {str(e)}"
-
-            time.sleep(2 ** attempt)
-
-    streaming_placeholder.empty()
-
-    return False, {"error": error_msg}, error_msg
-
-# ===============================
-# 词类判定主函数
-# ===============================
-
-def ask_model_for_pos_and_scores(word: str, provider: str, model: str, api_key: str) -> Tuple[Dict[str, Dict[str, int]], str, str, str]:
-
-    """词类判定核心函数"""
-
-    if not word:
-
-        return {}, "", "未知", ""
-
-    full_rules_by_pos = {
-
-        pos: "\n".join([f"- {r['name']}: {r['desc']}（符合: {r['match_score']} 分，不符合: {r['mismatch_score']} 分）" for r in rules])
-
-        for pos, rules in RULE_SETS.items()
-
-    }
-
-    system_msg = f"""你是一名中文词法与语法方面的专家。现在要分析词语「{word}」在下列词类中的表现：
-
-- 需要判断的词类：名词、动词、名动词
-
-- 评分规则已经由系统定义，你**不要**自己设计分值，也**不要**在 JSON 中给出具体数字分数。程序将根据你的判断（true/false）自动赋值。
-
-- 你只需要判断每一条规则是"符合"还是"不符合"。
-
-【各词类的规则说明（仅供你判断使用）】
-
-【名词】
-
-{full_rules_by_pos["名词"]}
-
-【动词】
-
-{full_rules_by_pos["动词"]}
-
-【名动词】
-
-{full_rules_by_pos["名动词"]}
-
-【输出要求】
-
-1. 在 explanation 字段中，必须**逐条规则**说明判断依据，并举例（可以自己造句）：
-
-   - 格式示例：
-
-     - 「名词-N1_可受数量词修饰：符合。理由：……。例句：……。」
-
-     - 「动词-V2_可后附/插入时体助词'着/了/过'：不符合。理由：……。例句：……。」
-
-   - explanation 里要覆盖 **三个词类的所有规则**，不能只写几条。
-
-2. 在 JSON 中的 scores 字段里：
-
-   - 每一类下的每一条规则，只能给出 **布尔值 true / false**，表示是否符合该规则
-
-   - 严禁在 scores 里使用数值分数（例如 0, 5, 10 等）
-
-   - 如果你不确定，也必须做出判断（true 或 false），不要用 null、0 或其它值
-
-   - JSON 结构必须是：{{"explanation": "...", "predicted_pos": "...", "scores": {{"名词": {{...}}, "动词": {{...}}, "名动词": {{...}}}}}}
-
-3. predicted_pos：
-
-   - 请选择「名词」「动词」「名动词」之一，作为该词语最典型的词类。
-
-4. **最后输出时，先写详细的文字推理，最后单独且完整地给出一段合法的 JSON（不要再加注释）。**
-
-"""
-
-    user_prompt = f"""
-
-请严格按照上述要求分析词语「{word}」。
-
-特别注意：
-
-- 在 JSON 的 scores 部分，只能用 true/false 表示"是否符合规则"，不能使用任何数字。
-
-- explanation 中必须对每一条规则写明"符合/不符合 + 理由 + 例句"。
-
-请先给出详细推理过程，然后在最后单独输出一个 JSON 对象。
-
-"""
-
-    with st.spinner(f"正在调用大模型 ({model}) 进行分析，请稍候..."):
-
-        ok, resp_json, err_msg = call_llm_api_cached(
-
-            _provider=provider,
-
-            _model=model,
-
-            _api_key=api_key,
-
-            messages=[
-
-                {"role": "system", "content": system_msg},
-
-                {"role": "user", "content": user_prompt}
-
-            ]
-
-        )
-
-    if not ok:
-
-        st.error(f"模型调用失败: {err_msg}")
-
-        logger.error(f"模型调用失败 - 词语:{word}, 错误:{err_msg}")
-
-        return {}, f"调用失败: {err_msg}", "未知", f"模型调用失败: {err_msg}"
-
-    raw_text = extract_text_from_response(resp_json)
-
-    parsed_json, cleaned_json_text = extract_json_from_text(raw_text)
-
-    if parsed_json and isinstance(parsed_json, dict):
-
-        explanation = parsed_json.get("explanation", "模型未提供详细推理过程。")
-
-        predicted_pos = parsed_json.get("predicted_pos", "未知")
-
-        raw_scores = parsed_json.get("scores", {})
-
-        if predicted_pos not in RULE_SETS:
-
-             st.warning(f"模型预测的词类 '{predicted_pos}' 不在分析范围内 ('名词', '动词', '名动词')。")
-
-    else:
-
-        st.error(" 未能从模型响应中解析出有效的JSON。请检查模型输出是否符合要求。")
-
-        explanation = "无法解析模型输出。原始响应：\n" + raw_text
-
-        predicted_pos = "未知"
-
-        raw_scores = {}
-
-        cleaned_json_text = raw_text
-
-    scores_out = {pos: {} for pos in RULE_SETS.keys()}
-
-    try:
-
-        for pos, rules in RULE_SETS.items():
-
-            raw_pos_scores = raw_scores.get(pos, {})
-
-            if isinstance(raw_pos_scores, dict):
-
-                for k, v in raw_pos_scores.items():
-
-                    normalized_key = normalize_key(k, rules)
-
-                    if normalized_key:
-
-                        rule_def = next(r for r in rules if r["name"] == normalized_key)
-
-                        scores_out[pos][normalized_key] = map_to_allowed_score(rule_def, v)
-
-        # 补全缺失的规则得分
-
-        for pos, rules in RULE_SETS.items():
-
-            for rule in rules:
-
-                rule_name = rule["name"]
-
-                if rule_name not in scores_out[pos]:
-
-                    scores_out[pos][rule_name] = 0
-
-    except Exception as e:
-
-        logger.error(f"处理得分失败: {e}")
-
-        scores_out = {}
-
-    return scores_out, raw_text, predicted_pos, explanation
-
-# ===============================
-# 雷达图绘制函数
-# ===============================
-
-def plot_radar_chart_streamlit(scores_norm: Dict[str, float], title: str):
-
-    """绘制词类隶属度雷达图"""
-
-    if not scores_norm:
-
-        st.warning("无法绘制雷达图：没有有效数据。")
-
-        return
-
-    
-
-    categories = list(scores_norm.keys())
-
-    if not categories:
-
-        st.warning("无法绘制雷达图：没有有效词类。")
-
-        return
-
-        
-
-    values = list(scores_norm.values())
-
-    categories += [categories[0]]
-
-    values += [values[0]]
-
-    
-
-    min_val = min(values)
-
-    max_val = max(values)
-
-    axis_min = min(min_val, -0.1) 
-
-    axis_max = max(max_val, 1.0)
-
-    
-
-    fig = go.Figure(data=[
-
-        go.Scatterpolar(
-
-            r=values, 
-
-            theta=categories, 
-
-            fill="toself", 
-
-            name="隶属度",
-
-            hovertemplate = '<b>%{theta}</b><br>隶属度: %{r:.4f}<extra></extra>'
-
-        )
-
-    ])
-
-    fig.update_layout(
-
-        polar=dict(
-
-            radialaxis=dict(
-
-                visible=True, 
-
-                range=[axis_min, axis_max],
-
-                tickvals=[0, 0.25, 0.5, 0.75, 1.0] if axis_min >= 0 else [-1.0, -0.5, 0, 0.5, 1.0]
-
-            )
-
-        ),
-
-        showlegend=False,
-
-        title=dict(text=title, x=0.5, font=dict(size=16))
-
-    )
-
-    st.plotly_chart(fig, use_container_width=True)
-
-# ===============================
-# 增强型批量处理（核心修复中断）
-# ===============================
-
-def process_and_style_excel(df, selected_model_info, target_col_name, metric_placeholder, backup_file):
-
-    """批量处理Excel并实时更新数据量，增强鲁棒性"""
-
-    output = io.BytesIO()
-
-    if 'processed_history' not in st.session_state:
-
-        st.session_state.processed_history = []
-
-    
-
-    progress_bar = st.progress(0)
-
-    status_text = st.empty()
-
-    backup_info_placeholder = st.container()
-
-    total = len(df)
-
-    file_name = f"excel_{int(time.time())}"  # 唯一标识当前文件
-
-    
-
-    # 加载上次进度
-
-    last_progress = load_process_progress()
-
-    start_row = 0
-
-    if last_progress and last_progress.get("file_name") == file_name:
-
-        start_row = last_progress.get("current_row", 0)
-
-        st.info(f"检测到上次未完成的任务，从第 {start_row+1} 行继续处理")
-
-    
-
-    try:
-
-        for index in range(start_row, total):
-
-            row = df.iloc[index]
-
-            word = str(row[target_col_name]).strip()
-
-            
-
-            # 保存当前进度
-
-            save_process_progress(file_name, index, total)
-
-            
-
-            # 单条数据异常捕获（核心：避免单条失败中断整体）
-
-            try:
-
-                max_retries = 3
-
-                success = False
-
-                scores_all, raw_text, predicted_pos, explanation = {}, "", "请求失败", ""
-
-                
-
-                for attempt in range(max_retries):
-
-                    try:
-
-                        status_text.text(f"正在处理 ({index + 1}/{total}): {word} ... (尝试 {attempt + 1})")
-
-                        scores_all, raw_text, predicted_pos, explanation = ask_model_for_pos_and_scores(
-
-                            word=word,
-
-                            provider=selected_model_info["provider"],
-
-                            model=selected_model_info["model"],
-
-                            api_key=selected_model_info["api_key"]
-
-                        )
-
-                        if scores_all:
-
-                            success = True
-
-                            break
-
-                        time.sleep(2)
-
-                    except Exception as e:
-
-                        logger.error(f"处理词语{word}失败（尝试{attempt+1}）: {e}")
-
-                        time.sleep(2)
-
-                
-
-                # 构造数据行
-
-                membership = calculate_membership(scores_all) if success else {}
-
-                new_row = {
-
-                    "序数": index + 1,
-
-                    "词语": word,
-
-                    "动词": membership.get("动词", 0.0),
-
-                    "名词": membership.get("名词", 0.0),
-
-                    "名动词": membership.get("名动词", 0.0),
-
-                    "差值/距离": round(abs(membership.get("动词", 0.0) - membership.get("名词", 0.0)), 4),
-
-                    "预测词类": predicted_pos,
-
-                    "原始响应": raw_text if success else f"错误: {explanation}",
-
-                    "时间戳": time.strftime("%Y-%m-%d %H:%M:%S")
-
-                }
-
-                
-
-                # 保存到SessionState
-
-                st.session_state.processed_history.append(new_row)
-
-                
-
-                # 安全写入CSV并实时更新数据量
-
-                try:
-
-                    temp_df = pd.DataFrame([new_row])
-
-                    header_needed = not os.path.exists(backup_file)
-
-                    write_success = safe_write_csv(temp_df, backup_file, mode='a', header=header_needed)
-
-                    if write_success:
-
-                        # 实时更新已存数据量
-
-                        latest_count = get_history_count(backup_file)
-
-                        metric_placeholder.metric("已存数据量", f"{latest_count} 条")
-
-                    else:
-
-                        st.error(f" 保存第 {index+1} 条记录失败（文件写入错误）")
-
-                except Exception as csv_err:
-
-                    st.error(f"保存第 {index+1} 条记录失败: {csv_err}")
-
-                    logger.error(f"保存CSV失败 - 行号:{index+1}, 错误:{csv_err}")
-
-                with backup_info_placeholder:
-
-                    st.info(f"已自动保存第 {index+1} 条记录。如遇中断，下次将从第 {index+2} 行继续")
-
-                progress_bar.progress((index + 1) / total)
-
-                time.sleep(0.5)  # 限流：避免请求过快被封禁
-
-                
-
-            except Exception as row_err:
-
-                logger.error(f"处理第{index+1}行失败（跳过）: {row_err}")
-
-                st.warning(f" 跳过第 {index+1} 行（处理失败）: {row_err}")
-
-                progress_bar.progress((index + 1) / total)
-
-                continue
-
-    except Exception as e:
-
-        st.error(f"批量处理意外中断: {e}")
-
-        logger.error(f"批量处理中断: {e}")
-
-        return None
-
-    finally:
-
-        # 处理完成/中断后清除进度文件
-
-        clear_process_progress()
-
-    
-
-    # 导出Excel
-
-    final_data = st.session_state.processed_history
-
-    if not final_data:
-
-        return None
-
-    result_df = pd.DataFrame(final_data)
-
-    try:
-
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-
-            cols = ["词语", "动词", "名词", "名动词", "差值/距离", "预测词类", "原始响应"]
-
-            result_df[cols].to_excel(writer, index=False, sheet_name='分析结果')
-
-            
-
-            workbook = writer.book
-
-            worksheet = writer.sheets['分析结果']
-
-            yellow_fill = PatternFill(start_color="FFFF00", end_color="FFFF00", fill_type="solid")
-
-            
-
-            for i, data_row in enumerate(final_data):
-
-                row_num = i + 2
-
-                pred = data_row["预测词类"]
-
-                target_idx = {"动词": 2, "名词": 3, "名动词": 4}.get(pred)
-
-                if target_idx:
-
-                    worksheet.cell(row=row_num, column=target_idx).fill = yellow_fill
-
-                    
-
-        return output.getvalue()
-
-    except Exception as e:
-
-        st.error(f"Excel 生成失败: {e}")
-
-        logger.error(f"生成Excel失败: {e}")
-
-        return None
-
-# ===============================
-# 主页面逻辑（UI优化版）
-# ===============================
-
-def main():
-    # ===== 顶部标题高亮卡片 =====
-    st.markdown("""
-    <div class="title-header-card">
-        <h1>基于大语言模型的汉语词类隶属度检测划类平台</h1>
-        <div class="subtitle">Chinese Membership Detection and Classification Platform Based on Large Language Models (LLMs)</div>
-        <div class="badges">
-            <span class="badge">多模型支持</span>
-            <span class="badge">隶属度分析</span>
-            <span class="badge">可视化展示</span>
-            <span class="badge">批量处理</span>
-        </div>
-    </div>
-    """, unsafe_allow_html=True)
-
-    # ===== 顶部控制区 =====
-    control_container = st.container()
-    with control_container:
-        col1, col2 = st.columns([3, 1])
-        
-        with col1:
-            # 模型设置高亮容器
-            st.markdown('<div class="section-title"><span class="icon-dot"></span> 模型设置（LLM）</div>', unsafe_allow_html=True)
-            
-            if not AVAILABLE_MODEL_OPTIONS:
-                st.error("找不到可用的 API Key！请设置以下任意一个环境变量来启用模型:")
-                for name, info in MODEL_OPTIONS.items():
-                    st.code(f"export {info['env_var']}='你的API Key'", language="bash")
-                st.markdown('</div>', unsafe_allow_html=True)
-                selected_model_display_name = list(MODEL_OPTIONS.keys())[0]
-                selected_model_info = MODEL_OPTIONS[selected_model_display_name]
-                st.selectbox("选择大模型 (不可用)", list(MODEL_OPTIONS.keys()), disabled=True)
-            else:
-                selected_model_display_name = st.selectbox(
-                    "选择大模型", 
-                    list(AVAILABLE_MODEL_OPTIONS.keys()), 
-                    key="model_select"
+            with tracing.activate(trace):
+                scores_all, raw_text, predicted_pos, explanation, _ = analyze_word_interactive(
+                    word=word,
+                    provider=selected_model_info["provider"],
+                    model=selected_model_info["model"],
+                    api_key=selected_model_info["api_key"],
+                    secondary=secondary_model_info
                 )
-                selected_model_info = AVAILABLE_MODEL_OPTIONS[selected_model_display_name]
-                # 显示当前模型状态
-                st.markdown(f"""
-                <div style="display: flex; align-items: center; gap: 0.5rem; margin-top: 0.5rem;">
-                    <span class="status-badge success">● 已配置</span>
-                    <span style="color: #64748b; font-size: 0.85rem;">提供商: {selected_model_info['provider'].upper()}</span>
-                </div>
-                """, unsafe_allow_html=True)
-            
-            st.markdown('</div>', unsafe_allow_html=True)
-                
-        with col2:
-            # 连接测试高亮容器
-            st.markdown('<div class="section-title" style="justify-content: center;"><span class="icon-dot"></span> 连接测试</div>', unsafe_allow_html=True)
-            st.write("")
-            if not selected_model_info["api_key"]:
-                st.button("测试模型链接 (不可用)", type="secondary", disabled=True)
-            else:
-                if st.button("测试模型链接", type="secondary"):
-                    with st.spinner("正在测试连接..."):
-                        ok, _, err_msg = call_llm_api_cached(
-                            _provider=selected_model_info["provider"],
-                            _model=selected_model_info["model"],
-                            _api_key=selected_model_info["api_key"],
-                            messages=[{"role": "user", "content": "请回复'pong'"}],
-                            max_tokens=10
-                        )
-                    if ok:
-                        st.success("成功！")
-                    else:
-                        st.error(f"失败: {err_msg}")
-            st.markdown('</div>', unsafe_allow_html=True)
-
-    st.markdown("---")
-
-    # ===== 分页 =====
-    tab1, tab2 = st.tabs(["单个词语详细分析", "Excel 批量处理"])
-
-    # ===== 单个词语分析 =====
-    with tab1:
-        # 输入区卡片
-        st.markdown('<div class="section-title"><span class="icon-dot"></span> 词语输入</div>', unsafe_allow_html=True)
-        word = st.text_input("请输入要分析的汉语词语", placeholder="例如：苹果、跑、美丽...", key="word_input")
-        analyze_button = st.button(
-            "开始分析", 
-            type="primary",
-            disabled=not (selected_model_info["api_key"] and word)
-        )
-        
-        with st.expander("ℹ️ 使用说明", expanded=False):
-            st.info("""
-            1. **配置 API Key**: 请在运行程序前设置必要的环境变量。
-            2. **词语输入**：在上方的"词语输入"框中输入一个汉语词。
-            3. **开始分析**：点击"开始分析"按钮。
-            4. **结果解析**：系统将显示隶属度、雷达图和详细规则得分。
-            """)
-            st.markdown('</div>', unsafe_allow_html=True)
-        st.markdown('</div>', unsafe_allow_html=True)
-
-        if analyze_button and word and selected_model_info["api_key"]:
-            status_placeholder = st.empty()
-            status_placeholder.info(f"正在为词语「{word}」启动分析，使用模型：{selected_model_display_name}...")
-
-            scores_all, raw_text, predicted_pos, explanation = ask_model_for_pos_and_scores(
-                word=word,
-                provider=selected_model_info["provider"],
-                model=selected_model_info["model"],
-                api_key=selected_model_info["api_key"]
-            )
             
             status_placeholder.empty()
+            render_span = tracing.span("render_result", parent=trace)
             
             if scores_all:
                 membership = calculate_membership(scores_all)
@@ -1970,6 +913,8 @@ def main():
                                     "得分": rule_score
                                 })
                             rule_data_sorted = sorted(rule_data, key=lambda x: x["得分"], reverse=True)
+                            import pandas as pd
+
                             rule_df = pd.DataFrame(rule_data_sorted)
                             styled_df = rule_df.style.map(
                                 lambda x: "color: #ff4b4b; font-weight: bold"
@@ -1989,6 +934,9 @@ def main():
                         st.code(raw_text, language="text")
                     st.markdown('</div>', unsafe_allow_html=True)
 
+            render_span.finish()
+            trace.finish()
+
     # ===== 批量处理 =====
     with tab2:
         # 批量任务监控标题
@@ -2002,30 +950,49 @@ def main():
             # 可实时更新的metric占位符
             metric_placeholder = st.empty()
             # 初始化显示最新数量
+            history_store = get_history_store(BACKUP_FILE)
             history_count = get_history_count(BACKUP_FILE)
             metric_placeholder.metric("已存数据量", f"{history_count} 条")
             
-            has_history = os.path.exists(BACKUP_FILE)
+            has_history = history_store.exists()
             if has_history:
-                st.caption(f"存储位置: `{BACKUP_FILE}`")
+                st.caption(f"存储位置: `{getattr(history_store, 'db_path', BACKUP_FILE)}`")
+            cache_stats = get_response_cache().stats()
+            st.caption(
+                f"响应缓存: 命中 {cache_stats['hits']} 次 / 未命中 {cache_stats['misses']} 次"
+                f" · 平均命中耗时 {cache_stats['avg_hit_ms']} ms · 已缓存 {cache_stats['entries']} 条"
+            )
+            usage_stats = get_usage_stats().get(selected_model_info["provider"], selected_model_info["model"])
+            if usage_stats["requests"]:
+                st.caption(
+                    f"提示词前缀缓存: {usage_stats['cached_tokens']}/{usage_stats['prompt_tokens']} 输入 token 命中"
+                    f"（{usage_stats['cached_ratio']:.0%}）· 规则集版本 {rule_set_version()}"
+                )
         
         with ctrl_col2:
-            if os.path.exists(BACKUP_FILE):
-                with open(BACKUP_FILE, "rb") as f:
-                    st.download_button(
-                        label="下载历史文件(CSV)",
-                        data=f,
-                        file_name=f"batch_results_{time.strftime('%Y%m%d_%H%M%S')}.csv",
-                        mime="text/csv",
-                        use_container_width=True
-                    )
+            if has_history:
+                # 文件内容在点击时才生成/读取（后台线程执行，不阻塞页面）
+                st.download_button(
+                    label="下载历史文件(CSV)",
+                    data=lambda: history_store.export_csv().read_bytes(),
+                    file_name=f"batch_results_{time.strftime('%Y%m%d_%H%M%S')}.csv",
+                    mime="text/csv",
+                    use_container_width=True
+                )
+                st.download_button(
+                    label="下载结果(Excel)",
+                    data=functools.partial(build_history_xlsx, history_store),
+                    file_name=f"batch_results_{time.strftime('%Y%m%d_%H%M%S')}.xlsx",
+                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                    use_container_width=True
+                )
             else:
                 st.button("下载历史文件", disabled=True, use_container_width=True)
         with ctrl_col3:
             if st.button("清空本地记录", use_container_width=True, type="secondary"):
-                if os.path.exists(BACKUP_FILE):
+                if has_history:
                     try:
-                        os.remove(BACKUP_FILE)
+                        history_store.clear()
                         clear_process_progress()  # 同时清除进度
                         st.success("已清空本地记录和进度")
                         metric_placeholder.metric("已存数据量", "0 条")
@@ -2042,13 +1009,13 @@ def main():
         progress_bar = st.progress(0)
         status_info = st.empty()
         
-        # 实时结果预览
-        st.markdown("#### 实时结果预览")
+        # 实时结果预览（只显示最近若干条，来自内存环形缓冲，开销与历史规模无关）
+        st.markdown(f"#### 实时结果预览（最近 {PREVIEW_ROWS} 条）")
         table_placeholder = st.empty()
-        if os.path.exists(BACKUP_FILE):
+        if has_history:
             try:
                 table_placeholder.dataframe(
-                    pd.read_csv(BACKUP_FILE, encoding='utf-8-sig'), 
+                    history_frame(history_store.tail_rows()), 
                     use_container_width=True, 
                     height=300
                 )
@@ -2057,138 +1024,229 @@ def main():
         else:
             table_placeholder.info("暂无数据。上传文件并点击开始后，结果将在此逐行实时显示。")
         
+        # 按需分页浏览完整历史（通过偏移索引只读取当前页）
+        if history_count > PREVIEW_ROWS and st.checkbox("分页浏览全部历史记录", key="history_paging"):
+            page_col1, page_col2 = st.columns([1, 3])
+            with page_col1:
+                page_size = st.selectbox("每页条数", [50, 100, 500], key="history_page_size")
+                page_count = (history_count + page_size - 1) // page_size
+                page = st.number_input(f"页码（共 {page_count} 页）", min_value=1, max_value=page_count, value=1, step=1, key="history_page")
+            with page_col2:
+                st.dataframe(
+                    history_frame(history_store.read_rows((page - 1) * page_size, page_size)),
+                    use_container_width=True,
+                    height=300
+                )
+        
         st.divider()
         
         # 上传任务
         st.markdown("#### 上传新任务")
-        uploaded_file = st.file_uploader("选择 Excel 文件", type=["xlsx", "xls"])
+        uploaded_file = st.file_uploader("选择词表文件（Excel / CSV / TSV / 每行一词的 TXT）", type=WORD_FILE_TYPES)
         
         if uploaded_file:
             try:
-                df_input = pd.read_excel(uploaded_file)
-                target_col = next((col for col in df_input.columns if "词" in str(col) or "word" in str(col).lower()), None)
+                # 只读取表头识别目标列，词语在处理时逐行读取
+                file_info = inspect_word_file(uploaded_file)
+                target_col = file_info["target_col"]
+                total_rows = file_info["total_rows"]
                 
                 if target_col:
                     st.markdown(f"""
                     <div class="info-highlight">
                         <div style="font-weight: 600; color: #1e40af;">文件信息</div>
                         <div style="margin-top: 0.5rem;">
-                            识别到目标列: <code>{target_col}</code> | 待分析总数: <strong>{len(df_input)}</strong> 条
+                            识别到目标列: <code>{target_col}</code> | 待分析总数: <strong>{total_rows}</strong> 条
                         </div>
                     </div>
                     """, unsafe_allow_html=True)
                     
+                    # 集成判定：主模型与所选模型同时判定每个词语，逐条规则投票后再计分
+                    ensemble_names = st.multiselect(
+                        "集成判定：同时询问以下模型并逐条规则投票（可选）",
+                        [name for name in AVAILABLE_MODEL_OPTIONS if name != selected_model_display_name],
+                        key="ensemble_models",
+                        help="与上方选择的主模型一起判定每个词语，按规则投票后再计算隶属度，每个模型的判定都保存在原始响应中；耗时取决于最慢的模型"
+                    )
+                    ensemble_members = None
+                    job_provider, job_model = selected_model_info["provider"], selected_model_info["model"]
+                    if ensemble_names:
+                        weighted_vote = st.checkbox("加权投票（默认每个模型一票，票数持平时以主模型为准）", key="ensemble_weighted")
+                        ensemble_members = []
+                        for name in [selected_model_display_name] + ensemble_names:
+                            weight = st.number_input(f"{name} 的权重", min_value=0.1, value=1.0, step=0.5, key=f"ensemble_weight_{name}") if weighted_vote else 1.0
+                            ensemble_members.append(dict(AVAILABLE_MODEL_OPTIONS[name], weight=weight))
+                        job_provider, job_model = "ensemble", ensemble_model_id(ensemble_members)
+                    
+                    # 断点续传：同一文件、同一列、同一模型再次上传时从第一个未完成的行继续
+                    journal = ProgressJournal(make_job_id(file_info["digest"], target_col, job_provider, job_model))
+                    resume_row = journal.first_pending()
+                    if journal.completed:
+                        st.info(f"检测到该文件未完成的任务：已完成 {len(journal.completed)} 行，将从第 {resume_row+1} 行继续")
+                    
+                    model_batch_size = get_model_batch_size(selected_model_info["provider"], selected_model_info["model"])
+                    merge_requests = st.checkbox(
+                        f"合并请求：每次请求判定 {model_batch_size} 个词语（共用一份规则提示词，显著减少输入 token）",
+                        value=model_batch_size > 1,
+                        disabled=model_batch_size <= 1
+                    )
+                    lean_mode = st.checkbox(
+                        "精简模式：只返回判定（不含逐条说明，输出 token 更少、速度更快）",
+                        value=False,
+                        help="判定结果与完整模式相同；需要某个词语的逐条说明时，可在下方按需获取"
+                    )
+                    
                     if st.button("开始处理", type="primary", use_container_width=True):
                         if not selected_model_info["api_key"]:
                             st.error("请先在上方配置有效的 API Key")
                         else:
-                            # 获取已处理的词语
-                            existing_words = set()
-                            if os.path.exists(BACKUP_FILE):
-                                try:
-                                    existing_df = pd.read_csv(BACKUP_FILE, encoding='utf-8-sig')
-                                    if "词语" in existing_df.columns:
-                                        existing_words = set(existing_df["词语"].astype(str).tolist())
-                                    st.info(f"已跳过 {len(existing_words)} 条已处理记录")
-                                except Exception as e:
-                                    st.warning(f"读取已处理记录失败，将重新处理所有数据: {e}")
-                            total_rows = len(df_input)
+                            # 已处理的词语逐个查询历史存储的词语索引，无需把全部词语加载到内存
+                            is_processed = None
+                            if history_store.exists():
+                                is_processed = lambda word: history_store.contains(word, provider=job_provider, model=job_model)
+                                st.info(f"历史记录中已有 {history_store.count()} 条记录，其中已处理的词语将被跳过")
+                            skipped = {}
                             
                             # 批量处理主循环（全量异常捕获）
                             try:
-                                for index, row in df_input.iterrows():
-                                    word = str(row[target_col]).strip()
-                                    if not word:
-                                        status_info.write(f"**跳过空值**: 第 {index+1}/{total_rows} 行")
-                                        progress_bar.progress((index + 1) / total_rows)
-                                        continue
-                                    
-                                    pct = int((index + 1) / total_rows * 100)
-                                    progress_bar.progress((index + 1) / total_rows)
-                                    
-                                    if word in existing_words:
-                                        status_info.write(f" **跳过已处理**: {word} ({index+1}/{total_rows}) | 进度: {pct}%")
-                                        continue
+                                journal.start(file_name=uploaded_file.name, column=str(target_col), provider=job_provider, model=job_model, total_rows=total_rows)
+                                jobs = iter_pending_words(
+                                    (
+                                        (index, value)
+                                        for index, value in WordFileReader(uploaded_file, uploaded_file.name).iter_words(target_col, start=resume_row)
+                                        if index not in journal.completed
+                                    ),
+                                    is_processed,
+                                    skipped,
+                                    on_skip=journal.mark
+                                )
+                                failed_rows = 0
+                                status_info.write(f" **正在并发分析** | 并发数: {get_provider_concurrency(selected_model_info['provider'])}")
+                                
+                                # 请求在线程池中并发执行，结果按输入顺序逐条回到此处统一写盘
+                                for index, word, result in run_batch_ordered(
+                                    jobs,
+                                    provider=selected_model_info["provider"],
+                                    model=selected_model_info["model"],
+                                    api_key=selected_model_info["api_key"],
+                                    batch_size=model_batch_size if merge_requests else 1,
+                                    lean=lean_mode,
+                                    secondary=secondary_model_info,
+                                    ensemble=ensemble_members
+                                ):
+                                    pct = min(100, int((index + 1) / max(total_rows, 1) * 100))
+                                    progress_bar.progress(pct / 100)
                                     
-                                    status_info.write(f" **正在分析**: `{word}` | 进度: {index+1}/{total_rows} ({pct}%)")
+                                    # 构造数据行
+                                    new_row = build_history_row(index, word, result)
                                     
-                                    # 调用API处理（增强重试）
-                                    max_retries = 3
-                                    success = False
-                                    scores, raw_text, pred_pos, explanation = {}, "", "处理失败", "无响应"
-                                    for attempt in range(max_retries):
+                                    # 失败的行不写入历史、不记入进度（与命令行一致），再次处理同一文件时只重试这些行
+                                    if not result[0]:
+                                        failed_rows += 1
+                                        st.warning(f"第 {index+1} 条「{word}」判定失败: {result[4]}")
+                                    else:
+                                        # 安全保存数据
                                         try:
-                                            scores, raw_text, pred_pos, explanation = ask_model_for_pos_and_scores(
-                                                word=word,
-                                                provider=selected_model_info["provider"],
-                                                model=selected_model_info["model"],
-                                                api_key=selected_model_info["api_key"]
-                                            )
-                                            success = bool(scores)
-                                            if success:
-                                                break
-                                            time.sleep(2)
-                                        except Exception as e:
-                                            explanation = f"调用异常: {str(e)}"
-                                            logger.error(f"处理词语{word}失败（尝试{attempt+1}）: {e}")
-                                            time.sleep(2)
-                                    
-                                    # 构造数据行
-                                    membership = calculate_membership(scores) if success else {}
-                                    new_row = {
-                                        "序数": index + 1,
-                                        "词语": word,
-                                        "动词": membership.get("动词", 0.0),
-                                        "名词": membership.get("名词", 0.0),
-                                        "名动词": membership.get("名动词", 0.0),
-                                        "差值/距离": round(abs(membership.get("动词", 0.0) - membership.get("名词", 0.0)), 4),
-                                        "预测词类": pred_pos,
-                                        "原始响应": raw_text if success else f"错误: {explanation}",
-                                        "时间戳": time.strftime("%Y-%m-%d %H:%M:%S")
-                                    }
+                                            write_success = history_store.append(new_row, **result_source(result, job_provider, job_model))
+                                            
+                                            if write_success:
+                                                journal.mark(index)
+                                                # 实时更新已存数据量（读取旁路索引，常数时间）
+                                                latest_count = history_store.count()
+                                                metric_placeholder.metric("已存数据量", f"{latest_count} 条")
+                                            else:
+                                                failed_rows += 1
+                                                st.error(f"保存第 {index+1} 条记录失败（文件写入错误）")
+                                        except Exception as csv_err:
+                                            failed_rows += 1
+                                            st.error(f"保存第 {index+1} 条记录失败: {csv_err}")
+                                            logger.error(f"保存CSV失败 - 行号:{index+1}, 错误:{csv_err}")
                                     
-                                    # 安全保存数据
-                                    try:
-                                        temp_df = pd.DataFrame([new_row])
-                                        header_needed = not os.path.exists(BACKUP_FILE)
-                                        write_success = safe_write_csv(temp_df, BACKUP_FILE, mode='a', header=header_needed)
-                                        if write_success:
-                                            existing_words.add(word)
-                                            # 实时更新已存数据量
-                                            latest_count = get_history_count(BACKUP_FILE)
-                                            metric_placeholder.metric("已存数据量", f"{latest_count} 条")
-                                        else:
-                                            st.error(f"保存第 {index+1} 条记录失败（文件写入错误）")
-                                    except Exception as csv_err:
-                                        st.error(f"保存第 {index+1} 条记录失败: {csv_err}")
-                                        logger.error(f"保存CSV失败 - 行号:{index+1}, 错误:{csv_err}")
+                                    ui_span = tracing.span("ui_update", word=word)
+                                    limiter_state = get_rate_limiter(selected_model_info["provider"], api_key_fingerprint(selected_model_info["api_key"])).snapshot()
+                                    status_line = (
+                                        f" **已完成**: `{word}` | 进度: {index+1}/{total_rows} ({pct}%) | 已跳过: {sum(skipped.values())} 条 | 失败: {failed_rows} 条"
+                                        f" | 并发上限: {limiter_state['limit']:g}（在途 {limiter_state['in_flight']}）"
+                                    )
+                                    if secondary_model_info:
+                                        health_state = get_provider_health(selected_model_info["provider"]).snapshot()
+                                        status_line += f" | 对冲: {health_state['hedged']} 次（备用模型胜出 {health_state['hedge_wins']}）"
+                                        if health_state["failover_seconds"]:
+                                            status_line += f" | ⚠️ 主模型故障转移中（剩余 {health_state['failover_seconds']:g} 秒）"
+                                    status_info.write(status_line)
                                     
-                                    # 刷新表格
+                                    # 刷新表格（只渲染最近若干条）
                                     try:
-                                        updated_df = pd.read_csv(BACKUP_FILE, encoding='utf-8-sig')
+                                        updated_df = history_frame(history_store.tail_rows())
                                         table_placeholder.dataframe(updated_df, use_container_width=True, height=300)
                                     except Exception as read_err:
                                         st.warning(f"刷新表格失败: {read_err}")
-                                    
-                                    time.sleep(0.5)  # 限流
+                                    ui_span.finish()
                                 
                                 progress_bar.progress(100)
-                                status_info.success(f"批量处理完成！总处理量: {total_rows} 条，已保存到 {BACKUP_FILE}")
-                                clear_process_progress()  # 清除进度
-                                st.rerun()
+                                if failed_rows:
+                                    journal.close()  # 保留进度日志，再次处理同一文件时只重试失败的行
+                                    status_info.warning(f"批量处理结束：{failed_rows} 条判定或保存失败，其余已保存到 {BACKUP_FILE}；再次点击「开始处理」将只重试失败的行")
+                                else:
+                                    status_info.success(f"批量处理完成！总处理量: {total_rows} 条，已保存到 {BACKUP_FILE}")
+                                    journal.discard()  # 全部完成后删除进度
+                                    st.rerun()
+                                
                             except Exception as batch_err:
+                                journal.close()  # 保留进度日志，下次上传同一文件即可续传
                                 logger.error(f"批量处理主循环中断: {batch_err}")
                                 status_info.error(f" 批量处理中断: {batch_err}，下次可从断点继续")
+                    
+                    # 精简模式下不保存逐条说明，需要时按词语单独请求完整判定
+                    with st.expander("按需获取逐条说明"):
+                        explain_word = st.text_input("词语", key="explain_word", placeholder="输入要查看说明的词语")
+                        if st.button("获取完整说明", key="explain_button", disabled=not explain_word.strip()):
+                            if not selected_model_info["api_key"]:
+                                st.error("请先在上方配置有效的 API Key")
+                            else:
+                                _, raw_text, predicted_pos, explanation, _ = analyze_word_interactive(
+                                    word=explain_word.strip(),
+                                    provider=selected_model_info["provider"],
+                                    model=selected_model_info["model"],
+                                    api_key=selected_model_info["api_key"],
+                                    secondary=secondary_model_info
+                                )
+                                st.markdown(f"**预测词类**：{predicted_pos}")
+                                st.markdown(explanation)
+                                st.code(raw_text, language="json")
                 else:
                     st.markdown('<div class="error-highlight">', unsafe_allow_html=True)
-                    st.error("未识别到包含'词'或'word'的列，请检查Excel文件结构")
+                    st.error("未识别到包含'词'或'word'的列，请检查文件表头")
                     st.markdown('</div>', unsafe_allow_html=True)
             except Exception as e:
-                st.error(f"读取Excel文件失败: {e}")
-                logger.error(f"读取Excel失败: {e}")
+                st.error(f"读取词表文件失败: {e}")
+                logger.error(f"读取词表文件失败: {e}")
         
         st.markdown('</div>', unsafe_allow_html=True)
 
+    # ===== 运行指标 =====
+    with tab3:
+        st.markdown('<div class="section-title"><span class="icon-dot"></span> 运行指标</div>', unsafe_allow_html=True)
+        st.caption("本进程内所有会话与批量任务的累计指标；分位数取每个模型最近 1024 次成功请求。设置 LLD_METRICS_PORT 或 LLD_METRICS_FILE 可供 Prometheus 采集")
+        summary = metrics_summary()
+        if summary:
+            st.dataframe(summary, use_container_width=True)
+        else:
+            st.info("尚无模型调用记录")
+        for (backend,), write_stats in HISTORY_WRITE_SECONDS.series().items():
+            p50, p95, p99 = write_stats.quantiles()
+            st.caption(f"历史记录写入（{backend}）: {write_stats.count} 次 · p50 {p50 * 1000:.1f} ms · p95 {p95 * 1000:.1f} ms · p99 {p99 * 1000:.1f} ms")
+        st.download_button(
+            label="下载指标（Prometheus 文本）",
+            data=lambda: REGISTRY.render().encode("utf-8"),
+            file_name=f"lld_metrics_{time.strftime('%Y%m%d_%H%M%S')}.prom",
+            mime="text/plain"
+        )
+        with st.expander("Prometheus 文本"):
+            st.code(REGISTRY.render(), language="text")
+        if tracing.TRACER.path:
+            st.caption(f"阶段耗时追踪写入 {tracing.TRACER.path}（批量抽样比例 {tracing.TRACER.sample_rate:g}），可用 `python -m lld trace` 汇总或转为 Chrome trace")
+
 # ===============================
 # 运行主函数
 # ===============================
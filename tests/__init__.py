@@ -0,0 +1 @@
+"""单元测试：python -m pytest -q（在仓库根目录运行，不需要网络与 API Key）"""
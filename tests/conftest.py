@@ -0,0 +1,61 @@
+"""测试共用的夹具：独立的响应缓存文件与本地模拟 LLM 服务器（benchmarks/mock_llm.py）"""
+
+import pytest
+
+from benchmarks.mock_llm import start_mock_server
+
+from lld import pipeline
+
+SHARED_RESOURCES = ("get_response_cache", "get_provider_session", "get_rate_limiter", "get_provider_health", "get_usage_stats")
+
+def reset_shared_resources():
+
+    """丢弃进程级共享实例，避免限流器、健康状况与缓存在测试之间互相影响"""
+
+    for name in SHARED_RESOURCES:
+
+        getattr(pipeline, name).cache_clear()
+
+@pytest.fixture
+
+def response_cache(tmp_path, monkeypatch):
+
+    """每个测试独立的响应缓存文件"""
+
+    monkeypatch.setattr(pipeline, "CACHE_FILE", tmp_path / "cache.sqlite3")
+
+    reset_shared_resources()
+
+    yield pipeline.get_response_cache()
+
+    reset_shared_resources()
+
+@pytest.fixture
+
+def mock_server(monkeypatch, response_cache):
+
+    """启动模拟服务器并让各提供商请求它；返回 start(**options)，选项见 MockLLMServer（默认近乎零延迟）"""
+
+    servers = []
+
+    def start(**options):
+
+        options = dict({"latency": 0.01, "jitter": 0.0, "tokens_per_second": 20000.0, "seed": 0}, **options)
+
+        server = start_mock_server(**options)
+
+        servers.append(server)
+
+        for name, value in server.provider_env().items():
+
+            monkeypatch.setenv(name, value)
+
+        return server
+
+    yield start
+
+    for server in servers:
+
+        server.shutdown()
+
+        server.server_close()
@@ -0,0 +1,89 @@
+"""合并判定：一次请求判定多个词语，缺失的词语重新排队，多轮后仍缺失的逐个单独判定"""
+
+import json
+
+import pytest
+
+from benchmarks import mock_llm
+
+from benchmarks.mock_llm import mock_verdict
+
+from lld import pipeline
+
+from lld.core import build_batch_messages
+
+WORDS = ["跑", "飞", "研究", "苹果", "学习"]
+
+def test_batch_prompt_shares_the_rule_prefix():
+
+    # 规则说明在系统消息中，与待判定词语无关：不同批次共用同一前缀，便于提供商前缀缓存
+
+    for lean in (False, True):
+
+        first, second = build_batch_messages(WORDS[:2], lean=lean), build_batch_messages(WORDS[2:], lean=lean)
+
+        assert first[0] == second[0]
+
+        assert all(f"「{word}」" in first[-1]["content"] for word in WORDS[:2])
+
+@pytest.mark.parametrize("lean", [False, True], ids=["full", "lean"])
+
+def test_one_request_for_all_words(mock_server, lean):
+
+    server = mock_server()
+
+    results = pipeline.classify_words_batched(WORDS, "deepseek", "deepseek-chat", "key", lean=lean)
+
+    assert server.stats_snapshot()["requests"] == 1
+
+    assert list(results) == WORDS
+
+    for word, (success, scores, raw_text, pred_pos, _, _) in results.items():
+
+        expected = mock_verdict(word, codes=True)
+
+        assert success and pred_pos == expected["predicted_pos"]
+
+        assert json.loads(raw_text)["word"] == word
+
+        assert scores == pipeline.scores_from_verdicts(expected["scores"])
+
+@pytest.fixture
+
+def requested_words(monkeypatch):
+
+    """记录每次请求的词语；第一次合并请求的响应缺少最后一个词语"""
+
+    real, requests = mock_llm.mock_response_text, []
+
+    def response_text(messages):
+
+        words = mock_llm.WORD_PATTERN.findall(messages[-1]["content"])
+
+        requests.append(words)
+
+        text, count = real(messages)
+
+        if len(requests) == 1:
+
+            items = json.loads(text)
+
+            return json.dumps(items[:-1], ensure_ascii=False), count - 1
+
+        return text, count
+
+    monkeypatch.setattr(mock_llm, "mock_response_text", response_text)
+
+    return requests
+
+def test_missing_words_are_requeued(mock_server, requested_words):
+
+    mock_server()
+
+    results = pipeline.classify_words_batched(WORDS, "deepseek", "deepseek-chat", "key")
+
+    assert all(result[0] for result in results.values()) and set(results) == set(WORDS)
+
+    # 第二轮只请求缺失的词语
+
+    assert requested_words == [WORDS, WORDS[-1:]]
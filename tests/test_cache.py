@@ -0,0 +1,89 @@
+"""响应缓存：两级缓存的命中与过期，未通过判定校验的响应不写入缓存"""
+
+import pytest
+
+from benchmarks import mock_llm
+
+from lld import pipeline
+
+from lld.core import build_single_word_messages, is_valid_verdict_text
+
+def test_put_get_expire_and_delete(tmp_path):
+
+    cache = pipeline.ResponseCache(tmp_path / "cache.sqlite3", ttl_seconds=60)
+
+    response = {"choices": [{"message": {"content": "{}"}}]}
+
+    cache.put("k", "deepseek", "deepseek-chat", "跑", response)
+
+    assert cache.get("k") == response
+
+    # 进程内缓存清空后仍可从磁盘层读回
+
+    assert pipeline.ResponseCache(tmp_path / "cache.sqlite3").get("k") == response
+
+    cache.delete("k")
+
+    assert cache.get("k") is None
+
+    assert pipeline.ResponseCache(tmp_path / "cache.sqlite3").get("k") is None
+
+    expired = pipeline.ResponseCache(tmp_path / "expired.sqlite3", ttl_seconds=-1)
+
+    expired.put("k", "deepseek", "deepseek-chat", "跑", response)
+
+    assert expired.get("k") is None
+
+@pytest.fixture
+
+def malformed_first(monkeypatch):
+
+    """模拟服务器对第一个请求返回无法解析的文本，之后正常返回判定"""
+
+    real, calls = mock_llm.mock_response_text, []
+
+    def response_text(messages):
+
+        calls.append(messages)
+
+        return ("抱歉，这个词语我无法判定。", 1) if len(calls) == 1 else real(messages)
+
+    monkeypatch.setattr(mock_llm, "mock_response_text", response_text)
+
+    return calls
+
+def test_malformed_response_is_retried_not_cached(mock_server, response_cache, malformed_first):
+
+    server = mock_server()
+
+    success, scores, raw_text, pred_pos, _, _ = pipeline.classify_word_with_retries("跑", "deepseek", "deepseek-chat", "key")
+
+    assert success and scores and is_valid_verdict_text(raw_text)
+
+    assert server.stats_snapshot()["requests"] == 2
+
+    assert response_cache.stats()["writes"] == 1
+
+    # 再次判定命中的是重试得到的有效响应
+
+    assert pipeline.classify_word_with_retries("跑", "deepseek", "deepseek-chat", "key")[1:4] == (scores, raw_text, pred_pos)
+
+    assert server.stats_snapshot()["requests"] == 2
+
+def test_invalid_cached_response_is_replaced(mock_server, response_cache):
+
+    server = mock_server()
+
+    # 改造前写入缓存的无效响应：命中后校验不通过，删除并重新请求
+
+    key = pipeline.ResponseCache.make_key("deepseek", "deepseek-chat", 0.0, 4096, build_single_word_messages("跑"), "跑")
+
+    response_cache.put(key, "deepseek", "deepseek-chat", "跑", {"choices": [{"message": {"content": "无法判定"}}]})
+
+    success, _, raw_text, _, _, _ = pipeline.classify_word_with_retries("跑", "deepseek", "deepseek-chat", "key")
+
+    assert success and is_valid_verdict_text(raw_text)
+
+    assert server.stats_snapshot()["requests"] == 1
+
+    assert is_valid_verdict_text(response_cache.get(key)["choices"][0]["message"]["content"])
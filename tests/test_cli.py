@@ -0,0 +1,250 @@
+"""命令行结果文件：续传时只保留已记入进度的行，失败的行重试后不重复"""
+
+import csv
+
+import json
+
+import os
+
+import signal
+
+import subprocess
+
+import sys
+
+import threading
+
+import time
+
+from pathlib import Path
+
+import pytest
+
+from benchmarks import mock_llm
+
+from lld import pipeline
+
+from lld.cli import EXIT_INTERRUPTED, EXIT_OK, EXIT_PARTIAL, main, open_result_writer
+
+def result_row(index, failed=False):
+
+    return {"序数": index + 1, "词语": f"词{index}", "原始响应": "错误: 调用失败" if failed else "{}"}
+
+def read_rows(path):
+
+    if path.suffix == ".csv":
+
+        with open(path, encoding="utf-8-sig", newline="") as f:
+
+            return list(csv.DictReader(f))
+
+    with open(path, encoding="utf-8") as f:
+
+        return [json.loads(line) for line in f]
+
+@pytest.mark.parametrize("suffix", [".csv", ".jsonl"])
+
+def test_resume_drops_unjournaled_rows(tmp_path, suffix):
+
+    path = tmp_path / f"out{suffix}"
+
+    writer = open_result_writer(path)
+
+    for index in range(4):
+
+        writer.append(result_row(index, failed=index in (1, 3)))
+
+    writer.close()
+
+    # 模拟中断时写了一半的行
+
+    with open(path, "a", encoding="utf-8") as f:
+
+        f.write('5,词4,"未结束')
+
+    # 第 1、3 行失败未记入进度，续传时重新判定并写出
+
+    writer = open_result_writer(path, completed={0, 2})
+
+    for index in (1, 3, 4):
+
+        writer.append(result_row(index))
+
+    writer.close()
+
+    rows = read_rows(path)
+
+    assert sorted(int(row["序数"]) for row in rows) == [1, 2, 3, 4, 5]
+
+    assert not any(str(row["原始响应"]).startswith("错误") for row in rows)
+
+    assert not list(tmp_path.glob(".*.tmp"))
+
+def test_fresh_run_overwrites_output(tmp_path):
+
+    path = tmp_path / "out.csv"
+
+    for _ in range(2):
+
+        writer = open_result_writer(path)
+
+        writer.append(result_row(0))
+
+        writer.close()
+
+    assert len(read_rows(path)) == 1
+
+# ===============================
+# 续传起点与失败的行（模拟服务器）
+# ===============================
+
+@pytest.fixture
+
+def failing_words(monkeypatch):
+
+    """模拟服务器对这些词语的请求始终返回无法解析的文本；测试中可随时修改该集合"""
+
+    real, failing = mock_llm.mock_response_text, set()
+
+    def response_text(messages):
+
+        if any(f"「{word}」" in messages[-1]["content"] for word in failing):
+
+            return "无法判定", 1
+
+        return real(messages)
+
+    monkeypatch.setattr(mock_llm, "mock_response_text", response_text)
+
+    return failing
+
+def test_skipped_rows_are_journaled_and_failed_rows_retried(tmp_path, monkeypatch, mock_server, failing_words):
+
+    monkeypatch.setattr(pipeline, "PROGRESS_DIR", tmp_path / "progress")
+
+    words = tmp_path / "words.csv"
+
+    words.write_text("词语\n  \n跑\n跑\n走\n飞\n", encoding="utf-8")
+
+    history = tmp_path / "history.csv"
+
+    argv = ["classify", str(words), "--model", "deepseek-chat", "--api-key", "key", "--out", str(tmp_path / "out.csv"), "--history", str(history), "--batch-size", "1", "-q"]
+
+    server = mock_server()
+
+    failing_words.add("走")
+
+    assert main(argv) == EXIT_PARTIAL
+
+    # 空值与重复的行记入进度；失败的行既不写历史也不记入进度，续传从它开始
+
+    journal = pipeline.ProgressJournal(next((tmp_path / "progress").glob("*.journal")).stem, tmp_path / "progress")
+
+    assert journal.completed == {0, 1, 2, 4} and journal.first_pending() == 3
+
+    assert [row["词语"] for row in pipeline.HistoryStore(history).read_rows(0, 10)] == ["跑", "飞"]
+
+    # 重新运行同一命令只重试失败的行
+
+    failing_words.clear()
+
+    requests = server.stats_snapshot()["requests"]
+
+    assert main(argv) == EXIT_OK
+
+    assert server.stats_snapshot()["requests"] == requests + 1
+
+    assert [row["词语"] for row in pipeline.HistoryStore(history).read_rows(0, 10)] == ["跑", "飞", "走"]
+
+    assert sorted(row["词语"] for row in read_rows(tmp_path / "out.csv")) == sorted(["跑", "走", "飞"])
+
+    assert not list((tmp_path / "progress").glob("*.journal"))
+
+# ===============================
+# 中断（SIGTERM）
+# ===============================
+
+WORKER = """
+import sys
+from lld import pipeline
+from lld.cli import exit_process, main
+pipeline.CACHE_FILE = pipeline.Path(sys.argv[1]) / "cache.sqlite3"
+pipeline.PROGRESS_DIR = pipeline.Path(sys.argv[1]) / "progress"
+exit_process(main(sys.argv[2:]))
+"""
+
+@pytest.mark.parametrize("latency", [0.05, 30.0], ids=["streaming", "before-first-byte"])
+
+def test_sigterm_exits_promptly(tmp_path, mock_server, latency):
+
+    # 输出极慢的模拟服务器：正在读取流或仍在等待响应头的请求都须被取消，进程及时以 130 退出并保存进度
+
+    server = mock_server(latency=latency, tokens_per_second=5.0)
+
+    words = tmp_path / "words.txt"
+
+    words.write_text("\n".join(f"词{i}" for i in range(40)) + "\n", encoding="utf-8")
+
+    command = [sys.executable, "-c", WORKER, str(tmp_path), "classify", str(words), "--model", "deepseek-chat", "--api-key", "key", "--out", str(tmp_path / "out.csv"), "--no-history", "--batch-size", "1", "-q"]
+
+    process = subprocess.Popen(command, env=dict(os.environ, **server.provider_env()), cwd=Path(__file__).resolve().parent.parent, stderr=subprocess.PIPE, text=True)
+
+    deadline = time.monotonic() + 10
+
+    while server.stats_snapshot().get("requests", 0) < 4 and time.monotonic() < deadline:
+
+        time.sleep(0.05)
+
+    assert server.stats_snapshot().get("requests", 0) >= 4
+
+    interrupted = time.monotonic()
+
+    process.send_signal(signal.SIGTERM)
+
+    try:
+
+        _, stderr = process.communicate(timeout=10)
+
+    except subprocess.TimeoutExpired:
+
+        process.kill()
+
+        pytest.fail("SIGTERM 后进程未在 10 秒内退出")
+
+    assert process.returncode == EXIT_INTERRUPTED, stderr
+
+    assert time.monotonic() - interrupted < 5
+
+    assert "已中断" in stderr
+
+    assert list((tmp_path / "progress").glob("*.journal"))
+
+def test_cancel_open_requests_stops_streaming_request(monkeypatch, mock_server):
+
+    monkeypatch.setattr(pipeline, "OPEN_REQUESTS", pipeline.OpenRequests())
+
+    server = mock_server(latency=0.05, tokens_per_second=5.0)
+
+    results = []
+
+    worker = threading.Thread(target=lambda: results.append(pipeline.classify_word_with_retries("跑", "deepseek", "deepseek-chat", "key")))
+
+    worker.start()
+
+    deadline = time.monotonic() + 5
+
+    while not server.stats_snapshot().get("requests") and time.monotonic() < deadline:
+
+        time.sleep(0.02)
+
+    time.sleep(0.2)
+
+    assert pipeline.cancel_open_requests() == 1
+
+    worker.join(timeout=3)
+
+    # 取消后不再重试：classify_word_with_retries 的后续尝试也立即取消
+
+    assert not worker.is_alive() and not results[0][0]
+
+    assert server.stats_snapshot()["requests"] == 1
@@ -0,0 +1,111 @@
+"""流式判定提前结束：判定 JSON 完整到达后关闭连接，不再读取模型其后的输出"""
+
+import json
+
+import math
+
+import time
+
+import pytest
+
+from benchmarks import mock_llm
+
+from benchmarks.mock_llm import mock_verdict
+
+from lld import pipeline
+
+from lld.core import VerdictStreamDetector, is_complete_batch_verdict, is_complete_verdict
+
+def verdict_text(word="跑"):
+
+    return "推理过程：{先看规则}……\n" + json.dumps(dict({"explanation": "……"}, **mock_verdict(word, codes=False)), ensure_ascii=False, indent=2)
+
+def feed_in_pieces(detector, text, size):
+
+    """按 size 个字符一段喂给检测器，返回判定完成时已喂入的字符数"""
+
+    for start in range(0, len(text), size):
+
+        if detector.feed(text[start:start + size]):
+
+            return start + size
+
+    return None
+
+@pytest.mark.parametrize("size", [1, 7, 64])
+
+def test_detector_fires_at_the_closing_brace(size):
+
+    text = verdict_text()
+
+    detector = VerdictStreamDetector(is_complete_verdict)
+
+    fed = feed_in_pieces(detector, text + "\n以上为全部判定。", size)
+
+    # 完成于 JSON 最后一个闭括号所在的分段，推理中的花括号与不完整的 JSON 不会误判
+
+    assert fed is not None and len(text) <= fed < len(text) + size
+
+    assert detector.result["predicted_pos"] == mock_verdict("跑", codes=False)["predicted_pos"]
+
+def test_detector_requires_all_rules_and_words():
+
+    verdict = mock_verdict("跑", codes=False)
+
+    pos = next(iter(verdict["scores"]))
+
+    verdict["scores"][pos].popitem()
+
+    assert not VerdictStreamDetector(is_complete_verdict).feed(json.dumps(verdict, ensure_ascii=False))
+
+    items = [dict({"word": word}, **mock_verdict(word, codes=True)) for word in ("跑", "飞")]
+
+    detector = VerdictStreamDetector(lambda value: is_complete_batch_verdict(value, ["跑", "飞", "走"]), opener="[")
+
+    assert not detector.feed(json.dumps(items, ensure_ascii=False))
+
+TRAILING = "\n补充说明：" + "……" * 4000
+
+@pytest.fixture
+
+def trailing_text(monkeypatch):
+
+    """模型在判定 JSON 之后继续输出大段文本；返回「跑」的完整输出的 token 数（模拟服务器按 1 token = 2 字符计）"""
+
+    real = mock_llm.mock_response_text
+
+    monkeypatch.setattr(mock_llm, "mock_response_text", lambda messages: (real(messages)[0] + TRAILING, 1))
+
+    return math.ceil(len(real([{"content": "请判定词语「跑」"}])[0] + TRAILING) / mock_llm.CHARS_PER_TOKEN)
+
+@pytest.mark.parametrize("enabled", [True, False], ids=["early-stop", "disabled"])
+
+def test_stream_closed_after_verdict(mock_server, trailing_text, monkeypatch, enabled):
+
+    monkeypatch.setattr(pipeline, "EARLY_STOP_ENABLED", enabled)
+
+    server = mock_server(tokens_per_second=4000.0)
+
+    scores, raw_text, _, _, _ = pipeline.ask_model_for_pos_and_scores("跑", "deepseek", "deepseek-chat", "key")
+
+    assert scores and (("补充说明" in raw_text) != enabled)
+
+    deadline = time.monotonic() + 5
+
+    while not (server.stats_snapshot().get("client_closed") or server.stats_snapshot().get("completed")) and time.monotonic() < deadline:
+
+        time.sleep(0.02)
+
+    stats = server.stats_snapshot()
+
+    if enabled:
+
+        # 判定之后的输出不再读取：连接由客户端关闭，服务器只发出了不到一半的输出
+
+        assert stats.get("client_closed") == 1 and not stats.get("completed")
+
+        assert stats["completion_tokens"] < trailing_text / 2
+
+    else:
+
+        assert stats.get("completed") == 1 and stats["completion_tokens"] == trailing_text
@@ -0,0 +1,107 @@
+"""集成判定：各模型的规则判定逐条加权投票，至少一个模型成功即成功，各模型同时请求"""
+
+import json
+
+from benchmarks.mock_llm import mock_verdict
+
+from lld import pipeline
+
+from lld.core import get_rule_set, vote_predicted_pos, vote_verdicts
+
+MEMBERS = [{"provider": "deepseek", "model": "deepseek-chat"}, {"provider": "qwen", "model": "qwen-max"}, {"provider": "moonshot", "model": "kimi"}]
+
+def member_result(vector, pred_pos="动词"):
+
+    """按判定向量构造一个成员的成功结果"""
+
+    rule_set = get_rule_set()
+
+    scores = {pos: {} for pos in rule_set.pos_names}
+
+    for (pos, _), name, verdict in zip(rule_set.rules, rule_set.names, vector):
+
+        if verdict:
+
+            scores[pos][name] = verdict > 0
+
+    raw_text = json.dumps({"predicted_pos": pred_pos, "scores": scores}, ensure_ascii=False)
+
+    return True, pipeline.scores_from_verdicts(scores), raw_text, pred_pos, "", ""
+
+def test_vote_verdicts():
+
+    assert vote_verdicts([[1, 1, -1, 0], [1, -1, -1, 0], [-1, -1, 1, 0]]) == [1, -1, -1, 0]
+
+    # 票数持平时取排在最前、且作出判定的模型
+
+    assert vote_verdicts([[0, -1], [1, 1]]) == [1, -1]
+
+    assert vote_verdicts([[1, -1], [-1, 1]]) == [1, -1]
+
+    assert vote_verdicts([[1], [-1], [-1]], weights=[3.0, 1.0, 1.0]) == [1]
+
+def test_vote_predicted_pos():
+
+    assert vote_predicted_pos(["名词", "动词", "动词"]) == "动词"
+
+    assert vote_predicted_pos(["名词", "动词", "动词"], weights=[3.0, 1.0, 1.0]) == "名词"
+
+    assert vote_predicted_pos(["名词", "动词"], membership={"名词": 0.2, "动词": 0.6}) == "动词"
+
+    assert vote_predicted_pos(["未知"]) == "未知"
+
+def test_combined_result_records_votes():
+
+    size = len(get_rule_set())
+
+    vectors = [[1] * size, [1] * size, [-1] * size]
+
+    results = [member_result(vectors[0]), pipeline.FAILED_RESULT, member_result(vectors[1], "名词"), member_result(vectors[2], "名词")]
+
+    members = MEMBERS + [{"provider": "openai", "model": "gpt"}]
+
+    success, scores, raw_text, pred_pos, explanation, _ = pipeline.combine_ensemble_results(results, members)
+
+    assert success and pred_pos == "名词"
+
+    parsed = json.loads(raw_text)
+
+    assert pipeline.verdicts_from_text(raw_text) == [1] * size
+
+    assert scores == get_rule_set().scores([1] * size)
+
+    assert parsed["votes"]["qwen:qwen-max"]["error"] and set(parsed["votes"]) == {f"{m['provider']}:{m['model']}" for m in members}
+
+    assert "集成判定（多数投票）" in explanation
+
+def test_all_members_failing_is_a_failure():
+
+    success, scores, _, _, explanation, _ = pipeline.combine_ensemble_results([pipeline.FAILED_RESULT] * 2, MEMBERS[:2])
+
+    assert not success and not scores and "全部失败" in explanation
+
+def test_members_are_requested_together(mock_server):
+
+    server = mock_server(latency=0.3)
+
+    members = [dict(member, api_key="key") for member in MEMBERS[:2]]
+
+    started = pipeline.time.monotonic()
+
+    results = list(pipeline.run_batch_ordered(enumerate(["跑", "飞"]), "deepseek", "deepseek-chat", "key", batch_size=2, ensemble=members))
+
+    elapsed = pipeline.time.monotonic() - started
+
+    # 两个成员同时请求：耗时约为一次请求而不是两次之和
+
+    assert server.stats_snapshot()["requests"] == 2 and elapsed < 0.55
+
+    for index, word, (success, _, raw_text, pred_pos, _, _) in results:
+
+        votes = json.loads(raw_text)["votes"]
+
+        assert success and set(votes) == {"deepseek:deepseek-chat", "qwen:qwen-max"}
+
+        # 模拟服务器对同一词语给出相同判定：投票结果即该判定
+
+        assert pipeline.verdicts_from_text(raw_text) == get_rule_set().verdict_vector(mock_verdict(word, codes=True)["scores"], codes=True)
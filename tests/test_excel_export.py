@@ -0,0 +1,71 @@
+"""Excel 结果导出：只写模式逐行写入，数值列还原为数字，预测词类高亮由一条条件格式规则完成"""
+
+import pytest
+
+from lld import pipeline
+
+openpyxl = pytest.importorskip("openpyxl")
+
+def result_row(word, pred_pos="动词"):
+
+    # CSV 历史读出的数值列为字符串
+
+    return {"词语": word, "动词": "0.75", "名词": "0.25", "名动词": "0.5", "差值/距离": "0.5", "预测词类": pred_pos, "原始响应": "{}"}
+
+def test_rows_and_conditional_format(tmp_path):
+
+    path = pipeline.export_results_xlsx([result_row("跑"), result_row("苹果", "名词"), dict(result_row("研究"), 动词="无效")], tmp_path / "out.xlsx")
+
+    sheet = openpyxl.load_workbook(path)["分析结果"]
+
+    rows = list(sheet.iter_rows(values_only=True))
+
+    assert list(rows[0]) == pipeline.EXPORT_COLUMNS
+
+    assert rows[1][:6] == ("跑", 0.75, 0.25, 0.5, 0.5, "动词")
+
+    assert rows[3][1] == "无效"
+
+    # 整个数据区只有一条规则，不逐个单元格设置样式
+
+    ranges = list(sheet.conditional_formatting)
+
+    assert len(ranges) == 1 and str(ranges[0].sqref) == "B2:D4"
+
+    rule = ranges[0].rules[0]
+
+    assert rule.formula == ["B$1=$F2"] and rule.dxf.fill.fgColor.rgb.endswith(pipeline.HIGHLIGHT_COLOR)
+
+    assert all(cell.fill.fill_type is None for row in sheet.iter_rows(min_row=2) for cell in row)
+
+def test_history_export_pages_through_store(tmp_path, monkeypatch):
+
+    store = pipeline.HistoryStore(tmp_path / "history.csv")
+
+    for index, word in enumerate(["跑", "飞", "走", "吃", "学习"]):
+
+        store.append(dict(result_row(word), 序数=index + 1))
+
+    pages = []
+
+    real = store.read_rows
+
+    monkeypatch.setattr(store, "read_rows", lambda start, limit: pages.append((start, limit)) or real(start, limit))
+
+    data = pipeline.export_results_xlsx(pipeline.iter_history_rows(store, page_rows=2), tmp_path / "history.xlsx").read_bytes()
+
+    assert pages == [(0, 2), (2, 2), (4, 2), (5, 2)]
+
+    sheet = openpyxl.load_workbook(tmp_path / "history.xlsx")["分析结果"]
+
+    assert [row[0] for row in sheet.iter_rows(min_row=2, values_only=True)] == ["跑", "飞", "走", "吃", "学习"]
+
+    assert data[:2] == b"PK"
+
+def test_empty_export_has_header_only(tmp_path):
+
+    path = pipeline.export_results_xlsx([], tmp_path / "empty.xlsx")
+
+    sheet = openpyxl.load_workbook(path)["分析结果"]
+
+    assert sheet.max_row == 1 and not list(sheet.conditional_formatting)
@@ -0,0 +1,65 @@
+"""备用模型：主提供商故障时转由备用模型作答，历史记录按实际作答的模型记录"""
+
+import pytest
+
+from lld import pipeline
+
+from lld.cli import EXIT_OK, main
+
+@pytest.fixture
+
+def primary_down(monkeypatch, mock_server):
+
+    """deepseek 请求一个始终返回 500 的模拟服务器，其余提供商请求正常的模拟服务器"""
+
+    broken = mock_server(error_rate=1.0)
+
+    healthy = mock_server()
+
+    monkeypatch.setenv("LLD_BASE_URL_DEEPSEEK", broken.base_urls()["deepseek"])
+
+    monkeypatch.setattr(pipeline, "BACKOFF_BASE_SECONDS", 0.01)
+
+    return broken, healthy
+
+def test_backup_answers_are_attributed_to_backup(tmp_path, monkeypatch, primary_down):
+
+    broken, healthy = primary_down
+
+    monkeypatch.setattr(pipeline, "PROGRESS_DIR", tmp_path / "progress")
+
+    monkeypatch.setattr(pipeline, "HISTORY_BACKEND", "sqlite")
+
+    words = tmp_path / "words.txt"
+
+    words.write_text("跑\n飞\n走\n", encoding="utf-8")
+
+    history = tmp_path / "history.csv"
+
+    argv = ["classify", str(words), "--model", "deepseek-chat", "--secondary", "qwen:mock-backup", "--api-key", "key", "--out", str(tmp_path / "out.jsonl"), "--history", str(history), "--batch-size", "1", "-q"]
+
+    monkeypatch.setenv("QWEN_API_KEY", "key")
+
+    assert main(argv) == EXIT_OK
+
+    # 主模型连续失败后进入故障转移，全部词语由备用模型作答
+
+    assert broken.stats_snapshot()["errors"] >= pipeline.FAILOVER_MIN_REQUESTS
+
+    assert pipeline.get_provider_health("deepseek").failing_over()
+
+    store = pipeline.get_history_store(history)
+
+    sources = store._reader().execute("SELECT word, provider, model FROM results ORDER BY id").fetchall()
+
+    assert sources == [("跑", "qwen", "mock-backup"), ("飞", "qwen", "mock-backup"), ("走", "qwen", "mock-backup")]
+
+    assert store.contains("跑", provider="qwen", model="mock-backup") and not store.contains("跑", provider="deepseek", model="deepseek-chat")
+
+def test_result_source():
+
+    result = (True, {}, "", "动词", "", "")
+
+    assert pipeline.result_source(result, "deepseek", "deepseek-chat") == {"provider": "deepseek", "model": "deepseek-chat"}
+
+    assert pipeline.result_source(result[:5] + ("qwen:qwen-max",), "deepseek", "deepseek-chat") == {"provider": "qwen", "model": "qwen-max"}
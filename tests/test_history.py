@@ -0,0 +1,285 @@
+"""历史记录存储：重新计分的原子替换、写入的规则判定与计分一致"""
+
+import csv
+
+import json
+
+import pytest
+
+from lld import core, pipeline
+
+from lld.core import RULE_SETS, get_rule_set, rule_code
+
+pytest.importorskip("numpy")
+
+def verdict_response(codes_for=(), explanation="推理过程……"):
+
+    """完整模式的单词响应：codes_for 中的词类按规则编号给出判定，其余按完整规则名"""
+
+    scores = {pos: {} for pos in RULE_SETS}
+
+    for index, (pos, rule) in enumerate(get_rule_set().rules):
+
+        scores[pos][rule_code(rule["name"]) if pos in codes_for else rule["name"]] = index % 3 != 0
+
+    return explanation + json.dumps({"explanation": explanation, "predicted_pos": "动词", "scores": scores}, ensure_ascii=False)
+
+def history_row(index, word):
+
+    raw_text = verdict_response()
+
+    scores = pipeline.scores_from_verdicts(json.loads(raw_text[raw_text.index("{"):])["scores"])
+
+    return pipeline.build_history_row(index, word, (True, scores, raw_text, "动词", "", ""))
+
+@pytest.fixture
+
+def store(tmp_path):
+
+    store = pipeline.HistoryStore(tmp_path / "history.csv")
+
+    for index, word in enumerate(["苹果", "跑", "研究", "学习", "吃"]):
+
+        assert store.append(history_row(index, word))
+
+    return store
+
+def test_stored_verdicts_match_scored_verdicts(monkeypatch):
+
+    # 完整模式响应中出现规则编号时，计分与写入的规则判定须一致，rescore 不应改动未调整分值的记录
+
+    raw_text = verdict_response(codes_for=("动词",))
+
+    monkeypatch.setattr(pipeline, "call_llm_with_failover", lambda **kwargs: (True, {"choices": [{"message": {"content": raw_text}}]}, ""))
+
+    result = pipeline.ask_model_for_pos_and_scores("跑", "deepseek", "deepseek-chat", "key")
+
+    row = pipeline.build_history_row(0, "跑", (True, *result))
+
+    before = {col: row[col] for col in ("动词", "名词", "名动词")}
+
+    stats, scored = pipeline.rescore_rows([row])
+
+    assert scored == [0] and stats["changed"] == 0
+
+    assert {col: row[col] for col in ("动词", "名词", "名动词")} == before
+
+@pytest.fixture
+
+def reweighted():
+
+    """临时调高一条动词规则的符合分，测试结束后恢复"""
+
+    rule = RULE_SETS["动词"][0]
+
+    rule["match_score"] += 10
+
+    core.reload_rule_sets()
+
+    yield
+
+    rule["match_score"] -= 10
+
+    core.reload_rule_sets()
+
+def test_rescore_replaces_file_and_keeps_appending(store, reweighted):
+
+    rows_before = store.read_rows(0, 10)
+
+    inode = store.csv_path.stat().st_ino
+
+    stats = store.rescore()
+
+    assert stats["rows"] == 5 and stats["from_verdicts"] == 5 and stats["changed"] > 0
+
+    assert store.csv_path.stat().st_ino != inode
+
+    assert not list(store.csv_path.parent.glob("*.tmp"))
+
+    rows_after = store.read_rows(0, 10)
+
+    assert [row["词语"] for row in rows_after] == [row["词语"] for row in rows_before]
+
+    assert any(after["动词"] != before["动词"] for after, before in zip(rows_after, rows_before))
+
+    # 替换后的追加写入新文件，索引与查重随之更新
+
+    assert store.append(history_row(5, "走"))
+
+    assert store.count() == 6 and store.contains("走")
+
+    assert pipeline.HistoryStore(store.csv_path).read_rows(5, 1)[0]["词语"] == "走"
+
+def test_failed_rescore_leaves_history_untouched(store, reweighted, monkeypatch):
+
+    # 第二块计分时失败（如磁盘写满）：原文件逐字节不变，不留临时文件
+
+    original = store.csv_path.read_bytes()
+
+    real, calls = pipeline.rescore_rows, []
+
+    def failing_rescore_rows(rows):
+
+        calls.append(len(rows))
+
+        if len(calls) == 2:
+
+            raise OSError("No space left on device")
+
+        return real(rows)
+
+    monkeypatch.setattr(pipeline, "rescore_rows", failing_rescore_rows)
+
+    with pytest.raises(OSError):
+
+        store.rescore(chunk_rows=2)
+
+    assert store.csv_path.read_bytes() == original
+
+    assert not list(store.csv_path.parent.glob("*.tmp"))
+
+    assert store.count() == 5
+
+# ===============================
+# 查重与记录条数
+# ===============================
+
+def test_iter_pending_words_uses_membership_predicate(store):
+
+    skipped = {}
+
+    pending = list(pipeline.iter_pending_words(enumerate(["苹果", "走", " ", "走", "飞", "吃"]), store.contains, skipped))
+
+    assert pending == [(1, "走"), (4, "飞")]
+
+    assert skipped == {"existing": 3, "empty": 1}
+
+    assert list(pipeline.iter_pending_words(enumerate(["苹果"]), None, {})) == [(0, "苹果")]
+
+def test_sqlite_count_is_maintained(tmp_path):
+
+    # 旧 CSV 中重复的词语在导入时被 REPLACE 覆盖，计数仍与实际行数一致
+
+    legacy = pipeline.HistoryStore(tmp_path / "history.csv")
+
+    for index, word in enumerate(["苹果", "跑", "苹果"]):
+
+        legacy.append(history_row(index, word))
+
+    store = pipeline.SqliteHistoryStore(tmp_path / "history.csv")
+
+    def actual():
+
+        return store._reader().execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    assert store.count() == actual() == 2
+
+    for word in ["研究", "学习", "研究"]:
+
+        assert store.append(history_row(0, word), provider="deepseek", model="deepseek-chat")
+
+    assert store.count() == actual() == 4
+
+    assert store.contains("研究", "deepseek", "deepseek-chat") and not store.contains("走", "deepseek", "deepseek-chat")
+
+    store.rescore()
+
+    assert store.count() == actual()
+
+    assert pipeline.SqliteHistoryStore(tmp_path / "history.csv").count() == store.count()
+
+    store.clear()
+
+    assert store.count() == 0 and not store.exists()
+
+def test_sqlite_contains_matches_upsert_key(tmp_path, monkeypatch):
+
+    store = pipeline.SqliteHistoryStore(tmp_path / "history.csv")
+
+    store.append(history_row(0, "研究"), provider="deepseek", model="deepseek-chat")
+
+    assert store.contains("研究", provider="deepseek", model="deepseek-chat")
+
+    # 其他模型或旧规则集版本的记录不算已处理：再次判定时 upsert 写入新记录而不是覆盖
+
+    assert not store.contains("研究", provider="qwen", model="qwen-max")
+
+    assert not store.contains("研究")
+
+    monkeypatch.setattr(pipeline, "rule_set_version", lambda: "新版本")
+
+    assert not store.contains("研究", provider="deepseek", model="deepseek-chat")
+
+    store.rescore()
+
+    assert store.contains("研究", provider="deepseek", model="deepseek-chat")
+
+def test_sqlite_paging_and_export(tmp_path):
+
+    store = pipeline.SqliteHistoryStore(tmp_path / "history.csv")
+
+    words = [f"词{i}" for i in range(23)]
+
+    for index, word in enumerate(words):
+
+        store.append(history_row(index, word), provider="deepseek", model="deepseek-chat")
+
+    # 删除后重新写入使 id 出现空洞：分页仍按 id 顺序连续、不重不漏
+
+    with store._conn:
+
+        store._conn.execute("DELETE FROM results WHERE word IN ('词3', '词10')")
+
+    for word in ("词3", "词10"):
+
+        store.append(history_row(0, word), provider="deepseek", model="deepseek-chat")
+
+    expected = [w for w in words if w not in ("词3", "词10")] + ["词3", "词10"]
+
+    assert [row["词语"] for row in pipeline.iter_history_rows(store, page_rows=5)] == expected
+
+    # 跳页与顺序翻页结果一致
+
+    assert [row["词语"] for row in store.read_rows(12, 4)] == expected[12:16]
+
+    assert [row["词语"] for row in store.read_rows(16, 4)] == expected[16:20]
+
+    assert store.read_rows(40, 5) == []
+
+    export_path = store.export_csv()
+
+    assert [row["词语"] for row in pipeline.HistoryStore(export_path).read_rows(0, 100)] == expected
+
+    assert not list(tmp_path.glob("*.tmp")) and not list(tmp_path.glob(".*.tmp"))
+
+def test_append_rereads_header_after_rescore_elsewhere(tmp_path):
+
+    # 旧文件没有「规则判定」列：A 按旧表头缓存列数后，B（如另一进程）rescore 升级了表头并替换文件，A 的下一次追加须按新表头写入
+
+    legacy = tmp_path / "history.csv"
+
+    with open(legacy, "w", encoding="utf-8-sig", newline="") as f:
+
+        writer = csv.writer(f, lineterminator="\n")
+
+        writer.writerow(pipeline.HISTORY_COLUMNS[:-1])
+
+        writer.writerow([history_row(0, "苹果")[col] for col in pipeline.HISTORY_COLUMNS[:-1]])
+
+    first, second = pipeline.HistoryStore(legacy), pipeline.HistoryStore(legacy)
+
+    assert first.append(history_row(1, "跑"))
+
+    assert second.rescore()["rows"] == 2
+
+    assert first.append(history_row(2, "走"))
+
+    with open(legacy, encoding="utf-8-sig", newline="") as f:
+
+        header, *rows = list(csv.reader(f))
+
+    assert header == pipeline.HISTORY_COLUMNS
+
+    assert [len(row) for row in rows] == [len(header)] * 3
+
+    assert rows[-1][-1] == history_row(2, "走")[pipeline.VERDICT_COLUMN] != ""
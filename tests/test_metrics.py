@@ -0,0 +1,125 @@
+"""运行指标：计数器与直方图的 Prometheus 文本格式、分位数、导出，以及请求后按模型汇总的指标"""
+
+import urllib.request
+
+import pytest
+
+from lld import metrics, pipeline
+
+from lld.metrics import Registry, percentile
+
+def test_percentile():
+
+    samples = [5, 1, 4, 2, 3]
+
+    assert [percentile(samples, q) for q in (0.0, 0.5, 0.95, 1.0)] == [1, 3, 5, 5]
+
+    assert percentile([], 0.5) == 0.0
+
+def test_render_counter_and_histogram():
+
+    registry = Registry()
+
+    requests = registry.counter("demo_requests_total", "请求数", ["provider", "outcome"])
+
+    # 同名指标只注册一次
+
+    assert registry.counter("demo_requests_total", "请求数", ["provider", "outcome"]) is requests
+
+    requests.labels("deepseek", "success").inc()
+
+    requests.labels("deepseek", "success").inc(2)
+
+    requests.labels('a"b', "error").inc(0.5)
+
+    latency = registry.histogram("demo_seconds", "耗时", ["provider"], buckets=(1.0, 0.1))
+
+    for value in (0.05, 0.5, 0.7, 3.0):
+
+        latency.labels("deepseek").observe(value)
+
+    lines = registry.render().splitlines()
+
+    assert lines[:2] == ["# HELP demo_requests_total 请求数", "# TYPE demo_requests_total counter"]
+
+    assert 'demo_requests_total{provider="deepseek",outcome="success"} 3' in lines
+
+    assert 'demo_requests_total{provider="a\\"b",outcome="error"} 0.5' in lines
+
+    # 桶按上界排序并累计，+Inf 桶等于样本总数
+
+    assert lines[-5:] == [
+
+        'demo_seconds_bucket{provider="deepseek",le="0.1"} 1',
+
+        'demo_seconds_bucket{provider="deepseek",le="1"} 3',
+
+        'demo_seconds_bucket{provider="deepseek",le="+Inf"} 4',
+
+        'demo_seconds_sum{provider="deepseek"} 4.25',
+
+        'demo_seconds_count{provider="deepseek"} 4',
+
+    ]
+
+    assert latency.labels("deepseek").quantiles((0.5, 0.99)) == [0.5, 3.0]
+
+    with pytest.raises(ValueError):
+
+        requests.labels("deepseek")
+
+    registry.clear()
+
+    assert registry.render() == "# HELP demo_requests_total 请求数\n# TYPE demo_requests_total counter\n# HELP demo_seconds 耗时\n# TYPE demo_seconds histogram\n"
+
+def test_exporters(tmp_path, monkeypatch):
+
+    monkeypatch.setattr(metrics, "_exporters", {})
+
+    registry = Registry()
+
+    registry.counter("demo_total", "示例").labels().inc()
+
+    path = tmp_path / "lld.prom"
+
+    metrics.write_metrics_file(path, registry)
+
+    assert path.read_text(encoding="utf-8") == registry.render()
+
+    server = metrics.start_metrics_server(0, registry=registry)
+
+    try:
+
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.server_address[1]}/metrics", timeout=5) as response:
+
+            assert response.headers["Content-Type"] == metrics.PROMETHEUS_CONTENT_TYPE
+
+            assert response.read().decode("utf-8") == registry.render()
+
+    finally:
+
+        server.shutdown()
+
+        server.server_close()
+
+def test_summary_after_requests(mock_server, response_cache):
+
+    mock_server()
+
+    pipeline.REGISTRY.clear()
+
+    for _ in range(2):
+
+        assert pipeline.classify_word_with_retries("跑", "deepseek", "deepseek-chat", "key")[0]
+
+    rows = [row for row in pipeline.metrics_summary() if row["提供商"] == "deepseek"]
+
+    # 第二次命中本地缓存，不再计入耗时
+
+    assert len(rows) == 1 and rows[0]["成功"] == 1 and rows[0]["缓存命中"] == 1 and rows[0]["重试"] == 0
+
+    assert rows[0]["耗时(秒) p50"] > 0 and rows[0]["首字节(秒) p99"] >= rows[0]["首字节(秒) p50"] > 0
+
+    assert pipeline.LLM_TOKENS.labels("deepseek", "deepseek-chat", "completion").value > 0
+
+    assert 'lld_llm_requests_total{provider="deepseek",model="deepseek-chat",outcome="success"} 1' in pipeline.REGISTRY.render()
@@ -0,0 +1,83 @@
+"""断点续传日志：续传起点、写入中断的半条记录与任务信息"""
+
+from lld.pipeline import JOURNAL_RECORD, ProgressJournal, make_job_id
+
+def test_resume_from_first_pending(tmp_path):
+
+    journal = ProgressJournal("job", tmp_path)
+
+    journal.start(total_rows=10)
+
+    for index in (0, 1, 2, 4, 2):
+
+        journal.mark(index)
+
+    journal.close()
+
+    resumed = ProgressJournal("job", tmp_path)
+
+    assert resumed.completed == {0, 1, 2, 4}
+
+    assert resumed.first_pending() == 3
+
+    assert resumed.meta["total_rows"] == 10
+
+    # 重复标记不会再次写入
+
+    assert journal.journal_path.stat().st_size == 4 * JOURNAL_RECORD.size
+
+def test_torn_record_is_truncated(tmp_path):
+
+    journal = ProgressJournal("job", tmp_path)
+
+    journal.start()
+
+    journal.mark(0)
+
+    journal.mark(1)
+
+    journal.close()
+
+    # 模拟写入第三条记录时进程崩溃：只落盘了 3 个字节
+
+    with open(journal.journal_path, "ab") as f:
+
+        f.write(JOURNAL_RECORD.pack(2)[:3])
+
+    resumed = ProgressJournal("job", tmp_path)
+
+    assert resumed.completed == {0, 1}
+
+    assert journal.journal_path.stat().st_size == 2 * JOURNAL_RECORD.size
+
+    # 截断后继续追加，记录仍按 8 字节对齐
+
+    resumed.start()
+
+    resumed.mark(2)
+
+    resumed.close()
+
+    assert ProgressJournal("job", tmp_path).completed == {0, 1, 2}
+
+def test_discard_removes_progress(tmp_path):
+
+    journal = ProgressJournal("job", tmp_path)
+
+    journal.start()
+
+    journal.mark(0)
+
+    journal.discard()
+
+    assert not journal.journal_path.exists() and not journal.meta_path.exists()
+
+    assert ProgressJournal("job", tmp_path).first_pending() == 0
+
+def test_job_id_depends_on_source_column_and_model():
+
+    job_id = make_job_id("digest", "词语", "deepseek", "deepseek-chat")
+
+    assert job_id == make_job_id("digest", "词语", "deepseek", "deepseek-chat")
+
+    assert len({job_id, make_job_id("other", "词语", "deepseek", "deepseek-chat"), make_job_id("digest", "word", "deepseek", "deepseek-chat"), make_job_id("digest", "词语", "qwen", "qwen-max")}) == 4
@@ -0,0 +1,133 @@
+"""配额感知限流：令牌桶的等待与退还、AIMD 并发上限、Retry-After 暂停与 429 重试"""
+
+import email.utils
+
+import threading
+
+import time
+
+from lld import pipeline
+
+from lld.pipeline import AdaptiveConcurrency, ProviderRateLimiter, TokenBucket, parse_retry_after
+
+def test_token_bucket_waits_for_deficit_and_refunds():
+
+    bucket = TokenBucket(rate_per_second=10.0, capacity=5.0)
+
+    assert bucket.reserve(5) == 0.0
+
+    # 透支 2 个令牌：按每秒 10 个补充，需等待 0.2 秒
+
+    assert abs(bucket.reserve(2) - 0.2) < 0.01
+
+    # 实际用量少于预估时退还，余量不超过容量
+
+    bucket.refund(100)
+
+    assert bucket.tokens == bucket.capacity
+
+def test_concurrency_blocks_at_limit():
+
+    concurrency = AdaptiveConcurrency(initial=2)
+
+    concurrency.acquire()
+
+    concurrency.acquire()
+
+    acquired = threading.Event()
+
+    waiter = threading.Thread(target=lambda: (concurrency.acquire(), acquired.set()))
+
+    waiter.start()
+
+    assert not acquired.wait(0.1)
+
+    concurrency.release()
+
+    assert acquired.wait(1)
+
+    waiter.join()
+
+    assert concurrency.in_flight == 2
+
+def test_aimd_increase_and_single_decrease_per_window():
+
+    concurrency = AdaptiveConcurrency(initial=4, maximum=8)
+
+    # 每个成功请求加 1/上限，约一轮（上限个请求）加 1
+
+    for _ in range(4):
+
+        concurrency.on_success(0.5)
+
+    assert 4.9 < concurrency.limit < 5
+
+    limit = concurrency.limit
+
+    # 延迟超过近期最小值的 2 倍不再增加
+
+    concurrency.on_success(5.0)
+
+    assert concurrency.limit == limit
+
+    # 同一延迟窗口（近期最小延迟 0.5 秒）内的连续过载只收缩一次
+
+    concurrency.on_overload()
+
+    concurrency.on_overload()
+
+    assert concurrency.limit == limit / 2
+
+    # 窗口过后再次过载继续减半，但不低于下限
+
+    for _ in range(2):
+
+        time.sleep(0.5)
+
+        concurrency.on_overload()
+
+    assert concurrency.limit == concurrency.minimum == 1
+
+def test_retry_after_pauses_the_key(monkeypatch):
+
+    monkeypatch.setenv("LLD_RPM_DEEPSEEK", "6000")
+
+    limiter = ProviderRateLimiter("deepseek")
+
+    limiter.record_overload(retry_after=0.3)
+
+    assert limiter.snapshot()["paused_seconds"] > 0
+
+    started = time.monotonic()
+
+    limiter.acquire(10)
+
+    limiter.release()
+
+    assert time.monotonic() - started >= 0.25
+
+    assert limiter.backoff_delay(0, retry_after=120) == pipeline.BACKOFF_MAX_SECONDS
+
+def test_parse_retry_after():
+
+    assert parse_retry_after("2.5") == 2.5
+
+    assert parse_retry_after(None) is None and parse_retry_after("soon") is None
+
+    assert 25 < parse_retry_after(email.utils.formatdate(time.time() + 30, usegmt=True)) <= 30
+
+def test_rate_limited_requests_are_retried(mock_server):
+
+    # 一半请求返回 429（Retry-After 0.05 秒）：逐词判定全部成功，且限流收缩了并发上限
+
+    server = mock_server(rate_limit_rate=0.5, retry_after=0.05)
+
+    for word in ["跑", "飞", "走", "吃"]:
+
+        assert pipeline.classify_word_with_retries(word, "deepseek", "deepseek-chat", "key", max_retries=5)[0]
+
+    assert server.stats_snapshot()["rate_limited"] > 0
+
+    limiter = pipeline.get_rate_limiter("deepseek", pipeline.api_key_fingerprint("key"))
+
+    assert limiter.snapshot()["limit"] < pipeline.get_provider_concurrency("deepseek")
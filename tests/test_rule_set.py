@@ -0,0 +1,183 @@
+"""编译后的规则集：计分与改造前的逐键正则匹配一致，判定向量的编码、矩阵计分与规则集版本"""
+
+import copy
+
+import random
+
+import re
+
+import pytest
+
+from lld import core
+
+from lld.core import RULE_SETS, calculate_membership, get_rule_set, map_to_allowed_score, rule_code, scores_from_verdicts
+
+def legacy_normalize_key(k, pos_rules):
+
+    """改造前的规则名匹配：对每条规则重新执行正则"""
+
+    if not isinstance(k, str):
+
+        return None
+
+    k_norm = re.sub(r"[\s_]+", "", k).upper()
+
+    for r in pos_rules:
+
+        if re.sub(r"[\s_]+", "", r["name"]).upper() == k_norm:
+
+            return r["name"]
+
+    return None
+
+def legacy_membership(raw_scores):
+
+    """改造前的计分：逐键匹配规则名、线性查找规则定义、字典求和"""
+
+    scores_out = {pos: {} for pos in RULE_SETS}
+
+    for pos, rules in RULE_SETS.items():
+
+        for k, v in raw_scores.get(pos, {}).items():
+
+            name = legacy_normalize_key(k, rules)
+
+            if name:
+
+                rule_def = next(r for r in rules if r["name"] == name)
+
+                scores_out[pos][name] = map_to_allowed_score(rule_def, v)
+
+        for rule in rules:
+
+            scores_out[pos].setdefault(rule["name"], 0)
+
+    return calculate_membership(scores_out)
+
+VALUES = [True, False, "是", "否", "yes", "no", "符合", "不符合", 1, 0, 10, -20, "不确定", None]
+
+def random_verdicts(rng):
+
+    """随机的单词判定：键有原样、小写、加空格三种写法，部分规则缺失，取值含布尔、中英文与无法识别的值"""
+
+    raw = {}
+
+    for pos, rules in RULE_SETS.items():
+
+        raw[pos] = {}
+
+        for rule in rules:
+
+            if rng.random() < 0.15:
+
+                continue
+
+            key = rng.choice([rule["name"], rule["name"].lower(), rule["name"].replace("_", " ")])
+
+            raw[pos][key] = rng.choice(VALUES)
+
+        if rng.random() < 0.3:
+
+            raw[pos]["不存在的规则"] = True
+
+    return raw
+
+def test_scores_match_legacy_scorer():
+
+    rng = random.Random(0)
+
+    rule_set = get_rule_set()
+
+    for _ in range(500):
+
+        raw = random_verdicts(rng)
+
+        expected = legacy_membership(raw)
+
+        assert calculate_membership(scores_from_verdicts(raw)) == expected
+
+        assert rule_set.membership(rule_set.verdict_vector(raw)) == expected
+
+def test_membership_matrix_matches_per_word_membership():
+
+    np = pytest.importorskip("numpy")
+
+    rng = random.Random(1)
+
+    rule_set = get_rule_set()
+
+    vectors = [rule_set.verdict_vector(random_verdicts(rng)) for _ in range(200)]
+
+    matrix = rule_set.membership_matrix(vectors)
+
+    expected = np.asarray([[rule_set.membership(vector)[pos] for pos in rule_set.pos_names] for vector in vectors])
+
+    assert np.array_equal(matrix, expected)
+
+def test_rule_codes_only_with_codes():
+
+    rule_set = get_rule_set()
+
+    pos, rule = rule_set.rules[0]
+
+    raw = {pos: {rule_code(rule["name"]): True}}
+
+    assert rule_set.verdict_vector(raw)[0] == 0
+
+    assert rule_set.verdict_vector(raw, codes=True)[0] == 1
+
+def test_encode_decode_round_trip():
+
+    np = pytest.importorskip("numpy")
+
+    rng = random.Random(2)
+
+    rule_set = get_rule_set()
+
+    vectors = [[rng.choice([1, -1, 0]) for _ in range(len(rule_set))] for _ in range(50)]
+
+    texts = [rule_set.encode(vector) for vector in vectors]
+
+    assert [rule_set.decode(text) for text in texts] == vectors
+
+    matrix, valid = rule_set.verdict_matrix(texts + ["", "00000000:1:1"])
+
+    assert matrix[:len(vectors)].tolist() == vectors
+
+    assert valid.tolist() == [True] * len(vectors) + [False, False]
+
+    assert not np.any(matrix[len(vectors):])
+
+    assert rule_set.decode("00000000:1:1") is None
+
+@pytest.fixture
+
+def restore_rule_sets():
+
+    saved = copy.deepcopy(RULE_SETS)
+
+    yield
+
+    RULE_SETS.clear()
+
+    RULE_SETS.update(saved)
+
+    core.reload_rule_sets()
+
+def test_rule_set_version_is_cached_until_reload(restore_rule_sets):
+
+    version = core.rule_set_version()
+
+    assert version == core.rule_set_version(RULE_SETS)
+
+    RULE_SETS["名词"][0]["match_score"] += 5
+
+    # 未调用 reload_rule_sets 前仍为导入时计算的版本
+
+    assert core.rule_set_version() == version
+
+    assert core.reload_rule_sets() != version
+
+    assert core.rule_set_version() == core.rule_set_version(RULE_SETS)
+
+    assert get_rule_set().match_scores[0] == RULE_SETS["名词"][0]["match_score"]
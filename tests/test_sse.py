@@ -0,0 +1,143 @@
+"""SSE 增量解码：行结束符、任意切分与提供商分片适配；流式响应字节的读取（含 Content-Encoding 解压）"""
+
+import gzip
+
+import json
+
+import threading
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from lld.sse import SSEDecoder, dashscope_delta, iter_stream_deltas
+
+STREAM = (
+    ": keep-alive\n"
+    "event: update\n"
+    "id: 7\n"
+    "data: {\"a\": \"名词\"}\n"
+    "\n"
+    "data: first\n"
+    "data:second\n"
+    "\n"
+    "data: [DONE]\n"
+    "\n"
+)
+
+EXPECTED = [("update", "{\"a\": \"名词\"}", "7"), ("message", "first\nsecond", "7"), ("message", "[DONE]", "7")]
+
+def decode_all(chunks):
+
+    decoder = SSEDecoder()
+
+    events = [event for chunk in chunks for event in decoder.feed(chunk)] + decoder.close()
+
+    return [(event.event, event.data, event.id) for event in events]
+
+@pytest.mark.parametrize("newline", ["\n", "\r\n", "\r"])
+
+def test_line_endings(newline):
+
+    assert decode_all([STREAM.replace("\n", newline).encode("utf-8")]) == EXPECTED
+
+@pytest.mark.parametrize("newline", ["\n", "\r\n", "\r"])
+
+def test_every_split_point(newline):
+
+    # 在每个字节位置切成两段（包括 \r 与 \n 之间、汉字的多字节编码内部），结果与整段相同
+
+    raw = STREAM.replace("\n", newline).encode("utf-8")
+
+    for cut in range(1, len(raw)):
+
+        assert decode_all([raw[:cut], raw[cut:]]) == EXPECTED, cut
+
+def test_byte_by_byte():
+
+    raw = STREAM.replace("\n", "\r\n").encode("utf-8")
+
+    assert decode_all([raw[i:i + 1] for i in range(len(raw))]) == EXPECTED
+
+def test_close_dispatches_event_without_trailing_blank_line():
+
+    assert decode_all([b"data: {\"x\": 1}\n\ndata: tail"]) == [("message", "{\"x\": 1}", None), ("message", "tail", None)]
+
+def test_comment_only_stream_has_no_events():
+
+    assert decode_all([b": ping\n\n: ping\n\n"]) == []
+
+def test_iter_stream_deltas_skips_done_and_invalid_json():
+
+    body = (
+        'data: {"choices": [{"delta": {"content": "名"}}]}\n\n'
+        "data: not-json\n\n"
+        'data: {"choices": [{"delta": {"content": "词"}}], "usage": {"completion_tokens": 2}}\n\n'
+        "data: [DONE]\n\n"
+    ).encode("utf-8")
+
+    deltas = list(iter_stream_deltas([body[:30], body[30:31], body[31:]]))
+
+    assert [text for text, _ in deltas] == ["名", "词"]
+
+    assert deltas[-1][1] == {"completion_tokens": 2}
+
+def test_dashscope_delta():
+
+    assert dashscope_delta({"output": {"choices": [{"message": {"content": "名"}}]}, "usage": {"output_tokens": 1}}) == ("名", {"output_tokens": 1})
+
+    assert dashscope_delta({"output": {"text": "词"}}) == ("词", None)
+
+# ===============================
+# 流式响应字节（requests）
+# ===============================
+
+class _GzipSSEHandler(BaseHTTPRequestHandler):
+
+    body = b'data: {"x": 1}\n\n' * 3
+
+    def log_message(self, format, *args):
+
+        pass
+
+    def do_GET(self):
+
+        payload = gzip.compress(self.body)
+
+        self.send_response(200)
+
+        self.send_header("Content-Type", "text/event-stream")
+
+        self.send_header("Content-Encoding", "gzip")
+
+        self.send_header("Content-Length", str(len(payload)))
+
+        self.end_headers()
+
+        self.wfile.write(payload)
+
+def test_iter_response_bytes_decodes_gzip():
+
+    requests = pytest.importorskip("requests")
+
+    from lld.pipeline import iter_response_bytes
+
+    server = HTTPServer(("127.0.0.1", 0), _GzipSSEHandler)
+
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    try:
+
+        with requests.get(f"http://127.0.0.1:{server.server_port}/", stream=True, timeout=10) as response:
+
+            body = b"".join(iter_response_bytes(response))
+
+    finally:
+
+        server.shutdown()
+
+        server.server_close()
+
+    assert body == _GzipSSEHandler.body
+
+    assert [json.loads(event.raw) for event in SSEDecoder().feed(body)] == [{"x": 1}] * 3
@@ -0,0 +1,101 @@
+"""自适应超时与卡顿检测：超时按近期首字节延迟与分片间隔推算，输出过慢的流提前中止并重试"""
+
+import time
+
+from lld import pipeline
+
+MESSAGES = [{"role": "user", "content": "请判定词语「跑」"}]
+
+def test_timeouts_follow_recent_latency(monkeypatch):
+
+    monkeypatch.setenv("LLD_CONNECT_TIMEOUT_DEEPSEEK", "3.5")
+
+    health = pipeline.ProviderHealth("deepseek")
+
+    # 样本不足时使用默认读取超时
+
+    assert health.timeouts(4096) == (3.5, pipeline.DEFAULT_READ_TIMEOUT, pipeline.DEFAULT_READ_TIMEOUT)
+
+    for _ in range(pipeline.HEDGE_MIN_SAMPLES):
+
+        health.record(True, 8.0, 4096, first_byte=6.0, max_gap=0.1)
+
+    # 首字节 p99 的 3 倍；分片间隔很短时取下限；其他 max_tokens 的请求仍无样本
+
+    assert health.timeouts(4096) == (3.5, 6.0 * pipeline.TIMEOUT_MULTIPLIER, pipeline.MIN_CHUNK_TIMEOUT)
+
+    assert health.timeouts(1024)[1] == pipeline.DEFAULT_READ_TIMEOUT
+
+    # 上限为默认读取超时；失败的请求不计入样本
+
+    for _ in range(pipeline.HEDGE_MIN_SAMPLES):
+
+        health.record(True, 90.0, 1024, first_byte=80.0)
+
+        health.record(False, 1.0, 1024, first_byte=1.0)
+
+    assert health.timeouts(1024)[1] == pipeline.DEFAULT_READ_TIMEOUT
+
+def test_first_byte_timeout_is_learned(mock_server, response_cache, monkeypatch):
+
+    # 近期首字节延迟约 10 毫秒：学得的超时取下限 0.2 秒，1 秒后才响应的请求按超时中止
+
+    mock_server(latency=1.0)
+
+    monkeypatch.setattr(pipeline, "MIN_FIRST_BYTE_TIMEOUT", 0.2)
+
+    health = pipeline.get_provider_health("deepseek")
+
+    for _ in range(pipeline.HEDGE_MIN_SAMPLES):
+
+        health.record(True, 0.05, 4096, first_byte=0.01)
+
+    started = time.monotonic()
+
+    success, _, error = pipeline.call_llm_api_cached("deepseek", "deepseek-chat", "key", MESSAGES, max_retries=1, use_cache=False)
+
+    assert not success and "首字节超时" in error
+
+    assert time.monotonic() - started < 0.8
+
+def test_stalled_stream_is_aborted_and_retried(mock_server, response_cache, monkeypatch):
+
+    # 每秒 50 token 的流低于下限 1000 token/秒：宽限期过后中止，重试同样中止，两次都由客户端关闭连接
+
+    server = mock_server(tokens_per_second=50.0)
+
+    monkeypatch.setenv("LLD_MIN_TOKENS_PER_SECOND_DEEPSEEK", "1000")
+
+    monkeypatch.setattr(pipeline, "STALL_GRACE_SECONDS", 0.2)
+
+    monkeypatch.setattr(pipeline, "BACKOFF_BASE_SECONDS", 0.01)
+
+    retries = pipeline.LLM_RETRIES.labels("deepseek", "deepseek-chat", "stalled")
+
+    before = retries.value
+
+    success, _, error = pipeline.call_llm_api_cached("deepseek", "deepseek-chat", "key", MESSAGES, max_retries=2, use_cache=False)
+
+    assert not success and "流式输出过慢" in error
+
+    assert retries.value == before + 1
+
+    deadline = time.monotonic() + 5
+
+    while server.stats_snapshot().get("client_closed", 0) < 2 and time.monotonic() < deadline:
+
+        time.sleep(0.02)
+
+    stats = server.stats_snapshot()
+
+    assert stats["requests"] == 2 and stats.get("client_closed") == 2 and not stats.get("completed")
+
+def test_steady_stream_is_not_stalled(mock_server, response_cache, monkeypatch):
+
+    mock_server(tokens_per_second=20000.0)
+
+    monkeypatch.setattr(pipeline, "STALL_GRACE_SECONDS", 0.0)
+
+    success, response, _ = pipeline.call_llm_api_cached("deepseek", "deepseek-chat", "key", MESSAGES, max_retries=1, use_cache=False)
+
+    assert success and pipeline.extract_text_from_response(response)
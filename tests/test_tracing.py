@@ -0,0 +1,139 @@
+"""分阶段耗时追踪：阶段嵌套与跨线程归属、抽样关闭时的占位阶段、追踪文件的汇总与 Chrome trace 转换"""
+
+import json
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from lld import pipeline, tracing
+
+from lld.cli import EXIT_ERROR, EXIT_OK, main
+
+@pytest.fixture
+
+def trace_file(tmp_path):
+
+    """追踪写入临时文件且全部抽中；结束后恢复原配置"""
+
+    path, rate = tracing.TRACER.path, tracing.TRACER.sample_rate
+
+    tracing.configure(tmp_path / "trace.jsonl", 1.0)
+
+    yield tmp_path / "trace.jsonl"
+
+    tracing.configure(path, rate)
+
+def spans_by_name(path):
+
+    return {event["name"]: event for event in tracing.read_events(path) if event["ph"] == "X"}
+
+def test_disabled_tracing_is_a_noop(trace_file):
+
+    tracing.configure(None)
+
+    root = tracing.start_trace("classify_word", word="跑")
+
+    assert root is tracing.NOOP_SPAN and not root
+
+    with root:
+
+        assert tracing.span("prompt_build") is tracing.NOOP_SPAN
+
+        assert tracing.bind(len) is len
+
+    # 抽样比例为 0 时同样不记录，单次追踪可覆盖抽样比例
+
+    tracing.configure(trace_file, 0.0)
+
+    assert not tracing.start_trace("classify_batch")
+
+    assert tracing.start_trace("classify_word", sample_rate=1.0)
+
+def test_nested_spans_and_worker_threads(trace_file):
+
+    with tracing.start_trace("classify_batch", words=["跑", "飞"]) as root:
+
+        with tracing.span("prompt_build", chars=10):
+
+            pass
+
+        with ThreadPoolExecutor(1, thread_name_prefix="worker") as executor:
+
+            executor.submit(tracing.bind(lambda: tracing.span("http_request").finish(status=200), name="worker_call")).result()
+
+        with pytest.raises(KeyError):
+
+            with tracing.span("score"):
+
+                raise KeyError("动词")
+
+        assert tracing.current() is root
+
+    assert tracing.current() is None
+
+    spans = spans_by_name(trace_file)
+
+    assert set(spans) == {"classify_batch", "prompt_build", "worker_call", "http_request", "score"}
+
+    assert {event["args"]["trace_id"] for event in spans.values()} == {root.trace_id}
+
+    assert "parent_id" not in spans["classify_batch"]["args"] and spans["classify_batch"]["args"]["words"] == ["跑", "飞"]
+
+    # 工作线程中的阶段归入提交它的阶段之下
+
+    assert spans["worker_call"]["args"]["parent_id"] == root.span_id
+
+    assert spans["http_request"]["args"]["parent_id"] == spans["worker_call"]["args"]["span_id"]
+
+    assert spans["http_request"]["tid"] != spans["classify_batch"]["tid"] and spans["http_request"]["args"]["status"] == 200
+
+    assert spans["score"]["args"]["error"] == "KeyError" and spans["prompt_build"]["args"]["chars"] == 10
+
+    threads = [event["args"]["name"] for event in tracing.read_events(trace_file) if event["ph"] == "M"]
+
+    assert any(name.startswith("worker") for name in threads)
+
+def test_timed_accumulates_wait(trace_file):
+
+    root = tracing.start_trace("stream")
+
+    assert list(tracing.timed(iter(range(3)), root, "network_ms")) == [0, 1, 2]
+
+    assert root.attrs["network_ms"] >= 0
+
+    assert tracing.timed([1], tracing.NOOP_SPAN, "network_ms") == [1]
+
+def test_batch_trace_and_cli_summary(mock_server, response_cache, trace_file, tmp_path, capsys):
+
+    mock_server()
+
+    results = list(pipeline.run_batch_ordered(enumerate(["跑", "飞"]), "deepseek", "deepseek-chat", "key", batch_size=2))
+
+    assert all(result[0] for _, _, result in results)
+
+    tracing.TRACER.flush()
+
+    spans = spans_by_name(trace_file)
+
+    assert {"classify_batch", "rate_limit_wait", "http_request"} <= set(spans)
+
+    request = spans["http_request"]["args"]
+
+    assert request["outcome"] == "success" and request["network_ms"] >= 0 and "sse_parse_ms" in request
+
+    # 汇总与按词语筛选；另存的 Chrome trace 保留线程名等元数据事件
+
+    chrome = tmp_path / "trace.json"
+
+    assert main(["trace", str(trace_file), "--word", "飞", "--chrome", str(chrome)]) == EXIT_OK
+
+    output = capsys.readouterr()
+
+    assert "http_request" in output.out and "共 1 条追踪" in output.err
+
+    events = json.loads(chrome.read_text(encoding="utf-8"))["traceEvents"]
+
+    assert {event["ph"] for event in events} == {"X", "M"}
+
+    assert main(["trace", str(trace_file), "--word", "走"]) == EXIT_ERROR